@@ -4,78 +4,75 @@ Demonstrates advanced usage patterns and customizations
 """
 
 from leakproof_rag import LeakProofRAG
+from conversation_memory import ConversationMemory
+from metrics import QueryTrace
 import json
 from typing import List, Dict
 
+SUMMARY_PROMPT = """You maintain a running summary of a conversation about the KEITH LeakProof Drive.
+Merge the new exchanges into the summary. Keep the facts, numbers and specifications the user asked about,
+and what they seem to be working on. Be brief; drop small talk."""
+
 class AdvancedLeakProofRAG(LeakProofRAG):
     """Extended RAG system with additional features"""
     
-    def __init__(self, api_key: str = None):
-        super().__init__(api_key)
-        self.query_history = []
+    def __init__(self, api_key: str = None, memory: ConversationMemory = None, **kwargs):
+        super().__init__(api_key, **kwargs)
+        # Recent turns under a token budget; older ones are summarized in the background
+        self.memory = memory or ConversationMemory(summarize=self._summarize_turns)
     
-    def query_with_history(self, question: str, use_history: bool = True) -> Dict:
-        """Query with conversation history context"""
-        
-        # Retrieve relevant chunks as usual
-        relevant_chunks = self.retrieve_relevant_chunks(question, top_k=3)
-        
-        # Prepare context
-        context = "\n\n".join([
-            f"[Source {i+1}]:\n{chunk['chunk']['text']}"
-            for i, chunk in enumerate(relevant_chunks)
-        ])
-        
-        # Build conversation history
-        messages = [
-            {
-                "role": "system",
-                "content": """You are a technical expert assistant specializing in KEITH LeakProof Drive systems. 
-                Provide accurate, helpful information based on the technical documentation.
-                Reference previous questions in the conversation when relevant."""
-            }
-        ]
-        
-        # Add conversation history if enabled
-        if use_history and self.query_history:
-            for hist in self.query_history[-3:]:  # Last 3 exchanges
-                messages.append({"role": "user", "content": hist["question"]})
-                messages.append({"role": "assistant", "content": hist["answer"]})
-        
-        # Add current query with context
-        user_prompt = f"""Based on the following documentation about the KEITH LeakProof Drive, please answer the user's question.
-
-DOCUMENTATION:
-{context}
-
-USER QUESTION: {question}
-
-Please provide a clear, accurate answer based on the documentation above."""
-        
-        messages.append({"role": "user", "content": user_prompt})
-        
-        # Generate response
+    @property
+    def query_history(self) -> List[Dict]:
+        """Recent turns as compact records (question, answer, chunk_ids)"""
+        return self.memory.export()["turns"]
+    
+    def _summarize_turns(self, summary: str, turns: List[Dict]) -> str:
+        """Fold older exchanges into the running conversation summary with the chat model"""
+        transcript = "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
         response = self.client.chat.completions.create(
             model=self.chat_model,
-            messages=messages,
-            temperature=0.3,
-            max_tokens=800
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew exchanges:\n{transcript}"}
+            ],
+            temperature=0,
+            max_tokens=self.memory.max_summary_tokens
         )
+        return response.choices[0].message.content
+    
+    def query_with_history(self, question: str, use_history: bool = True) -> Dict:
+        """Query with conversation history context
+        
+        The prompt keeps the static prefix first, then the conversation
+        summary and recent turns, then the documentation and question. The
+        history counts against the context builder's max_prompt_tokens, so
+        the prompt stays within it however long the session runs.
+        """
+        trace = QueryTrace()
+        with trace.stage("retrieve"):
+            relevant_chunks = self.retrieve_relevant_chunks(question, top_k=3)
+        
+        with trace.stage("prompt"):
+            history = self.memory.messages() if use_history else []
+            messages = self._build_messages(question, relevant_chunks, trace, history=history)
         
+        with trace.stage("generate"):
+            response = self.client.chat.completions.create(
+                model=self.chat_model,
+                messages=messages,
+                **self.completion_options
+            )
+        trace.add_usage(getattr(response, "usage", None))
         answer = response.choices[0].message.content
         
-        # Store in history
-        self.query_history.append({
-            "question": question,
-            "answer": answer,
-            "sources": relevant_chunks
-        })
+        sources = self._context_sources(relevant_chunks, trace)
+        self.memory.add(question, answer, [item["chunk"]["id"] for item in sources])
         
-        return {
+        return self._finish_query({
             "question": question,
             "answer": answer,
             "sources": relevant_chunks
-        }
+        }, trace)
     
     def compare_specifications(self, spec1: str, spec2: str) -> str:
         """Compare two specifications or features"""
@@ -90,14 +87,28 @@ Please provide a clear, accurate answer based on the documentation above."""
         return result['answer']
     
     def export_conversation(self, filepath: str = "conversation_export.json"):
-        """Export the conversation history"""
+        """Export the conversation summary and recent turns"""
         with open(filepath, 'w') as f:
-            json.dump(self.query_history, f, indent=2)
+            json.dump(self.memory.export(), f, indent=2)
         print(f"Conversation exported to {filepath}")
     
     def get_all_performance_data(self) -> Dict:
-        """Extract all performance data in a structured format"""
+        """Extract all performance data in a structured format
+        
+        Served from the performance table built at index time; documents
+        without parseable performance chunks fall back to asking the LLM.
+        """
         query = "List all pump flow rates and their corresponding floor speeds and unloading times"
+        if self.performance_table:
+            return {
+                "question": query,
+                "answer": self.performance_table.summary(),
+                "sources": [{"chunk": chunk, "similarity": 1.0}
+                            for chunk in self.performance_table.chunks.values()],
+                "cached": False,
+                "structured": True,
+                "rows": self.performance_table.rows
+            }
         result = self.query(query, top_k=6)
         return result
 
@@ -188,6 +199,33 @@ def demo_structured_data_extraction():
     print("\n" + "=" * 60)
 
 
+def demo_batch_queries():
+    """Demonstrate answering many questions in one batch"""
+    print("\n" + "="*60)
+    print("DEMO: Batch Queries")
+    print("="*60 + "\n")
+    
+    rag = AdvancedLeakProofRAG()
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    
+    # One embedding request for all questions, completions run concurrently
+    questions = [
+        "What is the unloading time at 15 GPM?",
+        "What is the unloading time at 30 GPM?",
+        "What is the maximum working pressure?",
+        "What is the ponding ability?",
+    ]
+    
+    for result in rag.query_batch(questions):
+        print(f"Q: {result['question']}")
+        if result['error']:
+            print(f"Error: {result['error']}\n")
+        else:
+            print(f"A: {result['answer']}\n")
+    print("-" * 60 + "\n")
+
+
 def demo_export_conversation():
     """Demonstrate conversation export"""
     print("\n" + "="*60)
@@ -222,6 +260,7 @@ if __name__ == "__main__":
         ("Use Case Analysis", demo_use_case_analysis),
         ("Structured Data Extraction", demo_structured_data_extraction),
         ("Conversation Export", demo_export_conversation),
+        ("Batch Queries", demo_batch_queries),
     ]
     
     print("Available demos:")
@@ -0,0 +1,175 @@
+"""
+Approximate Nearest-Neighbour Search for LeakProof RAG
+IVF (inverted file) index built with spherical k-means in NumPy
+
+Rows are partitioned into nlist clusters. A query is scored against the
+centroids first and only the rows in the nprobe closest clusters are scored
+exactly, so query cost grows with n / nlist * nprobe instead of n.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from vectors import top_k_indices
+
+# Rows scored per matrix product while assigning, bounds temporary memory
+_BLOCK_ROWS = 65536
+
+
+class IVFIndex:
+    """Inverted-file ANN index over a matrix of L2-normalized rows
+
+    Tuning knobs:
+        nlist   - number of clusters (default ~sqrt(n)); more clusters make
+                  each probe cheaper but need a higher nprobe for recall
+        nprobe  - clusters scanned per query; higher means better recall
+                  and slower queries
+    """
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8,
+                 n_iter: int = 20, max_train_rows: int = 256, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        # Training sample per cluster; k-means on a sample is enough for centroids
+        self.max_train_rows = max_train_rows
+        self.seed = seed
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.list_rows = np.zeros(0, dtype=np.int64)
+
+    @property
+    def size(self) -> int:
+        """Number of rows assigned to the index"""
+        return len(self.list_rows)
+
+    def _nearest_centroids(self, embeddings: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), _BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + _BLOCK_ROWS], dtype=np.float32)
+            labels[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def build(self, embeddings: np.ndarray) -> "IVFIndex":
+        """Train centroids with spherical k-means and assign every row"""
+        n = len(embeddings)
+        if n == 0:
+            raise ValueError("Cannot build an ANN index over an empty index")
+        nlist = min(self.nlist or max(1, int(round(np.sqrt(n)))), n)
+        self.nlist = nlist
+        rng = np.random.default_rng(self.seed)
+
+        train_size = min(n, nlist * self.max_train_rows)
+        sample_rows = np.sort(rng.choice(n, size=train_size, replace=False))
+        train = np.asarray(embeddings[sample_rows], dtype=np.float32)
+
+        self.centroids = train[rng.choice(train_size, size=nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = np.argmax(train @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, train)
+            counts = np.bincount(labels, minlength=nlist)
+
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters from random training rows
+                sums[empty] = train[rng.choice(train_size, size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            new_centroids = sums / norms
+            converged = np.allclose(new_centroids, self.centroids, atol=1e-6)
+            self.centroids = new_centroids.astype(np.float32)
+            if converged:
+                break
+
+        self.assign(embeddings)
+        return self
+
+    def assign(self, embeddings: np.ndarray):
+        """Rebuild the inverted lists for embeddings using the trained centroids
+
+        Used after incremental index updates, where retraining is unnecessary.
+        """
+        labels = self._nearest_centroids(embeddings)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=len(self.centroids))
+        self.list_rows = order.astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def add(self, embeddings: np.ndarray, start: int):
+        """Assign new rows start, start + 1, ... to their nearest trained centroid
+
+        Only the new rows are scored; the inverted lists are merged with
+        integer moves, without touching the existing rows' vectors.
+        """
+        labels = self._nearest_centroids(embeddings)
+        old_counts = np.diff(self.list_offsets)
+        new_counts = np.bincount(labels, minlength=len(self.centroids))
+        offsets = np.concatenate([[0], np.cumsum(old_counts + new_counts)]).astype(np.int64)
+
+        list_rows = np.empty(offsets[-1], dtype=np.int64)
+        old_labels = np.repeat(np.arange(len(old_counts)), old_counts)
+        list_rows[offsets[old_labels] + np.arange(len(old_labels)) - self.list_offsets[old_labels]] = self.list_rows
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        new_starts = np.concatenate([[0], np.cumsum(new_counts)])[:-1]
+        positions = offsets[sorted_labels] + old_counts[sorted_labels] + np.arange(len(order)) - new_starts[sorted_labels]
+        list_rows[positions] = start + order
+        self.list_rows = list_rows
+        self.list_offsets = offsets
+
+    def remove(self, rows: Sequence[int]):
+        """Drop rows from the inverted lists"""
+        keep = ~np.isin(self.list_rows, np.asarray(rows, dtype=np.int64))
+        labels = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))
+        counts = np.bincount(labels[keep], minlength=len(self.centroids))
+        self.list_rows = self.list_rows[keep]
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def search(self, embeddings: np.ndarray, query: np.ndarray, top_k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, scores) of the approximate top_k rows for a query"""
+        probes = top_k_indices(self.centroids @ query, nprobe or self.nprobe)
+        candidates = np.concatenate([
+            self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probes
+        ])
+        candidates.sort()  # Sequential access keeps memory-mapped reads local
+        scores = np.asarray(embeddings[candidates], dtype=np.float32) @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def save(self, path: str):
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_rows=self.list_rows, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            index = cls(nlist=len(data["centroids"]), nprobe=int(data["nprobe"]))
+            index.centroids = data["centroids"]
+            index.list_offsets = data["list_offsets"]
+            index.list_rows = data["list_rows"]
+        return index
+
+
+def recall_at_k(embeddings: np.ndarray, index: IVFIndex, queries: Sequence[np.ndarray],
+                k: int = 10, nprobe: Optional[int] = None) -> float:
+    """Fraction of the exact top-k rows that the ANN search also returns"""
+    found = 0
+    total = 0
+    for query in queries:
+        exact = set(top_k_indices(np.asarray(embeddings @ query, dtype=np.float32), k).tolist())
+        approx = set(index.search(embeddings, query, k, nprobe=nprobe)[0].tolist())
+        found += len(exact & approx)
+        total += len(exact)
+    return found / total if total else 1.0
+
+
+def sample_queries(embeddings: np.ndarray, count: int = 100, noise: float = 0.5, seed: int = 0) -> np.ndarray:
+    """Perturbed copies of random rows, used as synthetic queries for recall checks"""
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(embeddings[rng.choice(len(embeddings), size=min(count, len(embeddings)), replace=False)],
+                      dtype=np.float32)
+    queries = rows + rng.normal(scale=noise / np.sqrt(rows.shape[1]), size=rows.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
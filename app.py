@@ -6,6 +6,8 @@ Built with Streamlit for a polished, user-friendly interface
 import streamlit as st
 import os
 from leakproof_rag import LeakProofRAG
+from engine import get_engine
+from metrics import InMemoryMetrics
 from dotenv import load_dotenv
 import time
 
@@ -112,32 +114,28 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
-if 'rag' not in st.session_state:
-    st.session_state.rag = None
-if 'initialized' not in st.session_state:
-    st.session_state.initialized = False
+# Initialize session state (only small per-user data; the index is shared)
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'total_queries' not in st.session_state:
     st.session_state.total_queries = 0
 
+@st.cache_resource(show_spinner="🔧 Loading the LeakProof index...")
+def get_rag() -> LeakProofRAG:
+    """Process-wide RAG engine, built once and shared read-only by all sessions"""
+    return get_engine()
+
 def initialize_rag():
-    """Initialize the RAG system"""
+    """Warm up the shared RAG engine; returns it, or None if loading failed"""
     try:
-        with st.spinner("🔧 Initializing RAG system..."):
-            rag = LeakProofRAG()
-            rag.load_document("leakproof_drive.pdf")
-            
-        with st.spinner("🧠 Creating embeddings (this may take a moment)..."):
-            rag.create_embeddings()
-            
-        st.session_state.rag = rag
-        st.session_state.initialized = True
-        return True
+        return get_rag()
     except Exception as e:
+        # Failures are not cached, so the next rerun tries again
         st.error(f"❌ Error initializing system: {str(e)}")
-        return False
+        return None
+
+# Load at startup instead of waiting for a button click
+rag = initialize_rag()
 
 def format_answer(answer_text):
     """Format the answer for better display"""
@@ -163,7 +161,7 @@ with st.sidebar:
     st.markdown("---")
     
     # System status
-    if st.session_state.initialized:
+    if rag is not None:
         st.success("✅ System Ready")
         
         # Statistics
@@ -173,12 +171,24 @@ with st.sidebar:
             st.metric("Total Queries", st.session_state.total_queries)
         with col2:
             st.metric("History", len(st.session_state.chat_history))
+        
+        # Latency over every session sharing the engine
+        metrics = getattr(rag, "metrics", None)
+        latency = metrics.percentiles("total") if isinstance(metrics, InMemoryMetrics) else {}
+        if latency:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("p50 Latency", f"{latency['p50'] * 1000:.0f} ms")
+            with col2:
+                st.metric("p95 Latency", f"{latency['p95'] * 1000:.0f} ms")
+            first_token = metrics.percentiles("first_token")
+            if first_token:
+                st.caption(f"First token: p50 {first_token['p50'] * 1000:.0f} ms, "
+                           f"p95 {first_token['p95'] * 1000:.0f} ms")
     else:
         st.warning("⚠️ System Not Initialized")
-        if st.button("🚀 Initialize System", use_container_width=True):
-            if initialize_rag():
-                st.success("✅ System initialized successfully!")
-                st.rerun()
+        if st.button("🔄 Retry", use_container_width=True):
+            st.rerun()
     
     st.markdown("---")
     
@@ -222,8 +232,8 @@ st.title("🚛 LeakProof Drive Technical Assistant")
 st.markdown("Ask me anything about the KEITH LeakProof Drive system!")
 
 # Check if system is initialized
-if not st.session_state.initialized:
-    st.info("👈 Please initialize the system using the sidebar button to get started.")
+if rag is None:
+    st.info("👈 The system could not be loaded. Check your API key, then retry from the sidebar.")
     
     # Show feature overview
     col1, col2, col3 = st.columns(3)
@@ -280,38 +290,28 @@ else:
     if search_button and query:
         st.session_state.total_queries += 1
         
-        with st.spinner("🤔 Thinking..."):
-            try:
-                # Get the answer
-                result = st.session_state.rag.query(query, top_k=top_k, show_sources=False)
-                
-                # Add to history
-                st.session_state.chat_history.insert(0, {
-                    'query': query,
-                    'answer': result['answer'],
-                    'sources': result['sources'],
-                    'timestamp': time.strftime("%Y-%m-%d %H:%M:%S")
-                })
-                
-                # Display current result
-                st.markdown(f"""
-                <div class="query-box">
-                    <strong>❓ Your Question:</strong><br>
-                    {query}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown(f"""
-                <div class="answer-box">
-                    <strong>💡 Answer:</strong><br><br>
-                    {format_answer(result['answer'])}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Show sources if enabled
-                if show_sources and result['sources']:
+        try:
+            # Display current question
+            st.markdown(f"""
+            <div class="query-box">
+                <strong>❓ Your Question:</strong><br>
+                {query}
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Keep the answer above the sources, although the sources arrive first
+            answer_area = st.container()
+            sources_area = st.container()
+            
+            with st.spinner("🤔 Thinking..."):
+                stream = rag.query_stream(query, top_k=top_k)
+                sources = next(stream)
+            
+            # Show sources if enabled
+            if show_sources and sources:
+                with sources_area:
                     with st.expander("📚 View Sources", expanded=False):
-                        for i, source in enumerate(result['sources'], 1):
+                        for i, source in enumerate(sources, 1):
                             similarity = source['similarity']
                             chunk_data = source['chunk']
                             
@@ -322,9 +322,30 @@ else:
                                 {chunk_data['text'][:300]}...
                             </div>
                             """, unsafe_allow_html=True)
-                
-            except Exception as e:
-                st.error(f"❌ Error processing query: {str(e)}")
+            
+            # Stream the answer token by token into the styled answer box
+            with answer_area:
+                answer_box = st.empty()
+                answer = ""
+                for piece in stream:
+                    answer += piece
+                    answer_box.markdown(f"""
+                    <div class="answer-box">
+                        <strong>💡 Answer:</strong><br><br>
+                        {format_answer(answer)}
+                    </div>
+                    """, unsafe_allow_html=True)
+            
+            # Add to history
+            st.session_state.chat_history.insert(0, {
+                'query': query,
+                'answer': answer,
+                'sources': sources,
+                'timestamp': time.strftime("%Y-%m-%d %H:%M:%S")
+            })
+            
+        except Exception as e:
+            st.error(f"❌ Error processing query: {str(e)}")
     
     # Display chat history
     if st.session_state.chat_history:
@@ -5,7 +5,7 @@ A polished, modern interface for querying technical documentation
 
 import gradio as gr
 import os
-from leakproof_rag import LeakProofRAG
+from engine import get_engine
 from dotenv import load_dotenv
 import time
 
@@ -20,10 +20,7 @@ def initialize_system():
     """Initialize the RAG system"""
     global rag_system
     try:
-        rag = LeakProofRAG()
-        rag.load_document("leakproof_drive.pdf")
-        rag.create_embeddings()
-        rag_system = rag
+        rag_system = get_engine()
         return "✅ System initialized successfully! You can now ask questions."
     except Exception as e:
         return f"❌ Error: {str(e)}"
@@ -47,34 +44,38 @@ def format_sources(sources):
     return formatted
 
 def query_system(question, num_sources, show_sources):
-    """Query the RAG system"""
+    """Query the RAG system, streaming the answer as it is generated"""
     global rag_system, query_count
     
     if rag_system is None:
-        return "⚠️ Please initialize the system first using the 'Initialize System' button.", "", 0
+        yield "⚠️ Please initialize the system first using the 'Initialize System' button.", "", 0
+        return
     
     if not question.strip():
-        return "⚠️ Please enter a question.", "", query_count
+        yield "⚠️ Please enter a question.", "", query_count
+        return
     
     try:
         # Increment query counter
         query_count += 1
         
-        # Get answer
-        result = rag_system.query(question, top_k=num_sources, show_sources=False)
-        
-        # Format answer
-        answer = f"## 💡 Answer:\n\n{result['answer']}"
+        # Sources come first, then the answer piece by piece
+        stream = rag_system.query_stream(question, top_k=num_sources)
+        sources = next(stream)
         
         # Format sources
         sources_text = ""
         if show_sources:
-            sources_text = format_sources(result['sources'])
+            sources_text = format_sources(sources)
         
-        return answer, sources_text, query_count
+        answer = ""
+        yield "## 💡 Answer:\n\n", sources_text, query_count
+        for piece in stream:
+            answer += piece
+            yield f"## 💡 Answer:\n\n{answer}", sources_text, query_count
         
     except Exception as e:
-        return f"❌ Error: {str(e)}", "", query_count
+        yield f"❌ Error: {str(e)}", "", query_count
 
 def use_example(example):
     """Use an example question"""
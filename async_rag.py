@@ -0,0 +1,203 @@
+"""
+Async LeakProof RAG
+Concurrent query handling on AsyncOpenAI, so one process can serve many
+users without a worker blocking for each embed + chat round trip
+"""
+
+import asyncio
+from typing import AsyncIterator, Dict, List, Union
+
+import numpy as np
+from openai import AsyncOpenAI
+
+from leakproof_rag import LeakProofRAG
+from metrics import QueryTrace
+from vectors import normalize_rows
+
+# Above this many rows, similarity scoring runs in a worker thread so the
+# event loop keeps serving other requests (NumPy releases the GIL)
+OFFLOAD_SCORING_ROWS = 50_000
+
+
+class AsyncLeakProofRAG(LeakProofRAG):
+    """LeakProofRAG with async query methods
+
+    Indexing (load_document, create_embeddings, load_index) stays
+    synchronous and shares the same in-memory index. Every async upstream call
+    goes through a single AsyncOpenAI client, so its HTTP connection pool is
+    reused across queries, and a semaphore caps the number of requests in
+    flight at max_concurrency.
+    """
+
+    def __init__(self, api_key: str = None, client=None, async_client=None,
+                 max_concurrency: int = 32, **kwargs):
+        super().__init__(api_key=api_key, client=client, **kwargs)
+        self.async_client = async_client or AsyncOpenAI(api_key=self.api_key)
+        self.max_concurrency = max_concurrency
+        self._limiter = None
+
+    @property
+    def limiter(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the loop that actually runs the queries
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_concurrency)
+        return self._limiter
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Async version of embed_query, sharing the same query cache"""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(self._embedding_key, query)
+            if cached is not None:
+                return cached
+
+        async with self.limiter:
+            query_response = await self.async_client.embeddings.create(
+                input=[query],
+                model=self.embedding_model,
+                **self._embedding_options()
+            )
+        query_embedding = normalize_rows([query_response.data[0].embedding])[0]
+
+        if self.query_cache is not None:
+            self.query_cache.put(self._embedding_key, query, query_embedding)
+        return query_embedding
+
+    async def _aembed_for_retrieval(self, query: str):
+        """Async version of _embed_for_retrieval"""
+        if self._lexical_only():
+            return None
+        timeout = self._fallback_timeout()
+        try:
+            return await asyncio.wait_for(self.aembed_query(query), timeout)
+        except Exception as e:
+            self._fall_back_to_keywords(e)
+            return None
+
+    async def _aretrieve(self, query: str, query_embedding, top_k: int, filters=None) -> List[Dict]:
+        if len(self.embeddings) > OFFLOAD_SCORING_ROWS:
+            return await asyncio.to_thread(self._retrieve, query, query_embedding, top_k, filters)
+        return self._retrieve(query, query_embedding, top_k, filters)
+
+    async def aretrieve_relevant_chunks(self, query: str, top_k: int = 3, filters=None) -> List[Dict]:
+        """Async version of retrieve_relevant_chunks"""
+        if len(self.embeddings) == 0:
+            return []
+        return await self._aretrieve(query, await self._aembed_for_retrieval(query), top_k, filters)
+
+    async def agenerate_response(self, query: str, relevant_chunks: List[Dict],
+                                 trace: QueryTrace = None) -> str:
+        """Async version of generate_response"""
+        trace = trace if trace is not None else QueryTrace()
+        with trace.stage("prompt"):
+            messages = self._build_messages(query, relevant_chunks, trace)
+        async with self.limiter:
+            with trace.stage("generate"):
+                response = await self.async_client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=messages,
+                    **self.completion_options
+                )
+        trace.add_usage(getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    async def agenerate_response_stream(self, query: str, relevant_chunks: List[Dict],
+                                        trace: QueryTrace = None) -> AsyncIterator[str]:
+        """Async version of generate_response_stream"""
+        trace = trace if trace is not None else QueryTrace()
+        with trace.stage("prompt"):
+            messages = self._build_messages(query, relevant_chunks, trace)
+        async for piece in self._astream_completion(messages, trace):
+            yield piece
+
+    async def _astream_completion(self, messages: List[Dict], trace: QueryTrace) -> AsyncIterator[str]:
+        # The slot is held for the whole stream since the connection stays busy
+        async with self.limiter:
+            with trace.stage("generate"):
+                stream = await self.async_client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self.completion_options
+                )
+                async for chunk in stream:
+                    trace.add_usage(getattr(chunk, "usage", None))
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        trace.mark("first_token")
+                        yield chunk.choices[0].delta.content
+
+    async def aquery(self, question: str, top_k: int = 3, filters=None) -> Dict:
+        """Async version of query; returns the same result dict"""
+        trace = QueryTrace()
+        result = self._structured_answer(question, filters)
+        if result is not None:
+            trace.outcome = "structured"
+            return self._finish_query(result, trace)
+
+        with trace.stage("embed"):
+            query_embedding = await self._aembed_for_retrieval(question)
+        with trace.stage("retrieve"):
+            relevant_chunks = await self._aretrieve(question, query_embedding, top_k, filters)
+
+        answer = self._cached_answer(query_embedding, relevant_chunks)
+        cached = answer is not None
+        if cached:
+            trace.outcome = "cached"
+            self._pack_context(question, relevant_chunks, trace)
+        else:
+            answer = await self.agenerate_response(question, relevant_chunks, trace=trace)
+            self._store_answer(query_embedding, relevant_chunks, answer)
+
+        return self._finish_query({
+            "question": question,
+            "answer": answer,
+            "sources": relevant_chunks,
+            "cached": cached,
+            "structured": False
+        }, trace)
+
+    async def aquery_stream(self, question: str, top_k: int = 3,
+                            filters=None) -> AsyncIterator[Union[List[Dict], str]]:
+        """Async version of query_stream: the sources first, then answer text pieces"""
+        trace = QueryTrace()
+        result = self._structured_answer(question, filters)
+        if result is not None:
+            trace.outcome = "structured"
+            yield result["sources"]
+            yield result["answer"]
+            self._finish_query(result, trace)
+            return
+
+        with trace.stage("embed"):
+            query_embedding = await self._aembed_for_retrieval(question)
+        with trace.stage("retrieve"):
+            relevant_chunks = await self._aretrieve(question, query_embedding, top_k, filters)
+
+        answer = self._cached_answer(query_embedding, relevant_chunks)
+        if answer is not None:
+            trace.outcome = "cached"
+            self._pack_context(question, relevant_chunks, trace)
+            yield self._context_sources(relevant_chunks, trace)
+            yield answer
+            self._finish_query({}, trace)
+            return
+
+        with trace.stage("prompt"):
+            messages = self._build_messages(question, relevant_chunks, trace)
+        yield self._context_sources(relevant_chunks, trace)
+        pieces = []
+        async for piece in self._astream_completion(messages, trace):
+            pieces.append(piece)
+            yield piece
+        self._store_answer(query_embedding, relevant_chunks, "".join(pieces))
+        self._finish_query({}, trace)
+
+    async def aclose(self):
+        """Close the pooled HTTP connections of the async client"""
+        await self.async_client.close()
+
+    async def __aenter__(self) -> "AsyncLeakProofRAG":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
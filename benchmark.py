@@ -0,0 +1,478 @@
+"""
+Benchmarks for LeakProof RAG
+Run against a local fake OpenAI server, so no API key or network is needed
+
+Usage:
+    python benchmark.py suite --sizes 1k,10k,100k --output results.json
+    python benchmark.py compare baseline.json results.json
+    python benchmark.py async --queries 200 --concurrency 32 --latency 0.05
+    python benchmark.py stream --queries 10 --latency 0.3 --token-latency 0.02
+    python benchmark.py load --url http://127.0.0.1:8000 --requests 500 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from openai import AsyncOpenAI, OpenAI
+
+from async_rag import AsyncLeakProofRAG
+from fake_openai import FakeOpenAI, FakeOpenAIServer
+from leakproof_rag import LeakProofRAG
+from metrics import InMemoryMetrics
+from rag_client import RAGServiceClient
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# A typical answer length, so generation time is realistic in the streaming benchmark
+LONG_ANSWER = " ".join(
+    "The LeakProof Drive unloads a 45-foot trailer in about five minutes at 25 GPM."
+    .split() * 12
+)
+
+EXAMPLE_QUESTIONS = [
+    "What is the unloading time for a 45-foot trailer at 25 gallons per minute?",
+    "What types of waste is the LeakProof Drive designed for?",
+    "What are the key features of the hydraulic cylinder design?",
+    "What is the maximum working pressure?",
+    "How do I contact KEITH Manufacturing in Europe?",
+]
+
+
+# Vocabulary of the synthetic corpus: domain words plus generated filler
+# words, so chunks share terms the way real documents do
+DOMAIN_WORDS = (
+    "trailer floor speed unloading pump flow gallons minute hydraulic cylinder "
+    "valve pressure drive piston rod seal leak liquid waste silage compactor "
+    "maintenance aluminum corrosion bore stroke capacity switching pilot barrel"
+).split()
+SYNTHETIC_SECTIONS = ["overview", "features", "specifications", "performance", "maintenance", "contact"]
+
+
+def synthetic_chunks(count: int, seed: int = 0, words_per_chunk: int = 60,
+                     vocabulary_size: int = 5000) -> Iterator[Dict]:
+    """Generate a reproducible corpus of count chunks with metadata
+
+    Word frequencies follow a Zipf-like distribution, like real text.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(DOMAIN_WORDS + [f"term{i}" for i in range(vocabulary_size - len(DOMAIN_WORDS))])
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    block = 10_000
+    for start in range(0, count, block):
+        size = min(block, count - start)
+        words = vocabulary[rng.choice(len(vocabulary), size=(size, words_per_chunk), p=weights)]
+        sections = rng.integers(len(SYNTHETIC_SECTIONS), size=size)
+        for offset in range(size):
+            i = start + offset
+            yield {
+                "id": f"chunk_{i}",
+                "text": " ".join(words[offset]),
+                "metadata": {"section": SYNTHETIC_SECTIONS[sections[offset]], "type": "synthetic",
+                             "source": f"doc_{i // 100}.pdf", "page": i % 100 // 4 + 1},
+            }
+
+
+def synthetic_questions(count: int, seed: int = 1, words: int = 8) -> List[str]:
+    """Questions drawn from the synthetic vocabulary, all distinct"""
+    chunks = synthetic_chunks(count, seed=seed, words_per_chunk=words)
+    return [f"What about {chunk['text']}? (#{i})" for i, chunk in zip(range(count), chunks)]
+
+
+class SyntheticRAG(LeakProofRAG):
+    """LeakProofRAG that indexes a generated corpus instead of PDFs"""
+
+    def __init__(self, corpus_size: int, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.corpus_size = corpus_size
+        self.seed = seed
+
+    def _iter_document_chunks(self, pdf_path: str):
+        return synthetic_chunks(self.corpus_size, self.seed)
+
+
+def parse_size(value: str) -> int:
+    """Parse corpus sizes like 1000, 10k or 1m"""
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux only, else None)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _latency_summary(seconds: Sequence[float]) -> Dict:
+    milliseconds = np.array(seconds) * 1000
+    return {
+        "mean": round(float(milliseconds.mean()), 3),
+        **{f"p{q}": round(float(np.percentile(milliseconds, q)), 3) for q in (50, 95, 99)},
+    }
+
+
+def environment() -> Dict:
+    """Where a result was measured, to tell apart runs that are not comparable"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=Path(__file__).parent, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def benchmark_corpus(size: int, dimensions: int = 256, queries: int = 200, top_k: int = 3,
+                     latency: float = 0.0, error_rate: float = 0.0, mode: str = "hybrid",
+                     seed: int = 0) -> Dict:
+    """Index, save, load and query one synthetic corpus against the in-process fake
+
+    Retrieval latency is measured on pre-embedded questions, so it covers
+    scoring, keyword search and fusion only. The query figures are end to
+    end: query embedding, retrieval and chat completion, with `latency`
+    seconds per upstream call and `error_rate` of the calls failing.
+    """
+    def make_rag(cls=LeakProofRAG, **kwargs):
+        client = FakeOpenAI(dimensions=dimensions, latency=latency, error_rate=error_rate, seed=seed)
+        rag = cls(client=client, **kwargs)
+        rag.retrieval_mode = mode
+        rag.structured_answers = False
+        rag.ingestion_options = {"initial_backoff": 0.01, "max_backoff": 0.2, "max_retries": 10,
+                                 "on_progress": lambda done, total: None}
+        return rag
+
+    result = {"chunks": size}
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        index_path = str(Path(directory) / "index")
+
+        builder = make_rag(SyntheticRAG, corpus_size=size, seed=seed)
+        start = time.perf_counter()
+        builder.index_documents("synthetic", buffer_size=4096)
+        build_seconds = time.perf_counter() - start
+        result["build"] = {"seconds": round(build_seconds, 3),
+                           "chunks_per_s": round(size / build_seconds, 1),
+                           "rss_mb": current_rss_mb()}
+
+        start = time.perf_counter()
+        builder.save_index(index_path)
+        result["save"] = {"seconds": round(time.perf_counter() - start, 3),
+                          "bytes": sum(f.stat().st_size for f in Path(index_path).iterdir())}
+        del builder
+        gc.collect()
+
+        rag = make_rag()
+        start = time.perf_counter()
+        rag.load_index(index_path)
+        result["load"] = {"seconds": round(time.perf_counter() - start, 3), "rss_mb": current_rss_mb()}
+
+        questions = synthetic_questions(queries, seed=seed + 1)
+        rag.embed_queries(questions)  # Warm the query cache: retrieval only below
+        timings = []
+        for question in questions:
+            start = time.perf_counter()
+            rag.retrieve_relevant_chunks(question, top_k=top_k)
+            timings.append(time.perf_counter() - start)
+        result["retrieval_ms"] = _latency_summary(timings)
+        result["retrieval_qps"] = round(len(timings) / sum(timings), 1)
+
+        rag.metrics = InMemoryMetrics()
+        errors = 0
+        start = time.perf_counter()
+        for question in synthetic_questions(queries, seed=seed + 2):
+            try:
+                rag.query(question, top_k=top_k, show_sources=False)
+            except Exception:
+                errors += 1
+        elapsed = time.perf_counter() - start
+        result["query"] = {
+            "qps": round(queries / elapsed, 1),
+            "errors": errors,
+            "stages_ms": {
+                stage: {key: round(value * 1000, 3) if key != "count" else value for key, value in stats.items()}
+                for stage, stats in rag.metrics.summary().items()
+            },
+        }
+        result["peak_rss_mb"] = peak_rss_mb()
+        del rag
+        gc.collect()
+    return result
+
+
+def benchmark_suite(sizes: Sequence[int] = (1_000, 10_000, 100_000), dimensions: int = 256,
+                    queries: int = 200, top_k: int = 3, latency: float = 0.0,
+                    error_rate: float = 0.0, mode: str = "hybrid", seed: int = 0,
+                    on_result=None) -> Dict:
+    """Run benchmark_corpus for each corpus size, smallest first
+
+    peak_rss_mb is the process-wide peak so far, so it is only meaningful
+    for the largest corpus reached; run one size per process for exact
+    per-size peaks.
+    """
+    settings = {"dimensions": dimensions, "queries": queries, "top_k": top_k, "latency_s": latency,
+                "error_rate": error_rate, "mode": mode, "seed": seed}
+    runs = []
+    for size in sorted(sizes):
+        runs.append(benchmark_corpus(size, dimensions, queries, top_k, latency, error_rate, mode, seed))
+        if on_result:
+            on_result(runs[-1])
+    return {"benchmark": "suite", "environment": environment(), "settings": settings, "runs": runs}
+
+
+def _flatten(values: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare_results(baseline: Dict, candidate: Dict) -> List[Dict]:
+    """Per corpus size and metric, the change from a baseline suite result to a candidate"""
+    rows = []
+    baseline_runs = {run["chunks"]: run for run in baseline["runs"]}
+    for run in candidate["runs"]:
+        if run["chunks"] not in baseline_runs:
+            continue
+        before = _flatten(baseline_runs[run["chunks"]])
+        for metric, value in _flatten(run).items():
+            if metric == "chunks" or metric not in before:
+                continue
+            old = before[metric]
+            rows.append({
+                "chunks": run["chunks"],
+                "metric": metric,
+                "baseline": old,
+                "candidate": value,
+                "change_pct": round(100 * (value - old) / old, 1) if old else None,
+            })
+    return rows
+
+
+def benchmark_async(queries: int = 200, concurrency: int = 32, latency: float = 0.05) -> Dict:
+    """Compare sequential LeakProofRAG.query with concurrent AsyncLeakProofRAG.aquery
+
+    Every question is unique so neither the query nor the answer cache can
+    short-circuit the upstream calls.
+    """
+    questions = [f"{EXAMPLE_QUESTIONS[i % len(EXAMPLE_QUESTIONS)]} (#{i})" for i in range(queries)]
+
+    with FakeOpenAIServer(latency=latency) as server:
+        client = OpenAI(api_key="sk-fake", base_url=server.base_url)
+        rag = LeakProofRAG(client=client)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rag.load_document("leakproof_drive.pdf")
+            rag.create_embeddings()
+
+            start = time.perf_counter()
+            for question in questions:
+                rag.query(question, show_sources=False)
+            sync_seconds = time.perf_counter() - start
+
+        async def run_concurrent() -> float:
+            async_client = AsyncOpenAI(api_key="sk-fake", base_url=server.base_url)
+            async with AsyncLeakProofRAG(client=client, async_client=async_client,
+                                         max_concurrency=concurrency) as arag:
+                arag.chunks, arag.embeddings = rag.chunks, rag.embeddings
+                start = time.perf_counter()
+                await asyncio.gather(*(arag.aquery(question) for question in questions))
+                return time.perf_counter() - start
+
+        async_seconds = asyncio.run(run_concurrent())
+
+    return {
+        "queries": queries,
+        "concurrency": concurrency,
+        "upstream_latency_s": latency,
+        "sync_seconds": round(sync_seconds, 3),
+        "sync_qps": round(queries / sync_seconds, 1),
+        "async_seconds": round(async_seconds, 3),
+        "async_qps": round(queries / async_seconds, 1),
+        "speedup": round(sync_seconds / async_seconds, 1),
+    }
+
+
+def benchmark_streaming(queries: int = 10, latency: float = 0.3, token_latency: float = 0.02) -> Dict:
+    """Time to first answer token with query_stream versus the full wait of query"""
+    questions = [f"{EXAMPLE_QUESTIONS[i % len(EXAMPLE_QUESTIONS)]} (#{i})" for i in range(queries)]
+    first_token, full_answer = [], []
+
+    with FakeOpenAIServer(answer=LONG_ANSWER, latency=latency, token_latency=token_latency) as server:
+        rag = LeakProofRAG(client=OpenAI(api_key="sk-fake", base_url=server.base_url))
+        with contextlib.redirect_stdout(io.StringIO()):
+            rag.load_document("leakproof_drive.pdf")
+            rag.create_embeddings()
+
+            for question in questions:
+                start = time.perf_counter()
+                rag.query(question, show_sources=False)
+                full_answer.append(time.perf_counter() - start)
+
+        for question in questions:
+            start = time.perf_counter()
+            stream = rag.query_stream(question + " (streamed)")
+            next(stream)  # Sources
+            next(stream)
+            first_token.append(time.perf_counter() - start)
+            for _ in stream:
+                pass
+
+    return {
+        "queries": queries,
+        "upstream_latency_s": latency,
+        "token_latency_s": token_latency,
+        "blocking_answer_ms": round(1000 * sum(full_answer) / queries, 1),
+        "streamed_first_token_ms": round(1000 * sum(first_token) / queries, 1),
+    }
+
+
+def benchmark_service(url: str, requests: int = 500, concurrency: int = 32,
+                      endpoint: str = "query") -> Dict:
+    """Load-test a running rag_service with concurrent clients
+
+    Start the service against a fake backend first, e.g.
+        python fake_openai.py serve --latency 0.2 &
+        OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-fake python rag_service.py --workers 4
+    """
+    client = RAGServiceClient(url)
+    client.health()
+    questions = [f"{EXAMPLE_QUESTIONS[i % len(EXAMPLE_QUESTIONS)]} (#{i})" for i in range(requests)]
+
+    def call(question: str):
+        start = time.perf_counter()
+        try:
+            if endpoint == "retrieve":
+                client.retrieve_relevant_chunks(question)
+            else:
+                client.query(question)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, questions))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in outcomes]) * 1000
+    return {
+        "url": url,
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, error in outcomes if error),
+        "qps": round(requests / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LeakProof RAG benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    async_parser = subparsers.add_parser("async", help="Sequential sync vs concurrent async queries")
+    async_parser.add_argument("--queries", type=int, default=200)
+    async_parser.add_argument("--concurrency", type=int, default=32)
+    async_parser.add_argument("--latency", type=float, default=0.05, help="Fake upstream latency in seconds")
+
+    stream_parser = subparsers.add_parser("stream", help="Time to first token, streamed vs blocking")
+    stream_parser.add_argument("--queries", type=int, default=10)
+    stream_parser.add_argument("--latency", type=float, default=0.3, help="Fake time to first token in seconds")
+    stream_parser.add_argument("--token-latency", type=float, default=0.02, help="Fake delay between tokens")
+
+    suite_parser = subparsers.add_parser("suite", help="Index, load and query synthetic corpora")
+    suite_parser.add_argument("--sizes", default="1k,10k,100k", help="Comma-separated corpus sizes, up to 1m")
+    suite_parser.add_argument("--dimensions", type=int, default=256, help="Fake embedding dimensions")
+    suite_parser.add_argument("--queries", type=int, default=200)
+    suite_parser.add_argument("--top-k", type=int, default=3)
+    suite_parser.add_argument("--latency", type=float, default=0.0, help="Fake upstream latency in seconds")
+    suite_parser.add_argument("--error-rate", type=float, default=0.0,
+                              help="Fraction of upstream calls failing with 429/503")
+    suite_parser.add_argument("--mode", default="hybrid", choices=["hybrid", "vector", "lexical"])
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--output", default="benchmark_results.json")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two suite result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    load_parser = subparsers.add_parser("load", help="Load-test a running rag_service")
+    load_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    load_parser.add_argument("--requests", type=int, default=500)
+    load_parser.add_argument("--concurrency", type=int, default=32)
+    load_parser.add_argument("--endpoint", default="query", choices=["query", "retrieve"])
+
+    args = parser.parse_args()
+    if args.command == "suite":
+        sizes = [parse_size(size) for size in args.sizes.split(",")]
+        result = benchmark_suite(
+            sizes, args.dimensions, args.queries, args.top_k, args.latency, args.error_rate,
+            args.mode, args.seed,
+            on_result=lambda run: print(f"{run['chunks']:>9,} chunks: build {run['build']['seconds']}s, "
+                                        f"load {run['load']['seconds']}s, "
+                                        f"retrieval p50 {run['retrieval_ms']['p50']}ms", file=sys.stderr),
+        )
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        for row in compare_results(baseline, candidate):
+            change = "n/a" if row["change_pct"] is None else f"{row['change_pct']:+.1f}%"
+            print(f"{row['chunks']:>9,}  {row['metric']:<40} {row['baseline']:>12} -> "
+                  f"{row['candidate']:>12}  {change}")
+        return
+    elif args.command == "async":
+        result = benchmark_async(args.queries, args.concurrency, args.latency)
+    elif args.command == "stream":
+        result = benchmark_streaming(args.queries, args.latency, args.token_latency)
+    elif args.command == "load":
+        result = benchmark_service(args.url, args.requests, args.concurrency, args.endpoint)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
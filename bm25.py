@@ -0,0 +1,179 @@
+"""
+BM25 Keyword Index for LeakProof RAG
+In-process inverted index for exact spec lookups ("80 mm", "3000 PSI",
+contact emails) that embeddings tend to rank poorly, and for retrieval
+without any network call when the embedding API is unavailable
+"""
+
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from vectors import append_rows, top_k_indices
+
+# Words and numbers are separate tokens, so "80mm" and "80 mm" both match
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+# Thousands separators inside numbers ("3,000 PSI" -> "3000 psi")
+THOUSANDS_SEPARATOR = re.compile(r"(?<=\d),(?=\d{3}\b)")
+# Question words and articles would otherwise reorder the weak matches
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its "
+    "me my of on or so that the their there this to was what when where which "
+    "who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word and number tokens of a text, without stop words"""
+    tokens = TOKEN_PATTERN.findall(THOUSANDS_SEPARATOR.sub("", text.lower()))
+    return [token for token in tokens if token not in STOP_WORDS]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> Dict[int, float]:
+    """Fuse ranked row lists into {row: score}, summing 1 / (k + rank) per list"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+class BM25Index:
+    """Okapi BM25 over a list of texts, stored as an inverted index
+
+    Each term maps to the rows containing it and the term's frequency in
+    each row, so scoring a query only touches the postings of its own terms.
+    Weights are computed from the postings at query time, which lets rows be
+    added and removed without reweighting the whole index.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # Rows addressed by the index (removed rows keep their number)
+        self.size = 0
+        # Rows currently indexed, and their total token count
+        self.count = 0
+        self._total_length = 0.0
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._lengths_buffer = None
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def build(self, texts: Sequence[str]) -> "BM25Index":
+        """Index texts; row i of the index is texts[i]"""
+        self.size = self.count = 0
+        self._total_length = 0.0
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._lengths_buffer = None
+        self._postings = {}
+        return self.add(texts)
+
+    @staticmethod
+    def _term_counts(text: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        return counts
+
+    def add(self, texts: Sequence[str]) -> "BM25Index":
+        """Index texts as the next rows, touching only the postings of their terms"""
+        term_rows: Dict[str, List[int]] = {}
+        term_freqs: Dict[str, List[int]] = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for offset, text in enumerate(texts):
+            counts = self._term_counts(text)
+            lengths[offset] = sum(counts.values())
+            for term, count in counts.items():
+                term_rows.setdefault(term, []).append(self.size + offset)
+                term_freqs.setdefault(term, []).append(count)
+
+        for term, rows in term_rows.items():
+            rows = np.array(rows, dtype=np.int64)
+            tf = np.array(term_freqs[term], dtype=np.float32)
+            posting = self._postings.get(term)
+            if posting is not None:
+                rows, tf = np.concatenate([posting[0], rows]), np.concatenate([posting[1], tf])
+            self._postings[term] = (rows, tf)
+        self._lengths, self._lengths_buffer = append_rows(self._lengths, self._lengths_buffer, lengths)
+        self.size += len(texts)
+        self.count += len(texts)
+        self._total_length += float(lengths.sum())
+        return self
+
+    def remove(self, rows: Sequence[int], texts: Sequence[str]):
+        """Drop rows (with their texts, to find their terms) from the postings"""
+        removed: Dict[str, List[int]] = {}
+        for row, text in zip(rows, texts):
+            for term in self._term_counts(text):
+                removed.setdefault(term, []).append(row)
+            self._total_length -= float(self._lengths[row])
+        for term, term_rows in removed.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            keep = ~np.isin(posting[0], term_rows)
+            if keep.any():
+                self._postings[term] = (posting[0][keep], posting[1][keep])
+            else:
+                del self._postings[term]
+        self.count -= len(rows)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for a query (zero for rows without any term)"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        avg_length = self._total_length / self.count if self.count and self._total_length > 0 else 1.0
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is not None:
+                rows, tf = posting
+                df = len(rows)
+                idf = np.log(1.0 + (self.count - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[rows] / avg_length)
+                scores[rows] += (idf * tf * (self.k1 + 1.0) / (tf + norm)).astype(np.float32)
+        return scores
+
+    def search(self, query: str, top_k: int, rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, scores) of the best matching rows, best first
+
+        Rows that share no term with the query are never returned. If rows is
+        given, only those rows are candidates.
+        """
+        scores = self.scores(query)
+        if rows is not None:
+            candidate_scores = scores[rows]
+            best = top_k_indices(candidate_scores, top_k)
+            best = best[candidate_scores[best] > 0]
+            return rows[best], candidate_scores[best]
+        best = top_k_indices(scores, top_k)
+        best = best[scores[best] > 0]
+        return best, scores[best]
+
+    def save(self, path: str):
+        """Write the postings as one CSR block: terms, offsets, rows and frequencies"""
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self._postings[term][0]) for term in terms], out=offsets[1:])
+        rows = [self._postings[term][0] for term in terms]
+        tf = [self._postings[term][1] for term in terms]
+        np.savez(path, terms=np.array(terms, dtype=str), offsets=offsets,
+                 rows=np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+                 tf=np.concatenate(tf) if tf else np.zeros(0, dtype=np.float32),
+                 lengths=self._lengths, params=np.array([self.k1, self.b, self._total_length]),
+                 counts=np.array([self.size, self.count]))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load postings written by save(); each term's posting is a view into the CSR arrays"""
+        with np.load(path) as data:
+            k1, b, total_length = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            index.size, index.count = (int(n) for n in data["counts"])
+            index._total_length = total_length
+            index._lengths = data["lengths"]
+            offsets, rows, tf = data["offsets"], data["rows"], data["tf"]
+            terms = data["terms"].tolist()
+        bounds = offsets.tolist()
+        index._postings = {term: (rows[bounds[i]:bounds[i + 1]], tf[bounds[i]:bounds[i + 1]])
+                           for i, term in enumerate(terms)}
+        return index
@@ -0,0 +1,307 @@
+"""
+Caching for LeakProof RAG
+Disk-backed embedding cache keyed by embedding model and chunk content, an
+in-memory LRU cache of query embeddings keyed by normalized question text,
+and a semantic answer cache in front of the chat completion
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = ".leakproof_cache/embeddings.sqlite3"
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """Content address of an embedding: hash of the model name and exact text"""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding store with size-based LRU eviction
+
+    Vectors are stored as raw float32 blobs in a single SQLite file. Every hit
+    refreshes the entry's last-used time, and when the total size exceeds
+    max_bytes the least recently used entries are evicted first.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up embeddings for texts; missing entries come back as None"""
+        keys = [embedding_cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+        results = [
+            np.frombuffer(found[key], dtype=np.float32) if key in found else None
+            for key in keys
+        ]
+        hits = sum(1 for vector in results if vector is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Store embeddings for texts, then evict down to max_bytes"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((embedding_cache_key(model, text), blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        to_delete = []
+        for key, nbytes in self._conn.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= nbytes
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a question: lowercase, single spaces, no trailing punctuation"""
+    return " ".join(text.lower().split()).rstrip("?!. ")
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU map with optional TTL and hit/miss counters"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    """Query vectors keyed by embedding model and normalized question text
+
+    Lookups hit the in-memory LRU first. If a disk_cache (EmbeddingCache) is
+    given, misses fall through to it, so repeated questions also survive a
+    restart.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 24 * 3600,
+                 disk_cache: Optional[EmbeddingCache] = None):
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.disk_cache = disk_cache
+
+    def get(self, model: str, question: str) -> Optional[np.ndarray]:
+        key = (model, normalize_query(question))
+        vector = self.memory.get(key)
+        if vector is None and self.disk_cache is not None:
+            vector = self.disk_cache.get_many(model, [key[1]])[0]
+            if vector is not None:
+                self.memory.put(key, vector)
+        return vector
+
+    def put(self, model: str, question: str, vector: np.ndarray):
+        key = (model, normalize_query(question))
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)  # Shared between callers, so never mutated
+        self.memory.put(key, vector)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(model, [key[1]], [vector])
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return self.memory.stats
+
+
+class SemanticAnswerCache:
+    """Generated answers reused for semantically equivalent questions
+
+    A cached answer is returned when the new query embedding is within
+    `threshold` cosine similarity of a cached query AND retrieval picked the
+    same chunk ids in the same order, so "unloading time at 25 GPM?" and
+    "unload time @ 25 gpm" share an answer while the 30 GPM question does
+    not. Entries are evicted in LRU order and all of them are dropped when
+    the index version changes.
+    """
+
+    def __init__(self, max_size: int = 256, threshold: float = 0.95):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._reset(index_version=None)
+
+    def _reset(self, index_version: Hashable):
+        self._index_version = index_version
+        # Query vectors live in one preallocated matrix; entries map slot -> data
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[int, Tuple[Tuple[str, ...], str]]" = OrderedDict()
+        self._free_slots = list(range(self.max_size - 1, -1, -1))
+
+    def _check_version(self, index_version: Hashable):
+        if index_version != self._index_version:
+            self._reset(index_version)
+
+    def lookup(self, query_embedding: np.ndarray, chunk_ids: Sequence[str],
+               index_version: Hashable) -> Optional[str]:
+        """Return a cached answer for an equivalent question, or None"""
+        chunk_ids = tuple(chunk_ids)
+        with self._lock:
+            self._check_version(index_version)
+            if self._entries:
+                slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+                similarities = self._vectors[slots] @ query_embedding
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    slot = int(slots[i])
+                    cached_ids, answer = self._entries[slot]
+                    if cached_ids == chunk_ids:
+                        self._entries.move_to_end(slot)
+                        self.hits += 1
+                        return answer
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding: np.ndarray, chunk_ids: Sequence[str], answer: str,
+              index_version: Hashable):
+        with self._lock:
+            self._check_version(index_version)
+            if self._vectors is None or self._vectors.shape[1] != len(query_embedding):
+                self._reset(index_version)
+                self._vectors = np.zeros((self.max_size, len(query_embedding)), dtype=np.float32)
+
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            self._vectors[slot] = query_embedding
+            self._entries[slot] = (tuple(chunk_ids), answer)
+
+    def invalidate(self):
+        with self._lock:
+            self._reset(self._index_version)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,134 @@
+"""
+Context Assembly for LeakProof RAG
+Packs retrieved chunks into the prompt under a token budget: best-scored
+chunks first, near-duplicates dropped, and a chunk that would overflow the
+budget truncated (or skipped if too little room is left)
+
+Packed chunks are laid out in chunk ID order, whatever their scores, so
+the same chunks always give the same bytes. Token counts of chunk texts and
+of the fixed prompt (system prompt and template) are memoized, so only the
+question is tokenized on every query.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Sequence
+
+from tokenizer import count_tokens, count_tokens_cached, is_estimated, truncate_to_tokens
+
+# Words per shingle when comparing chunk texts for near-duplicates
+SHINGLE_SIZE = 3
+# Separator tokens between two packed chunks ("\n\n")
+SEPARATOR_TOKENS = 1
+
+
+@lru_cache(maxsize=4096)
+def _shingles(text: str) -> FrozenSet:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return frozenset(words)
+    return frozenset(zip(*(words[i:] for i in range(SHINGLE_SIZE))))
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the word shingles of two texts"""
+    a, b = _shingles(a), _shingles(b)
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+def format_source(chunk_id: str, text: str) -> str:
+    return f"[Source: {chunk_id}]\n{text}"
+
+
+def corpus_preamble(chunks: Sequence[Dict], max_documents: int = 50) -> str:
+    """Stable description of the indexed documents and their sections, sorted by name
+
+    It only changes when documents or sections are added or removed, so it
+    can sit in the cacheable prompt prefix.
+    """
+    sections: Dict[str, set] = {}
+    for chunk in chunks:
+        metadata = chunk.get("metadata", {})
+        names = sections.setdefault(str(metadata.get("source", "LeakProof Drive brochure")), set())
+        if metadata.get("section"):
+            names.add(str(metadata["section"]))
+
+    lines = ["The documentation covers:"]
+    for source in sorted(sections)[:max_documents]:
+        names = ", ".join(sorted(sections[source]))
+        lines.append(f"- {source}" + (f" (sections: {names})" if names else ""))
+    if len(sections) > max_documents:
+        lines.append(f"- and {len(sections) - max_documents} more documents")
+    return "\n".join(lines)
+
+
+class ContextBuilder:
+    """Builds the DOCUMENTATION section of the prompt within max_prompt_tokens
+
+    max_prompt_tokens bounds the whole prompt: the fixed prompt and question
+    are counted first and the chunks get what is left. Chunks at least
+    duplicate_threshold similar to a better-scored chunk are removed. A chunk
+    that does not fit is truncated if min_truncated_tokens or more are left,
+    otherwise skipped in favour of smaller, lower-scored chunks.
+    """
+
+    def __init__(self, max_prompt_tokens: int = 4000, duplicate_threshold: float = 0.8,
+                 min_truncated_tokens: int = 64):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def build(self, relevant_chunks: Sequence[Dict], question: str = "",
+              fixed_prompt: Sequence[str] = (), model: str = "gpt-4o-mini") -> Dict:
+        """Pack retrieved chunks; returns the context text and what was left out
+
+        Keys: "context", "context_tokens", "tokens_saved" (against packing
+        every chunk whole), "chunks" (the retrieval results used, by score),
+        "duplicates", "dropped" and "truncated" (chunk IDs), and "estimated"
+        (True when tokens were estimated from characters, without tiktoken).
+        """
+        ranked = sorted(relevant_chunks, key=lambda item: item.get("score", item["similarity"]), reverse=True)
+
+        fixed = sum(count_tokens_cached(text, model) for text in fixed_prompt)
+        budget = max(0, self.max_prompt_tokens - fixed - count_tokens(question, model))
+
+        pieces, used, kept, duplicates, dropped, truncated = [], [], [], [], [], []
+        full_tokens = 0
+        tokens = 0
+        for item in ranked:
+            chunk_id, text = item["chunk"]["id"], item["chunk"]["text"]
+            piece = format_source(chunk_id, text)
+            piece_tokens = count_tokens_cached(piece, model)
+            full_tokens += piece_tokens + (SEPARATOR_TOKENS if full_tokens else 0)
+
+            if any(similarity(text, other) >= self.duplicate_threshold for other in kept):
+                duplicates.append(chunk_id)
+                continue
+            separator = SEPARATOR_TOKENS if pieces else 0
+            if tokens + separator + piece_tokens > budget:
+                header = count_tokens_cached(format_source(chunk_id, ""), model)
+                room = budget - tokens - separator - header
+                if room < self.min_truncated_tokens:
+                    dropped.append(chunk_id)
+                    continue
+                piece = format_source(chunk_id, truncate_to_tokens(text, room, model))
+                piece_tokens = count_tokens(piece, model)
+                truncated.append(chunk_id)
+
+            pieces.append((chunk_id, piece))
+            used.append(item)
+            kept.append(text)
+            tokens += separator + piece_tokens
+
+        return {
+            "context": "\n\n".join(piece for _, piece in sorted(pieces)),
+            "context_tokens": tokens,
+            "tokens_saved": full_tokens - tokens,
+            "estimated": is_estimated(model),
+            "chunks": used,
+            "duplicates": duplicates,
+            "dropped": dropped,
+            "truncated": truncated,
+        }
@@ -0,0 +1,169 @@
+"""
+Conversation Memory for LeakProof RAG
+Bounded chat history: recent turns are kept verbatim under a token budget
+and older turns are folded into a running summary on a background thread,
+so long sessions keep constant memory and prompt size
+
+Turns are compact records ({"question", "answer", "chunk_ids", "tokens"});
+retrieved chunks are referenced by ID rather than copied.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from tokenizer import count_tokens, truncate_to_tokens
+
+# summarize(previous_summary, turns) -> new summary
+Summarizer = Callable[[str, List[Dict]], str]
+
+
+def extractive_summary(summary: str, turns: Sequence[Dict]) -> str:
+    """Summary without a model call: the questions asked and the start of each answer"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        if turn.get("merged"):
+            lines.append(turn["answer"])
+            continue
+        answer = turn["answer"].strip().split("\n")[0]
+        lines.append(f"- Asked: {turn['question']} Answer: {answer}")
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """Recent turns within max_history_tokens plus a summary within max_summary_tokens
+
+    When a new turn pushes the recent turns over budget, the oldest move to
+    a pending queue that a single background worker folds into the summary
+    with `summarize` (extractive_summary if None or if it raises). Each turn
+    is summarized exactly once, so the work per turn stays constant. If the
+    worker falls more than max_pending_turns behind, the oldest pending
+    turns are condensed extractively into one record, in order, to keep
+    memory bounded. Until their summary is stored, turns that left the
+    recent window are replayed as an extractive note, so no turn is ever
+    missing from the prompt.
+    """
+
+    def __init__(self, summarize: Optional[Summarizer] = None, max_history_tokens: int = 1000,
+                 max_summary_tokens: int = 300, max_pending_turns: int = 16,
+                 model: str = "gpt-4o-mini", background: bool = True):
+        self.summarize = summarize
+        self.max_history_tokens = max_history_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.max_pending_turns = max_pending_turns
+        self.model = model
+        self.summary = ""
+        self.turns: List[Dict] = []
+        self._pending: List[Dict] = []
+        # Turns the worker is summarizing right now
+        self._folding: List[Dict] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._job = None
+        self._scheduled = False
+
+    @property
+    def history_tokens(self) -> int:
+        """Tokens held by the recent turns"""
+        with self._lock:
+            return sum(turn["tokens"] for turn in self.turns)
+
+    def add(self, question: str, answer: str, chunk_ids: Sequence[str] = ()) -> Dict:
+        """Record a turn, moving the oldest turns to the summary if over budget"""
+        answer = truncate_to_tokens(answer, self.max_history_tokens // 2, self.model)
+        turn = {
+            "question": question,
+            "answer": answer,
+            "chunk_ids": list(chunk_ids),
+            "tokens": count_tokens(question, self.model) + count_tokens(answer, self.model),
+        }
+        with self._lock:
+            self.turns.append(turn)
+            total = sum(t["tokens"] for t in self.turns)
+            while len(self.turns) > 1 and total > self.max_history_tokens:
+                total -= self.turns[0]["tokens"]
+                self._pending.append(self.turns.pop(0))
+            if len(self._pending) > self.max_pending_turns:
+                overflow = len(self._pending) - self.max_pending_turns + 1
+                notes = self._fit(extractive_summary("", self._pending[:overflow]))
+                self._pending[:overflow] = [{"question": "Earlier exchanges (condensed)", "answer": notes,
+                                             "chunk_ids": [], "tokens": count_tokens(notes, self.model),
+                                             "merged": True}]
+            start = bool(self._pending) and not self._scheduled
+            self._scheduled |= start
+        if start and self._executor is None:
+            self._fold_pending()
+        elif start:
+            self._job = self._executor.submit(self._fold_pending)
+        return turn
+
+    def _fold_pending(self):
+        """Summarize pending turns until none are left (runs on the worker thread)"""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._scheduled = False
+                    return
+                turns, self._pending = self._pending, []
+                self._folding = turns
+                summary = self.summary
+            try:
+                new_summary = (self.summarize or extractive_summary)(summary, turns)
+            except Exception as e:
+                print(f"⚠️ Conversation summary failed ({e}), keeping an extractive summary")
+                new_summary = extractive_summary(summary, turns)
+            with self._lock:
+                self.summary = self._fit(new_summary)
+                self._folding = []
+
+    def _fit(self, summary: str) -> str:
+        """Keep the most recent part of a summary that fits max_summary_tokens"""
+        if count_tokens(summary, self.model) <= self.max_summary_tokens:
+            return summary
+        lines = summary.split("\n")
+        while len(lines) > 1 and count_tokens("\n".join(lines), self.model) > self.max_summary_tokens:
+            lines.pop(0)
+        return truncate_to_tokens("\n".join(lines), self.max_summary_tokens, self.model)
+
+    def wait(self):
+        """Block until background summarization has caught up"""
+        job = self._job
+        if job is not None:
+            job.result()
+
+    def messages(self) -> List[Dict]:
+        """Chat messages replaying the conversation: the summary, then the recent turns
+        
+        Turns waiting for (or in) the summarizer are added to the summary
+        extractively, within max_summary_tokens.
+        """
+        with self._lock:
+            summary, turns = self.summary, list(self.turns)
+            unsummarized = self._folding + self._pending
+        if unsummarized:
+            summary = self._fit(extractive_summary(summary, unsummarized))
+        messages = []
+        if summary:
+            messages.append({"role": "system",
+                             "content": f"Summary of the earlier conversation (refer to it when relevant):\n{summary}"})
+        for turn in turns:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        return messages
+
+    def export(self) -> Dict:
+        """The summary and recent turns as plain JSON-serializable data"""
+        self.wait()
+        with self._lock:
+            return {"summary": self.summary, "turns": [dict(turn) for turn in self.turns]}
+
+    def clear(self):
+        self.wait()
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+            self._pending = []
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,67 @@
+"""
+Shared RAG Engine
+One process-wide LeakProofRAG, loaded once and shared read-only by every
+UI session, so memory does not grow with the number of users. When
+RAG_SERVICE_URL is set the engine is a thin client of rag_service instead.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import index_store
+from caching import EmbeddingCache, QueryEmbeddingCache, SemanticAnswerCache
+from leakproof_rag import LeakProofRAG
+from metrics import InMemoryMetrics
+from rag_client import RAGServiceClient
+
+DEFAULT_DOCUMENT = "leakproof_drive.pdf"
+
+_engine = None
+_lock = threading.Lock()
+
+
+def build_engine(document_path: str = None, index_path: str = None, client=None,
+                 engine_class=LeakProofRAG) -> LeakProofRAG:
+    """Build a ready-to-query engine
+
+    If index_path (or LEAKPROOF_INDEX) names a saved binary index it is
+    memory-mapped; otherwise the document is parsed and embedded, with the
+    embedding cache making every build after the first one free.
+    LEAKPROOF_EMBEDDING_DIMENSIONS requests shortened embeddings. Query
+    timings are collected in a metrics.InMemoryMetrics.
+    """
+    document_path = document_path or os.getenv("LEAKPROOF_DOCUMENT", DEFAULT_DOCUMENT)
+    index_path = index_path or os.getenv("LEAKPROOF_INDEX")
+
+    cache = EmbeddingCache()
+    rag = engine_class(client=client, embedding_cache=cache,
+                       query_cache=QueryEmbeddingCache(disk_cache=cache),
+                       answer_cache=SemanticAnswerCache())
+    rag.metrics = InMemoryMetrics()
+    dimensions = os.getenv("LEAKPROOF_EMBEDDING_DIMENSIONS")
+    if dimensions:
+        rag.embedding_dimensions = int(dimensions)
+    if index_path and (Path(index_path) / index_store.HEADER_FILE).exists():
+        rag.load_index(index_path)
+    else:
+        rag.load_document(document_path)
+        rag.create_embeddings()
+    return rag
+
+
+def get_engine() -> LeakProofRAG:
+    """Return the process-wide engine, building it on first use
+
+    Concurrent first calls block on a lock so the index is only built once.
+    The engine is shared, so callers must only query it, never re-index.
+    With RAG_SERVICE_URL set this is a RAGServiceClient, which offers the
+    same query, query_stream and retrieve_relevant_chunks methods.
+    """
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                service_url = os.getenv("RAG_SERVICE_URL")
+                _engine = RAGServiceClient(service_url) if service_url else build_engine()
+    return _engine
@@ -0,0 +1,495 @@
+"""
+Fake OpenAI Client for Offline Testing
+Deterministic stand-ins for the embeddings and chat completion endpoints
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+
+# Function words carry no topic signal and would dominate short queries
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its me of on "
+    "or the this to what when which with".split()
+)
+
+
+def fake_embedding(text: str, dimensions: int = 1536) -> List[float]:
+    """Hash the words of a text into a deterministic unit vector
+
+    Texts that share words get similar vectors, which keeps retrieval
+    results meaningful without calling the real API.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in STOP_WORDS:
+            continue
+        index, sign = _token_slot(token, dimensions)
+        vector[index] += sign
+
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+@lru_cache(maxsize=65536)
+def _token_slot(token: str, dimensions: int):
+    """Dimension and sign a word adds to, memoized for large synthetic corpora"""
+    digest = hashlib.md5(token.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little") % dimensions, 1.0 if digest[4] & 1 else -1.0
+
+
+class FakeAPIError(Exception):
+    """Error carrying an HTTP status code like openai.APIStatusError"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeTimeoutError(TimeoutError):
+    """Raised like openai.APITimeoutError when a request outlasts its timeout"""
+
+
+class _RandomErrors:
+    """Fails a seeded, reproducible fraction of requests with 429 or 503"""
+
+    def __init__(self, error_rate: float = 0.0, seed: int = 0):
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_status(self):
+        """Status code of the error to return for the next request, or None"""
+        if not self.error_rate:
+            return None
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return None
+            return 429 if self._random.random() < 0.5 else 503
+
+    def check(self):
+        status = self.next_status()
+        if status is not None:
+            raise FakeAPIError("Rate limit reached for requests" if status == 429
+                               else "The server is overloaded", status_code=status)
+
+
+def _to_namespace(value):
+    """Turn a JSON-style payload into attribute access like the SDK's models"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(v) for v in value]
+    return value
+
+
+def shorten_embedding(vector: List[float], dimensions: int) -> List[float]:
+    """Keep the leading dimensions and renormalize, like the API's dimensions parameter"""
+    prefix = np.asarray(vector[:dimensions], dtype=np.float32)
+    norm = np.linalg.norm(prefix)
+    return (prefix / norm if norm else prefix).tolist()
+
+
+def embedding_payload(texts: List[str], model: str, dimensions: int = 1536,
+                      requested_dimensions: int = None) -> dict:
+    """Response body of POST /v1/embeddings
+
+    requested_dimensions is the request's optional dimensions parameter;
+    vectors are then shortened from the full size.
+    """
+    tokens = sum(len(text.split()) for text in texts)
+    vectors = [fake_embedding(text, dimensions) for text in texts]
+    if requested_dimensions:
+        vectors = [shorten_embedding(vector, requested_dimensions) for vector in vectors]
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": vector}
+            for i, vector in enumerate(vectors)
+        ],
+        "model": model,
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def chat_usage(messages: List[dict], answer: str, cached_tokens: int = 0) -> dict:
+    """Token usage of a completion, counting words as tokens"""
+    prompt_tokens = sum(len(m["content"].split()) for m in messages)
+    completion_tokens = len(answer.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+class FakePromptCache:
+    """Simulates the provider's automatic prompt caching
+
+    Like the real API, prompts of at least min_tokens reuse the longest
+    prefix already seen, in steps of increment tokens (words here).
+    """
+
+    def __init__(self, min_tokens: int = 1024, increment: int = 128):
+        self.min_tokens = min_tokens
+        self.increment = increment
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, messages: List[dict]) -> int:
+        """Cached tokens for a prompt; its own prefixes are cached for later prompts"""
+        words = [word for message in messages for word in message["content"].split()]
+        if len(words) < self.min_tokens:
+            return 0
+        digest = hashlib.sha256()
+        cached = 0
+        start = 0
+        matching = True
+        with self._lock:
+            for boundary in range(self.min_tokens, len(words) + 1, self.increment):
+                digest.update(" ".join(words[start:boundary]).encode("utf-8") + b"\0")
+                start = boundary
+                key = digest.hexdigest()
+                # A longer prefix can only match if every shorter one did
+                matching = matching and key in self._prefixes
+                if matching:
+                    cached = boundary
+                self._prefixes.add(key)
+        return cached
+
+
+def chat_payload(model: str, messages: List[dict], answer: str, cached_tokens: int = 0) -> dict:
+    """Response body of POST /v1/chat/completions"""
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": answer},
+        }],
+        "usage": chat_usage(messages, answer, cached_tokens),
+    }
+
+
+def chat_stream_payloads(model: str, answer: str, messages: List[dict] = None,
+                         stream_options: dict = None, cached_tokens: int = 0):
+    """Chunk bodies of a streamed POST /v1/chat/completions, one per word
+
+    With stream_options={"include_usage": True} a last chunk without
+    choices carries the usage, as the real API does.
+    """
+    def chunk(delta, finish_reason=None):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            "usage": None,
+        }
+
+    yield chunk({"role": "assistant", "content": ""})
+    for token in re.findall(r"\s*\S+", answer):
+        yield chunk({"content": token})
+    yield chunk({"content": None}, finish_reason="stop")
+    if (stream_options or {}).get("include_usage"):
+        yield dict(chunk({}), choices=[], usage=chat_usage(messages or [], answer, cached_tokens))
+
+
+class FakeEmbeddings:
+    """Mimics client.embeddings, including the per-request input limits
+
+    rate_limit_errors fails the first requests with 429; error_rate fails a
+    random (seeded) fraction of all requests with 429 or 503.
+    """
+
+    def __init__(self, dimensions: int = 1536, rate_limit_errors: int = 0,
+                 max_inputs_per_request: int = 2048, max_tokens_per_request: int = 300_000,
+                 max_tokens_per_input: int = 8191, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.dimensions = dimensions
+        self.rate_limit_errors = rate_limit_errors
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_tokens_per_input = max_tokens_per_input
+        self.latency = latency
+        self.errors = _RandomErrors(error_rate, seed)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create(self, input, model, timeout: float = None, **kwargs):
+        if timeout is not None and self.latency > timeout:
+            time.sleep(timeout)
+            raise FakeTimeoutError("Request timed out.")
+        time.sleep(self.latency)
+        return self._respond(input, model, **kwargs)
+
+    def _respond(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            if self.rate_limit_errors > 0:
+                self.rate_limit_errors -= 1
+                raise FakeAPIError("Rate limit reached for requests", status_code=429)
+        self.errors.check()
+        with self._lock:
+            self.calls.append(texts)
+
+        if len(texts) > self.max_inputs_per_request:
+            raise FakeAPIError(f"Too many inputs: {len(texts)} > {self.max_inputs_per_request}", status_code=400)
+        longest = max((len(text.split()) for text in texts), default=0)
+        if longest > self.max_tokens_per_input:
+            raise FakeAPIError(f"Input too long: {longest} > {self.max_tokens_per_input} tokens", status_code=400)
+        tokens = sum(len(text.split()) for text in texts)
+        if tokens > self.max_tokens_per_request:
+            raise FakeAPIError(f"Too many tokens: {tokens} > {self.max_tokens_per_request}", status_code=400)
+
+        return _to_namespace(embedding_payload(texts, model, self.dimensions, kwargs.get("dimensions")))
+
+
+class FakeChatCompletions:
+    """Mimics client.chat.completions, including stream=True
+
+    `latency` is the time to the first token and `token_latency` the delay
+    between streamed tokens. prompt_cache reports the cached prompt tokens
+    in the usage, as the real API does.
+    """
+
+    def __init__(self, answer: str, latency: float = 0.0, token_latency: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.answer = answer
+        self.latency = latency
+        self.token_latency = token_latency
+        self.errors = _RandomErrors(error_rate, seed + 1)
+        self.prompt_cache = FakePromptCache()
+        self.calls = []
+
+    def create(self, model, messages, stream: bool = False, **kwargs):
+        time.sleep(self.latency)
+        self.errors.check()
+        self.calls.append(messages)
+        cached_tokens = self.prompt_cache.lookup(messages)
+        if stream:
+            return self._stream(model, messages, kwargs.get("stream_options"), cached_tokens)
+        time.sleep(self.token_latency * len(self.answer.split()))
+        return _to_namespace(chat_payload(model, messages, self.answer, cached_tokens))
+
+    def _stream(self, model, messages, stream_options, cached_tokens=0):
+        for payload in chat_stream_payloads(model, self.answer, messages, stream_options, cached_tokens):
+            time.sleep(self.token_latency)
+            yield _to_namespace(payload)
+
+
+class FakeOpenAI:
+    """Drop-in replacement for openai.OpenAI that never touches the network"""
+
+    def __init__(self, dimensions: int = 1536, answer: str = "This is a fake answer generated offline.",
+                 rate_limit_errors: int = 0, latency: float = 0.0, token_latency: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.embeddings = FakeEmbeddings(dimensions, rate_limit_errors=rate_limit_errors, latency=latency,
+                                         error_rate=error_rate, seed=seed)
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(answer, latency, token_latency,
+                                                                    error_rate, seed))
+
+    def with_options(self, **options) -> "FakeOpenAI":
+        """Like OpenAI.with_options; the fake never retries, so the options are ignored"""
+        return self
+
+
+class AsyncFakeEmbeddings(FakeEmbeddings):
+    """Mimics AsyncOpenAI().embeddings"""
+
+    async def create(self, input, model, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._respond(input, model, **kwargs)
+
+
+class AsyncFakeChatCompletions(FakeChatCompletions):
+    """Mimics AsyncOpenAI().chat.completions"""
+
+    async def create(self, model, messages, stream: bool = False, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.errors.check()
+        self.calls.append(messages)
+        cached_tokens = self.prompt_cache.lookup(messages)
+        if stream:
+            return self._astream(model, messages, kwargs.get("stream_options"), cached_tokens)
+        await asyncio.sleep(self.token_latency * len(self.answer.split()))
+        return _to_namespace(chat_payload(model, messages, self.answer, cached_tokens))
+
+    async def _astream(self, model, messages, stream_options, cached_tokens=0):
+        for payload in chat_stream_payloads(model, self.answer, messages, stream_options, cached_tokens):
+            await asyncio.sleep(self.token_latency)
+            yield _to_namespace(payload)
+
+
+class AsyncFakeOpenAI:
+    """Drop-in replacement for openai.AsyncOpenAI that never touches the network"""
+
+    def __init__(self, dimensions: int = 1536, answer: str = "This is a fake answer generated offline.",
+                 latency: float = 0.0, token_latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.embeddings = AsyncFakeEmbeddings(dimensions, latency=latency, error_rate=error_rate, seed=seed)
+        self.chat = SimpleNamespace(completions=AsyncFakeChatCompletions(answer, latency, token_latency,
+                                                                         error_rate, seed))
+
+    async def close(self):
+        pass
+
+
+class FakeOpenAIServer:
+    """Local HTTP server speaking the OpenAI REST API, for benchmarks
+
+    Point a real client at it with OpenAI(api_key="sk-fake", base_url=server.base_url).
+    Each request sleeps for `latency` seconds to stand in for network and
+    model time; streamed chat completions are sent as server-sent events
+    with `token_latency` seconds between tokens. error_rate fails a seeded
+    random fraction of requests with 429 or 503.
+    """
+
+    def __init__(self, dimensions: int = 1536, answer: str = "This is a fake answer generated offline.",
+                 latency: float = 0.0, token_latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, error_rate: float = 0.0, seed: int = 0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so client connection pooling matters
+            disable_nagle_algorithm = True  # Headers and body are separate writes
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                time.sleep(server.latency)
+                server.requests += 1
+                status = server.errors.next_status()
+                if status is not None:
+                    self._send_json({"error": {"message": "Rate limit reached for requests" if status == 429
+                                               else "The server is overloaded", "type": "fake_error"}}, status)
+                    return
+                if self.path.endswith("/embeddings"):
+                    texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+                    payload = embedding_payload(texts, body["model"], server.dimensions, body.get("dimensions"))
+                    if body.get("encoding_format") == "base64":
+                        # The SDK asks for base64-packed float32 by default
+                        for item in payload["data"]:
+                            packed = np.asarray(item["embedding"], dtype=np.float32).tobytes()
+                            item["embedding"] = base64.b64encode(packed).decode("ascii")
+                elif self.path.endswith("/chat/completions"):
+                    cached_tokens = server.prompt_cache.lookup(body["messages"])
+                    if body.get("stream"):
+                        self._send_event_stream(chat_stream_payloads(
+                            body["model"], server.answer, body["messages"], body.get("stream_options"),
+                            cached_tokens))
+                        return
+                    time.sleep(server.token_latency * len(server.answer.split()))
+                    payload = chat_payload(body["model"], body["messages"], server.answer, cached_tokens)
+                else:
+                    self.send_error(404)
+                    return
+                self._send_json(payload)
+
+            def do_GET(self):
+                self._send_json({"status": "ok"})
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_event_stream(self, payloads):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = (f"data: {json.dumps(payload)}\n\n" for payload in payloads)
+                for event in itertools.chain(events, ["data: [DONE]\n\n"]):
+                    time.sleep(server.token_latency)
+                    data = event.encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.dimensions = dimensions
+        self.answer = answer
+        self.latency = latency
+        self.token_latency = token_latency
+        self.errors = _RandomErrors(error_rate, seed)
+        self.prompt_cache = FakePromptCache()
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted"""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI API server for offline load tests")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Serve the fake API until interrupted")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8100)
+    serve.add_argument("--latency", type=float, default=0.0, help="Seconds before each response")
+    serve.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed tokens")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 429/503")
+    serve.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = FakeOpenAIServer(latency=args.latency, token_latency=args.token_latency,
+                                  host=args.host, port=args.port, error_rate=args.error_rate, seed=args.seed)
+        print(f"Fake OpenAI API at {server.base_url}")
+        print(f"  export OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=sk-fake")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
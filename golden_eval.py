@@ -0,0 +1,259 @@
+"""
+Golden Set Evaluation for LeakProof RAG
+Retrieval quality (recall@k, MRR) and latency of every retrieval backend on
+the labelled questions in golden_set.json, checked against a saved baseline
+so speedups that change results are caught
+
+Embeddings come from a local cache: `record` fills it once (with the real
+API, or the deterministic fake), after which `run` makes no network calls
+and fails if any vector is missing from the cache.
+
+Usage:
+    python golden_eval.py record                 # needs OPENAI_API_KEY (or --fake)
+    python golden_eval.py run --save-baseline    # write golden_baseline.json
+    python golden_eval.py run                    # exit code 1 on a regression
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from caching import EmbeddingCache, QueryEmbeddingCache
+from leakproof_rag import LeakProofRAG
+
+GOLDEN_SET_PATH = "golden_set.json"
+BASELINE_PATH = "golden_baseline.json"
+CACHE_PATH = ".leakproof_cache/golden_embeddings.sqlite3"
+
+
+class CacheOnlyEmbeddings:
+    """Embeddings endpoint that refuses every request, so vectors must come from the cache"""
+
+    def create(self, input, model, **kwargs):
+        count = 1 if isinstance(input, str) else len(input)
+        raise LookupError(f"{count} text(s) missing from the embedding cache; "
+                          f"run `python golden_eval.py record` first")
+
+
+class CacheOnlyClient:
+    """Stands in for the OpenAI client during offline evaluation"""
+
+    def __init__(self):
+        self.embeddings = CacheOnlyEmbeddings()
+
+
+def _configure_brute_force(rag: LeakProofRAG):
+    rag.retrieval_mode = "vector"
+
+
+def _configure_ann(rag: LeakProofRAG):
+    rag.retrieval_mode = "vector"
+    rag.build_ann_index()
+
+
+def _configure_hybrid(rag: LeakProofRAG):
+    rag.retrieval_mode = "hybrid"
+
+
+def _configure_quantized(rag: LeakProofRAG):
+    rag.retrieval_mode = "vector"
+    rag.quantize_embeddings()
+
+
+# Retrieval backends, each set up on a freshly indexed LeakProofRAG
+BACKENDS: Dict[str, Callable[[LeakProofRAG], None]] = {
+    "brute_force": _configure_brute_force,
+    "ann": _configure_ann,
+    "hybrid": _configure_hybrid,
+    "quantized": _configure_quantized,
+}
+
+
+def load_golden_set(path: str = GOLDEN_SET_PATH) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def make_rag(client, cache: EmbeddingCache) -> LeakProofRAG:
+    """A LeakProofRAG whose chunk and query embeddings go through the cache"""
+    return LeakProofRAG(client=client, embedding_cache=cache,
+                        query_cache=QueryEmbeddingCache(disk_cache=cache))
+
+
+def load_golden_chunks(rag: LeakProofRAG, golden: Dict):
+    """Load the chunks the golden labels refer to
+
+    A null "document" means the built-in LeakProof Drive chunks, loaded
+    explicitly so a real leakproof_drive.pdf (whose chunk IDs differ) is
+    never parsed in their place.
+    """
+    if golden.get("document"):
+        rag.load_document(golden["document"])
+    else:
+        rag.chunks = rag._create_chunks()
+
+
+def record_embeddings(client, golden: Dict, cache: EmbeddingCache):
+    """Embed the golden document's chunks and every golden question into the cache"""
+    rag = make_rag(client, cache)
+    load_golden_chunks(rag, golden)
+    rag.create_embeddings()
+    rag.embed_queries([item["question"] for item in golden["questions"]])
+
+
+def score_retrieval(retrieved: Sequence[str], expected: Sequence[str]) -> Dict[str, float]:
+    """Recall (fraction of expected chunks retrieved) and reciprocal rank of the first hit"""
+    expected = set(expected)
+    hits = [i for i, chunk_id in enumerate(retrieved) if chunk_id in expected]
+    return {
+        "recall": len(expected.intersection(retrieved)) / len(expected),
+        "reciprocal_rank": 1.0 / (hits[0] + 1) if hits else 0.0,
+    }
+
+
+def evaluate_backend(rag: LeakProofRAG, golden: Dict, top_k: int = 3, repeat: int = 20) -> Dict:
+    """recall@k, MRR and retrieval latency of one configured LeakProofRAG
+
+    Latency is measured over `repeat` passes of the question set, with the
+    query embeddings already loaded, so it covers retrieval alone.
+    """
+    questions = golden["questions"]
+    known = {chunk["id"] for chunk in rag.chunks}
+    unknown = {chunk_id for item in questions for chunk_id in item["expected"]} - known
+    if unknown:
+        raise ValueError(f"Golden set expects chunk IDs missing from the index: {sorted(unknown)}")
+    # Fails here, not with a silent keyword fallback, if a question is not cached
+    rag.embed_queries([item["question"] for item in questions])
+
+    scores, misses = [], []
+    for item in questions:
+        retrieved = [result["chunk"]["id"] for result in rag.retrieve_relevant_chunks(item["question"], top_k)]
+        score = score_retrieval(retrieved, item["expected"])
+        scores.append(score)
+        if score["recall"] < 1.0:
+            misses.append({"question": item["question"], "expected": item["expected"], "retrieved": retrieved})
+
+    timings = []
+    for _ in range(repeat):
+        for item in questions:
+            start = time.perf_counter()
+            rag.retrieve_relevant_chunks(item["question"], top_k)
+            timings.append(time.perf_counter() - start)
+    milliseconds = np.array(timings) * 1000
+
+    return {
+        f"recall@{top_k}": round(float(np.mean([score["recall"] for score in scores])), 4),
+        "mrr": round(float(np.mean([score["reciprocal_rank"] for score in scores])), 4),
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 4),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 4),
+        "misses": misses,
+    }
+
+
+def evaluate(client, golden: Dict, cache: EmbeddingCache, top_k: int = 3, repeat: int = 20,
+             backends: Sequence[str] = tuple(BACKENDS)) -> Dict:
+    """Evaluate every backend on the golden set; the result is also the baseline format"""
+    results = {}
+    for name in backends:
+        rag = make_rag(client, cache)
+        with contextlib.redirect_stdout(io.StringIO()):
+            load_golden_chunks(rag, golden)
+            rag.create_embeddings()
+            BACKENDS[name](rag)
+        results[name] = evaluate_backend(rag, golden, top_k, repeat)
+    return {"top_k": top_k, "questions": len(golden["questions"]), "backends": results}
+
+
+def find_regressions(result: Dict, baseline: Dict, max_quality_drop: float = 0.02,
+                     max_latency_increase: float = 0.5, latency_slack_ms: float = 0.5) -> List[str]:
+    """Describe every metric that got worse than the baseline allows
+
+    recall and MRR may drop by at most max_quality_drop (absolute); p95
+    latency may grow by max_latency_increase (relative) plus
+    latency_slack_ms, which absorbs timer noise on sub-millisecond searches.
+    """
+    if result["top_k"] != baseline["top_k"]:
+        return [f"top_k {result['top_k']} does not match the baseline's {baseline['top_k']}"]
+    recall_key = f"recall@{result['top_k']}"
+    problems = []
+    for name, metrics in result["backends"].items():
+        before = baseline["backends"].get(name)
+        if before is None:
+            continue
+        for key in (recall_key, "mrr"):
+            if metrics[key] < before[key] - max_quality_drop:
+                problems.append(f"{name}: {key} dropped from {before[key]} to {metrics[key]}")
+        allowed = before["p95_ms"] * (1 + max_latency_increase) + latency_slack_ms
+        if metrics["p95_ms"] > allowed:
+            problems.append(f"{name}: p95 latency rose from {before['p95_ms']} ms to {metrics['p95_ms']} ms "
+                            f"(allowed {allowed:.3f} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden set retrieval evaluation")
+    parser.add_argument("--golden-set", default=GOLDEN_SET_PATH)
+    parser.add_argument("--cache", default=CACHE_PATH, help="Embedding cache used offline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Fill the embedding cache for the golden set")
+    record.add_argument("--fake", action="store_true", help="Use deterministic fake embeddings, no API key")
+
+    run = subparsers.add_parser("run", help="Evaluate offline and compare with the baseline")
+    run.add_argument("--baseline", default=BASELINE_PATH)
+    run.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    run.add_argument("--top-k", type=int, default=3)
+    run.add_argument("--repeat", type=int, default=20, help="Passes over the questions for latency")
+    run.add_argument("--backends", default=",".join(BACKENDS))
+    run.add_argument("--max-quality-drop", type=float, default=0.02)
+    run.add_argument("--max-latency-increase", type=float, default=0.5)
+
+    args = parser.parse_args()
+    golden = load_golden_set(args.golden_set)
+    cache = EmbeddingCache(args.cache)
+
+    if args.command == "record":
+        if args.fake:
+            from fake_openai import FakeOpenAI
+            client = FakeOpenAI()
+        else:
+            from openai import OpenAI
+            client = OpenAI()
+        record_embeddings(client, golden, cache)
+        print(f"✅ Cached embeddings for {len(golden['questions'])} questions in {args.cache}")
+        return
+
+    result = evaluate(CacheOnlyClient(), golden, cache, args.top_k, args.repeat, args.backends.split(","))
+    for name, metrics in result["backends"].items():
+        print(f"{name:<12} recall@{args.top_k} {metrics[f'recall@{args.top_k}']:.3f}  "
+              f"MRR {metrics['mrr']:.3f}  p50 {metrics['p50_ms']:.3f} ms  p95 {metrics['p95_ms']:.3f} ms")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        sys.exit(1)
+
+    problems = find_regressions(result, baseline, args.max_quality_drop, args.max_latency_increase)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
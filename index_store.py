@@ -0,0 +1,210 @@
+"""
+Binary Index Storage for LeakProof RAG
+Versioned on-disk index format with memory-mapped embedding loading
+
+An index is a directory containing:
+    header.json      - format version, embedding model, shape and dtype
+    embeddings.npy   - raw float32/float16 matrix of L2-normalized rows
+    chunks.json      - compact chunk text and metadata sidecar
+    ann_ivf.npz      - optional IVF centroids and inverted lists
+    quantized.npz    - optional int8 codes and per-row scales
+    bm25.npz         - BM25 keyword postings, so loading skips re-tokenizing
+    delta.jsonl      - incremental updates since the last full save: rows
+                       removed (by row number) and chunks appended
+    delta.bin        - raw embedding rows of the appended chunks
+
+Incremental updates only append to the two delta files; loading replays
+them on top of the full save. A full save rewrites everything and starts
+a new generation, so delta records of an older generation are ignored.
+
+Usage:
+    python index_store.py convert leakproof_index.json leakproof_index [--dtype float16]
+"""
+
+import argparse
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vectors import normalize_rows
+
+INDEX_FORMAT_VERSION = 1
+HEADER_FILE = "header.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.json"
+ANN_FILE = "ann_ivf.npz"
+QUANTIZED_FILE = "quantized.npz"
+BM25_FILE = "bm25.npz"
+DELTA_FILE = "delta.jsonl"
+DELTA_EMBEDDINGS_FILE = "delta.bin"
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def _atomic_write(path: Path, write_func, mode: str = "wb"):
+    """Write to a temporary file and rename it over the target"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, mode) as f:
+        write_func(f)
+    os.replace(tmp_path, path)
+
+
+def save_index(directory: str, chunks: List[Dict], embeddings: np.ndarray,
+               embedding_model: str, dtype: str = "float32",
+               embedding_dimensions: Optional[int] = None) -> Dict:
+    """Write chunks and normalized embeddings to an index directory
+
+    embedding_dimensions records the shortened size requested from the
+    embedding API (None for the model's full size), so queries against the
+    index are embedded the same way.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported index dtype '{dtype}'. Use one of: {', '.join(SUPPORTED_DTYPES)}")
+    if len(chunks) != len(embeddings):
+        raise ValueError(f"Index has {len(chunks)} chunks but {len(embeddings)} embeddings")
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    matrix = np.ascontiguousarray(embeddings, dtype=dtype)
+
+    header = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "embedding_model": embedding_model,
+        "embedding_dimensions": embedding_dimensions,
+        "count": int(matrix.shape[0]),
+        "dims": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "dtype": dtype,
+        "normalized": True,
+        "generation": uuid.uuid4().hex,
+    }
+
+    _atomic_write(directory / EMBEDDINGS_FILE, lambda f: np.save(f, matrix))
+    _atomic_write(directory / CHUNKS_FILE,
+                  lambda f: json.dump(chunks, f, separators=(",", ":")), mode="w")
+    # The header is written last so a half-written index is never loadable
+    _atomic_write(directory / HEADER_FILE, lambda f: json.dump(header, f, indent=2), mode="w")
+    # Derived from the old chunks; LeakProofRAG.save_index writes a fresh one
+    for name in (DELTA_FILE, DELTA_EMBEDDINGS_FILE, BM25_FILE):
+        if (directory / name).exists():
+            (directory / name).unlink()
+    return header
+
+
+def append_delta(directory: str, removed_rows: List[int], chunks: List[Dict], embeddings: np.ndarray):
+    """Record an incremental update without rewriting the saved index
+
+    The embedding rows are appended to delta.bin first and the record to
+    delta.jsonl last, so a crash in between leaves an update that is
+    simply not replayed.
+    """
+    directory = Path(directory)
+    header = read_header(directory)
+    rows = np.ascontiguousarray(embeddings, dtype=header["dtype"])
+    embeddings_path = directory / DELTA_EMBEDDINGS_FILE
+    offset = embeddings_path.stat().st_size if embeddings_path.exists() else 0
+    with open(embeddings_path, "ab") as f:
+        f.write(rows.tobytes())
+    record = {"generation": header.get("generation"), "remove": [int(row) for row in removed_rows],
+              "add": chunks, "offset": offset, "count": len(chunks), "dims": int(rows.shape[1])}
+    with open(directory / DELTA_FILE, "a") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def load_deltas(directory: str, header: Dict) -> List[Tuple[List[int], List[Dict], np.ndarray]]:
+    """Read the incremental updates of the current generation, in order
+
+    Returns (removed rows, added chunks, their embeddings) per update. A
+    trailing record that was only partly written is ignored.
+    """
+    directory = Path(directory)
+    if not (directory / DELTA_FILE).exists():
+        return []
+    dtype = np.dtype(header["dtype"])
+    raw = np.fromfile(directory / DELTA_EMBEDDINGS_FILE, dtype=np.uint8) \
+        if (directory / DELTA_EMBEDDINGS_FILE).exists() else np.zeros(0, dtype=np.uint8)
+    deltas = []
+    with open(directory / DELTA_FILE, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record.get("generation") != header.get("generation"):
+                continue
+            shape = (record["count"], record["dims"])
+            size = shape[0] * shape[1] * dtype.itemsize
+            if record["offset"] + size > len(raw):
+                break
+            rows = raw[record["offset"]:record["offset"] + size].view(dtype).reshape(shape)
+            deltas.append((record["remove"], record["add"], rows))
+    return deltas
+
+
+def read_header(directory: str) -> Dict:
+    """Read and validate the header of an index directory"""
+    with open(Path(directory) / HEADER_FILE, "r") as f:
+        header = json.load(f)
+
+    version = header.get("format_version")
+    if version != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {version} (expected {INDEX_FORMAT_VERSION})")
+    return header
+
+
+def load_index(directory: str, mmap: bool = True) -> Tuple[Dict, List[Dict], np.ndarray]:
+    """Load an index directory, memory-mapping the embeddings by default
+
+    With mmap=True only the pages of the embedding file that are actually
+    touched get read from disk.
+    """
+    directory = Path(directory)
+    header = read_header(directory)
+
+    embeddings = np.load(directory / EMBEDDINGS_FILE, mmap_mode="r" if mmap else None)
+    with open(directory / CHUNKS_FILE, "r") as f:
+        chunks = json.load(f)
+
+    expected_shape = (header["count"], header["dims"])
+    if header["count"] and embeddings.shape != expected_shape:
+        raise ValueError(f"Embedding file shape {embeddings.shape} does not match header {expected_shape}")
+    if len(chunks) != header["count"]:
+        raise ValueError(f"Chunk sidecar has {len(chunks)} entries but header says {header['count']}")
+    return header, chunks, embeddings
+
+
+def load_json_index(filepath: str) -> Tuple[List[Dict], List[List[float]]]:
+    """Load the legacy leakproof_index.json format"""
+    with open(filepath, "r") as f:
+        data = json.load(f)
+    return data["chunks"], data["embeddings"]
+
+
+def convert_json_index(json_path: str, directory: str,
+                       embedding_model: str = "text-embedding-3-small",
+                       dtype: str = "float32") -> Dict:
+    """Convert a legacy JSON index into the binary index format"""
+    chunks, embeddings = load_json_index(json_path)
+    return save_index(directory, chunks, normalize_rows(embeddings), embedding_model, dtype=dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LeakProof RAG index tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="Convert a legacy JSON index to the binary format")
+    convert.add_argument("json_path", help="Path to leakproof_index.json")
+    convert.add_argument("directory", help="Output index directory")
+    convert.add_argument("--model", default="text-embedding-3-small", help="Embedding model used for the index")
+    convert.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES)
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        header = convert_json_index(args.json_path, args.directory, args.model, args.dtype)
+        print(f"Converted {header['count']} chunks ({header['dims']} dims, {header['dtype']}) to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
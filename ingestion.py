@@ -0,0 +1,224 @@
+"""
+Batched Embedding Ingestion for LeakProof RAG
+Splits large corpora into API-sized batches, embeds them concurrently with
+retry/backoff on rate limits, and checkpoints progress so a crashed run can
+resume where it stopped
+"""
+
+import hashlib
+import json
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from openai import APIConnectionError, APITimeoutError, RateLimitError
+
+from tokenizer import count_tokens, truncate_to_tokens
+
+# Limits of the OpenAI embeddings endpoint per request
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+# Longest single input the embedding models accept
+MAX_TOKENS_PER_INPUT = 8191
+
+MANIFEST_FILE = "manifest.json"
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """Rate limits, timeouts, connection drops and 5xx responses are retried"""
+    if isinstance(exc, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingIngestor:
+    """Embeds a list of texts in batches bounded by count and token budget"""
+
+    def __init__(self, client, model: str, batch_size: int = 256,
+                 max_batch_tokens: int = 250_000, max_concurrency: int = 4,
+                 max_retries: int = 6, initial_backoff: float = 1.0,
+                 max_backoff: float = 60.0,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 dimensions: Optional[int] = None,
+                 max_input_tokens: int = MAX_TOKENS_PER_INPUT):
+        if not 0 < batch_size <= MAX_INPUTS_PER_REQUEST:
+            raise ValueError(f"batch_size must be between 1 and {MAX_INPUTS_PER_REQUEST}")
+        if not 0 < max_batch_tokens <= MAX_TOKENS_PER_REQUEST:
+            raise ValueError(f"max_batch_tokens must be between 1 and {MAX_TOKENS_PER_REQUEST}")
+        if not 0 < max_input_tokens <= MAX_TOKENS_PER_INPUT:
+            raise ValueError(f"max_input_tokens must be between 1 and {MAX_TOKENS_PER_INPUT}")
+
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.on_progress = on_progress or self._print_progress
+        # Shortened output vectors (the API's dimensions parameter), None for full size
+        self.dimensions = dimensions
+        self.max_input_tokens = max_input_tokens
+
+    @staticmethod
+    def _print_progress(done: int, total: int):
+        print(f"  Embedded {done}/{total} chunks")
+
+    def fit_inputs(self, texts: Sequence[str]) -> List[str]:
+        """Truncate texts over the per-input token limit, which the API rejects with a 400
+        
+        Every token is at least one byte, so only texts longer in bytes than
+        the limit need counting.
+        """
+        fitted = []
+        truncated = 0
+        for text in texts:
+            if (len(text.encode("utf-8")) > self.max_input_tokens
+                    and count_tokens(text, self.model) > self.max_input_tokens):
+                text = truncate_to_tokens(text, self.max_input_tokens, self.model)
+                truncated += 1
+            fitted.append(text)
+        if truncated:
+            print(f"⚠️ Truncated {truncated} chunk(s) to {self.max_input_tokens} tokens for embedding")
+        return fitted
+
+    def make_batches(self, texts: Sequence[str]) -> List[Tuple[int, int]]:
+        """Split texts into contiguous (start, end) ranges within both limits"""
+        batches = []
+        start = 0
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text, self.model)
+            full = i - start >= self.batch_size
+            over_budget = i > start and batch_tokens + tokens > self.max_batch_tokens
+            if full or over_budget:
+                batches.append((start, i))
+                start, batch_tokens = i, 0
+            batch_tokens += tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _embed_batch(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed one batch, backing off exponentially on retryable errors"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                options = {"dimensions": self.dimensions} if self.dimensions else {}
+                response = self.client.embeddings.create(input=list(texts), model=self.model, **options)
+                return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+            except Exception as exc:
+                if attempt == self.max_retries or not is_retryable_error(exc):
+                    raise
+                delay = _retry_after(exc)
+                if delay is None:
+                    delay = min(self.max_backoff, self.initial_backoff * 2 ** attempt)
+                    delay *= 0.5 + random.random() / 2  # Jitter spreads out concurrent retries
+                time.sleep(delay)
+
+    def _fingerprint(self, texts: Sequence[str]) -> str:
+        digest = hashlib.sha256(
+            f"{self.model}\0{self.dimensions}\0{self.batch_size}\0{self.max_batch_tokens}".encode("utf-8")
+        )
+        for text in texts:
+            digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+        return digest.hexdigest()
+
+    def embed(self, texts: Sequence[str], checkpoint_dir: Optional[str] = None) -> List[List[float]]:
+        """Embed all texts, resuming from checkpoint_dir if a previous run crashed
+
+        The checkpoint directory is removed once every batch has completed.
+        """
+        texts = self.fit_inputs(texts)
+        batches = self.make_batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        checkpoint = _Checkpoint(checkpoint_dir, self._fingerprint(texts)) if checkpoint_dir else None
+        pending = []
+        for start, end in batches:
+            saved = checkpoint.load_batch(start, end) if checkpoint else None
+            if saved is None:
+                pending.append((start, end))
+            else:
+                results[start:end] = saved
+
+        done = len(texts) - sum(end - start for start, end in pending)
+        if done:
+            self.on_progress(done, len(texts))
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {
+                pool.submit(self._embed_batch, texts[start:end]): (start, end)
+                for start, end in pending
+            }
+            for future in as_completed(futures):
+                start, end = futures[future]
+                vectors = future.result()
+                if len(vectors) != end - start:
+                    raise ValueError(f"Expected {end - start} embeddings but received {len(vectors)}")
+                results[start:end] = vectors
+                if checkpoint:
+                    checkpoint.save_batch(start, end, vectors)
+                done += end - start
+                self.on_progress(done, len(texts))
+
+        if checkpoint:
+            checkpoint.clear()
+        return results
+
+
+class _Checkpoint:
+    """Per-batch embedding files plus a manifest of completed ranges"""
+
+    def __init__(self, directory: str, fingerprint: str):
+        self.directory = Path(directory)
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self.completed = set()
+
+        manifest_path = self.directory / MANIFEST_FILE
+        if manifest_path.exists():
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("fingerprint") == fingerprint:
+                self.completed = {tuple(batch) for batch in manifest["completed"]}
+            else:
+                # Different corpus or settings: the old batches do not apply
+                shutil.rmtree(self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _batch_path(self, start: int, end: int) -> Path:
+        return self.directory / f"batch_{start}_{end}.npy"
+
+    def load_batch(self, start: int, end: int) -> Optional[List[List[float]]]:
+        if (start, end) not in self.completed:
+            return None
+        return list(np.load(self._batch_path(start, end)))
+
+    def save_batch(self, start: int, end: int, vectors: List[List[float]]):
+        with self._lock:
+            np.save(self._batch_path(start, end), np.asarray(vectors, dtype=np.float32))
+            self.completed.add((start, end))
+            tmp_path = self.directory / (MANIFEST_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"fingerprint": self.fingerprint, "completed": sorted(self.completed)}, f)
+            tmp_path.replace(self.directory / MANIFEST_FILE)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -5,32 +5,199 @@ A complete RAG implementation for querying technical documentation
 
 import os
 import json
-from typing import List, Dict
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional, Union
 from openai import OpenAI
 import numpy as np
 from pathlib import Path
 
+import index_store
+import pdf_loader
+from ann_index import IVFIndex, recall_at_k, sample_queries
+from bm25 import BM25Index, reciprocal_rank_fusion
+from caching import EmbeddingCache, QueryEmbeddingCache, SemanticAnswerCache
+from context_builder import ContextBuilder, corpus_preamble
+from metadata_filter import MetadataIndex
+from performance_table import PerformanceTable
+from quantization import QuantizedIndex
+from quantization import recall_at_k as quantized_recall_at_k
+from ingestion import EmbeddingIngestor
+from metrics import QueryTrace
+from vectors import append_rows, normalize_rows, top_k_indices
+
+# Cap on the (questions x chunks) score matrix built at once by query_batch
+MAX_BATCH_SCORES = 16 * 1024 * 1024
+# Candidates taken from each ranking before hybrid fusion
+HYBRID_CANDIDATES = 50
+# Filters matching less than this fraction of rows gather and score just those
+# rows; above it a full contiguous scan is cheaper than the gather
+FILTER_GATHER_FRACTION = 0.25
+# Tombstoned rows, or rows in a persisted index's delta log, beyond this
+# fraction of the index trigger a compaction
+COMPACT_FRACTION = 0.25
+
+SYSTEM_PROMPT = """You are a technical expert assistant specializing in KEITH LeakProof Drive systems. 
+Your role is to provide accurate, helpful information based on the technical documentation provided.
+
+Guidelines:
+- Answer questions directly and concisely
+- Use specific technical details from the documentation
+- If asked about specifications, provide exact numbers and units
+- If information is not in the documentation, clearly state that
+- Be professional and helpful
+- Reference specific features or specifications when relevant"""
+
+ANSWER_INSTRUCTIONS = """The user's message contains documentation about the KEITH LeakProof Drive followed by their question.
+Please provide a clear, accurate answer based on that documentation."""
+
+# Everything that varies per query goes last, after the cacheable prefix
+USER_PROMPT_TEMPLATE = """DOCUMENTATION:
+{context}
+
+USER QUESTION: {query}"""
+_USER_PROMPT_SKELETON = USER_PROMPT_TEMPLATE.format(context="", query="")
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 class LeakProofRAG:
-    def __init__(self, api_key: str = None):
-        """Initialize the RAG system with OpenAI API"""
+    def __init__(self, api_key: str = None, client=None, embedding_cache=None, query_cache=None,
+                 answer_cache=None):
+        """Initialize the RAG system with OpenAI API
+        
+        A pre-built client (e.g. fake_openai.FakeOpenAI for offline tests)
+        can be passed instead of an API key. An optional
+        caching.EmbeddingCache lets create_embeddings skip unchanged chunks.
+        Query embeddings are cached in memory by default; pass a configured
+        caching.QueryEmbeddingCache to change its size, TTL or disk backing.
+        A caching.SemanticAnswerCache reuses answers for near-identical
+        questions that retrieve the same chunks.
+        """
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or pass it to constructor.")
+        if client is None:
+            if not self.api_key:
+                raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or pass it to constructor.")
+            client = OpenAI(api_key=self.api_key)
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = client
         self.embedding_model = "text-embedding-3-small"
+        # Shortened embeddings via the API's dimensions parameter; text-embedding-3
+        # vectors are trained so a prefix is still a good embedding. None keeps
+        # the model's full size (1536). Stored in the index header.
+        self.embedding_dimensions = None
         self.chat_model = "gpt-4o-mini"
+        self.completion_options = {"temperature": 0.3, "max_tokens": 800}
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.answer_cache = answer_cache
+        # Overrides for ingestion.EmbeddingIngestor (batch_size, max_batch_tokens,
+        # max_concurrency, max_retries, ...)
+        self.ingestion_options = {}
         self.chunks = []
-        self.embeddings = []
+        # Contiguous (n_chunks, dims) float32 matrix with L2-normalized rows,
+        # so cosine similarity against a normalized query is a single dot product
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        # Binary index directory that incremental updates are written back to
+        self.index_path = None
+        self.index_dtype = "float32"
+        # Rows removed by incremental updates (a boolean mask, None when there
+        # are none). They stay in chunks and embeddings, never matching a
+        # search, until compact() drops them.
+        self.deleted_rows = None
+        self._embedding_buffer = None
+        self._deleted_buffer = None
+        # Lazily built lookups for incremental updates: chunk id -> row,
+        # document -> rows and text hash -> row, over live rows only
+        self._row_maps = None
+        # Rows appended to the persisted index's delta log since its last full save
+        self._delta_rows = 0
+        # Optional IVF approximate search, enabled with build_ann_index()
+        self.ann_settings = None
+        self.ann_index = None
+        # Optional int8 candidate scoring with float re-ranking, enabled with
+        # quantize_embeddings()
+        self.quantization_settings = None
+        self.quantized_index = None
+        # Bumped on every index change so cached answers are invalidated
+        self.index_version = 0
+        # "hybrid" fuses the vector and BM25 keyword rankings with reciprocal
+        # rank fusion; "vector" or "lexical" use one ranking alone
+        self.retrieval_mode = "hybrid"
+        self.rrf_k = 60
+        # Seconds to wait for a query embedding (one attempt, no retries)
+        # before hybrid retrieval falls back to keyword search; None waits
+        # for the client's own timeout
+        self.query_embedding_timeout = 5.0
+        self.lexical_index = None
+        # Per-field metadata columns backing the filters= argument
+        self.metadata_index = None
+        # Pump-flow table that answers numeric performance lookups directly,
+        # without an embedding call or a chat completion
+        self.structured_answers = True
+        self.performance_table = None
+        # Optional metrics.MetricsSink receiving the stage timings and token
+        # usage of every query
+        self.metrics = None
+        # Packs retrieved chunks into the prompt under a token budget and
+        # drops near-duplicates
+        self.context_builder = ContextBuilder()
+        # (index_version, system message) of the static prompt prefix
+        self._prompt_prefix_cache = None
         
     def load_document(self, pdf_path: str):
-        """Load and process the PDF document"""
-        print("Loading document...")
+        """Load and process the PDF document
         
-        # For this demo, we'll use the pre-extracted text
-        # In production, you'd use PyPDF2, pdfplumber, or similar
-        self.chunks = self._create_chunks()
+        pdf_path may be a single PDF or a directory of PDFs, which are parsed
+        in parallel. If the file does not exist, the curated chunks of the
+        LeakProof Drive brochure are used instead.
+        """
+        print("Loading document...")
+        self._reset_rows()
+        self.chunks = list(self._iter_document_chunks(pdf_path))
         print(f"Created {len(self.chunks)} chunks")
+    
+    def _iter_document_chunks(self, pdf_path: str):
+        """Stream chunks from a PDF, a directory of PDFs or the built-in demo text"""
+        path = Path(pdf_path)
+        if path.is_dir():
+            return pdf_loader.iter_directory_chunks(path)
+        if path.exists():
+            return pdf_loader.iter_document_chunks(path)
+        print(f"  {pdf_path} not found, using the built-in LeakProof Drive chunks")
+        return iter(self._create_chunks())
+    
+    def index_documents(self, pdf_path: str, buffer_size: int = 1024, checkpoint_dir: str = None):
+        """Parse documents and embed their chunks as they stream in
+        
+        Chunks are embedded buffer_size at a time while the remaining pages
+        are still being parsed, so memory holds only the chunk texts and the
+        float32 embedding matrix.
+        """
+        print("Indexing documents...")
+        chunks, blocks, buffer = [], [], []
+        
+        def flush():
+            blocks.append(normalize_rows(self._embed_texts(
+                [chunk["text"] for chunk in buffer], checkpoint_dir=checkpoint_dir
+            )))
+            chunks.extend(buffer)
+            buffer.clear()
+        
+        for chunk in self._iter_document_chunks(pdf_path):
+            buffer.append(chunk)
+            if len(buffer) >= buffer_size:
+                flush()
+        if buffer:
+            flush()
+        
+        self._reset_rows()
+        self.chunks = chunks
+        self.embeddings = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        self._index_changed()
+        print(f"Indexed {len(self.chunks)} chunks")
         
     def _create_chunks(self) -> List[Dict]:
         """Create semantic chunks from the document with metadata"""
@@ -159,18 +326,456 @@ Regional Contacts:
         ]
         return chunks
     
-    def create_embeddings(self):
-        """Generate embeddings for all chunks"""
+    def create_embeddings(self, checkpoint_dir: str = None):
+        """Generate embeddings for all chunks
+        
+        Chunks are sent in batches sized to the API limits. Pass a
+        checkpoint_dir to resume a large ingestion after a crash.
+        """
         print("Creating embeddings...")
+        self.chunks = self.live_chunks()
         texts = [chunk["text"] for chunk in self.chunks]
+        self._set_embeddings(self._embed_texts(texts, checkpoint_dir=checkpoint_dir))
+        print(f"Created {len(self.embeddings)} embeddings")
+    
+    def _embed_texts(self, texts: List[str], checkpoint_dir: str = None) -> List:
+        """Embed texts, only sending those missing from the embedding cache"""
+        if self.embedding_cache is None:
+            vectors = [None] * len(texts)
+        else:
+            vectors = self.embedding_cache.get_many(self._embedding_key, texts)
+        
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            ingestor = EmbeddingIngestor(self.client, self.embedding_model,
+                                         dimensions=self.embedding_dimensions, **self.ingestion_options)
+            new_vectors = ingestor.embed([texts[i] for i in missing], checkpoint_dir=checkpoint_dir)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+            
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many(
+                    self._embedding_key, [texts[i] for i in missing], new_vectors
+                )
+        
+        if self.embedding_cache is not None:
+            print(f"  {len(texts) - len(missing)} cached, {len(missing)} newly embedded")
+        return vectors
+    
+    def _set_embeddings(self, vectors):
+        """Store chunk embeddings as a pre-normalized float32 matrix"""
+        self._reset_rows()
+        self.embeddings = normalize_rows(vectors)
+        self._index_changed()
+    
+    def _reset_rows(self, detach: bool = True):
+        """Forget tombstones and row lookups before chunks and embeddings are replaced
+        
+        Unless detach is False (compaction keeps the same corpus), the saved
+        index is forgotten too: its delta log numbers rows of the old corpus,
+        so updates to the new one must not be appended to it.
+        """
+        if detach:
+            self.index_path = None
+            self.index_dtype = "float32"
+        self.deleted_rows = None
+        self._embedding_buffer = self._deleted_buffer = None
+        self._row_maps = None
+        self._delta_rows = 0
+    
+    def _deleted_list(self) -> np.ndarray:
+        if self.deleted_rows is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.deleted_rows)
+    
+    def live_chunks(self) -> List[Dict]:
+        """The indexed chunks, without rows removed by incremental updates"""
+        if self.deleted_rows is None:
+            return list(self.chunks)
+        return [chunk for chunk, deleted in zip(self.chunks, self.deleted_rows) if not deleted]
+    
+    def _index_changed(self, incremental: bool = False, lexical_index: BM25Index = None):
+        """Rebuild every derived search structure from the chunks and embeddings
+        
+        With incremental, the trained ANN centroids are reused and only the
+        inverted lists are rebuilt; otherwise they are retrained. Tombstoned
+        rows are removed from the rebuilt structures. A lexical_index already
+        built over the chunks (loaded from disk) is used instead of a rebuild.
+        """
+        self.index_version += 1
+        self._row_maps = None
+        self._build_chunk_indexes(lexical_index)
+        deleted = self._deleted_list()
+        if self.quantization_settings is not None:
+            self.quantized_index = (QuantizedIndex(**self.quantization_settings).build(self.embeddings)
+                                    if len(self.embeddings) else None)
+            if self.quantized_index is not None and len(deleted):
+                self.quantized_index.remove(deleted)
+        if self.ann_settings is None:
+            return
+        if not len(self.embeddings):
+            self.ann_index = None
+        elif incremental and self.ann_index is not None:
+            self.ann_index.assign(self.embeddings)
+        else:
+            self.ann_index = IVFIndex(**self.ann_settings).build(self.embeddings)
+        if self.ann_index is not None and len(deleted):
+            self.ann_index.remove(deleted)
+    
+    def _build_chunk_indexes(self, lexical_index: BM25Index = None):
+        """Rebuild the BM25 keyword index (unless given), metadata columns and performance table"""
+        if not self.chunks:
+            self.lexical_index = self.metadata_index = self.performance_table = None
+            return
+        self.lexical_index = lexical_index or BM25Index().build([chunk["text"] for chunk in self.chunks])
+        self.metadata_index = MetadataIndex().build(self.chunks)
+        deleted = self._deleted_list()
+        if len(deleted):
+            if lexical_index is None:
+                self.lexical_index.remove(deleted, [self.chunks[i]["text"] for i in deleted])
+            self.metadata_index.remove(deleted)
+        self.performance_table = PerformanceTable().build(self.live_chunks())
+    
+    def build_ann_index(self, nlist: int = None, nprobe: int = 8):
+        """Enable approximate nearest-neighbour retrieval with an IVF index
+        
+        nlist defaults to ~sqrt(n_chunks). Raise nprobe for better recall at
+        the cost of latency; check the trade-off with ann_recall().
+        """
+        self.ann_settings = {"nlist": nlist, "nprobe": nprobe}
+        self.ann_index = None
+        self._index_changed()
+        print(f"ANN index built: {self.ann_index.nlist} clusters, nprobe={nprobe}")
+    
+    def ann_recall(self, top_k: int = 10, queries=None, nprobe: int = None) -> float:
+        """Measure recall@k of the ANN index against exact search
+        
+        Without queries, perturbed copies of random chunk vectors are used.
+        """
+        if self.ann_index is None:
+            raise ValueError("No ANN index. Call build_ann_index() first.")
+        if queries is None:
+            queries = sample_queries(self.embeddings)
+        return recall_at_k(self.embeddings, self.ann_index, queries, k=top_k, nprobe=nprobe)
+    
+    def quantize_embeddings(self, rerank: int = 4, top_k: int = 10, dims: int = None) -> Dict:
+        """Score queries against int8 codes and re-rank the best candidates exactly
+        
+        The top top_k * rerank rows by int8 score are re-scored with the float
+        vectors. Memory drops 4x against float32 once the float matrix is only
+        memory-mapped (save_index, then load_index). With dims (e.g. 256) the
+        first stage only scores that many leading dimensions: a two-stage
+        Matryoshka search that re-ranks on the full vector. Returns the memory
+        use and the measured recall@top_k with and without re-ranking.
+        """
+        if len(self.embeddings) == 0:
+            raise ValueError("No embeddings to quantize. Create or load an index first.")
+        self.quantization_settings = {"rerank": rerank, "dims": dims}
+        self.quantized_index = QuantizedIndex(**self.quantization_settings).build(self.embeddings)
+        if self.deleted_rows is not None:
+            self.quantized_index.remove(self._deleted_list())
+        self.index_version += 1
+        
+        report = {
+            "float_bytes": int(self.embeddings.nbytes),
+            "quantized_bytes": int(self.quantized_index.nbytes),
+            "recall": self.quantization_recall(top_k),
+            "recall_without_rerank": self.quantization_recall(top_k, rerank=1),
+        }
+        report["compression"] = report["float_bytes"] / report["quantized_bytes"]
+        stage = f"first {self.quantized_index.codes.shape[1]} dims, " if dims else ""
+        print(f"Quantized {len(self.embeddings)} embeddings to int8 ({stage}re-rank x{rerank}): "
+              f"{report['float_bytes'] / 1e6:.1f} MB -> {report['quantized_bytes'] / 1e6:.1f} MB "
+              f"({report['compression']:.1f}x)")
+        print(f"  recall@{top_k}: {report['recall']:.3f} with re-rank x{rerank}, "
+              f"{report['recall_without_rerank']:.3f} int8 only")
+        return report
+    
+    def quantization_recall(self, top_k: int = 10, queries=None, rerank: int = None) -> float:
+        """Measure recall@k of quantized search against exact float search
+        
+        Without queries, perturbed copies of random chunk vectors are used.
+        """
+        if self.quantized_index is None:
+            raise ValueError("No quantized index. Call quantize_embeddings() first.")
+        if queries is None:
+            queries = sample_queries(self.embeddings)
+        return quantized_recall_at_k(self.embeddings, self.quantized_index, queries, k=top_k, rerank=rerank)
+    
+    @staticmethod
+    def _document_of(chunk: Dict) -> str:
+        """Chunks from files belong to their source; built-in chunks stand alone"""
+        return chunk["metadata"].get("source", chunk["id"])
+    
+    def _rows(self) -> Dict[str, Dict]:
+        """Row lookups by chunk id, document and text hash, built once then kept up to date"""
+        if self._row_maps is None:
+            maps = {"id": {}, "document": {}, "hash": {}}
+            for row, chunk in enumerate(self.chunks):
+                if self.deleted_rows is None or not self.deleted_rows[row]:
+                    self._map_row(maps, row, chunk)
+            self._row_maps = maps
+        return self._row_maps
+    
+    def _map_row(self, maps: Dict[str, Dict], row: int, chunk: Dict):
+        maps["id"][chunk["id"]] = row
+        maps["document"].setdefault(self._document_of(chunk), set()).add(row)
+        maps["hash"].setdefault(_content_hash(chunk["text"]), row)
+    
+    def _unmap_row(self, maps: Dict[str, Dict], row: int, chunk: Dict):
+        if maps["id"].get(chunk["id"]) == row:
+            del maps["id"][chunk["id"]]
+        rows = maps["document"].get(self._document_of(chunk), set())
+        rows.discard(row)
+        if not rows:
+            maps["document"].pop(self._document_of(chunk), None)
+        digest = _content_hash(chunk["text"])
+        if maps["hash"].get(digest) == row:
+            del maps["hash"][digest]
+    
+    def add_documents(self, chunks: List[Dict]) -> Dict:
+        """Add chunks to the index, embedding only content not indexed yet
+        
+        A chunk whose id is already indexed replaces the existing chunk.
+        """
+        by_id = self._rows()["id"]
+        remove = {by_id[chunk["id"]] for chunk in chunks if chunk["id"] in by_id}
+        return self._update_index(remove, chunks)
+    
+    def update_document(self, source: str, chunks: List[Dict] = None, root: str = None) -> Dict:
+        """Replace every chunk of a document with its new version
+        
+        If chunks is not given, source is a PDF path that gets re-parsed;
+        pass the indexed directory as root for files that were indexed from
+        one, so the document keeps its relative source name and chunk ids.
+        Chunks whose text did not change keep their existing embeddings.
+        """
+        if chunks is None:
+            if not Path(source).is_file():
+                raise FileNotFoundError(f"Document not found: {source}")
+            chunks = list(pdf_loader.iter_document_chunks(source, root=root))
+            source = pdf_loader.document_name(source, root)
+        
+        maps = self._rows()
+        remove = set(maps["document"].get(source, ()))
+        remove.update(maps["id"][chunk["id"]] for chunk in chunks if chunk["id"] in maps["id"])
+        return self._update_index(remove, chunks)
+    
+    def remove_document(self, source: str) -> Dict:
+        """Remove every chunk of a document (or a single built-in chunk by id)"""
+        remove = set(self._rows()["document"].get(source, ()))
+        if not remove:
+            raise KeyError(f"No indexed chunks for document: {source}")
+        return self._update_index(remove, [])
+    
+    def _update_index(self, remove: set, new_chunks: List[Dict]) -> Dict:
+        """Tombstone rows, append new chunks and persist the change if the index lives on disk
+        
+        Vectors are diffed by content hash: any new chunk whose text is
+        already in the index reuses that row, so only changed text is embedded.
+        Only the changed rows touch the derived indexes, and a persisted index
+        only gets a delta record, until tombstones or the delta log pass
+        COMPACT_FRACTION of the index and it is compacted.
+        """
+        by_hash = self._rows()["hash"]
+        to_embed = {}
+        for chunk in new_chunks:
+            digest = _content_hash(chunk["text"])
+            if digest not in by_hash:
+                to_embed.setdefault(digest, chunk["text"])
+        
+        fresh = {}
+        if to_embed:
+            vectors = normalize_rows(self._embed_texts(list(to_embed.values())))
+            fresh = dict(zip(to_embed, vectors))
+        
+        new_rows = np.array([
+            fresh[digest] if digest in fresh else self.embeddings[by_hash[digest]]
+            for digest in (_content_hash(chunk["text"]) for chunk in new_chunks)
+        ], dtype=np.float32).reshape(len(new_chunks), -1 if new_chunks else self.embeddings.shape[1])
+        removed = sorted(remove)
+        self._apply_update(removed, new_chunks, new_rows)
+        
+        deleted = int(self.deleted_rows.sum()) if self.deleted_rows is not None else 0
+        if self.index_path:
+            self._delta_rows += len(new_chunks)
+            if max(deleted, self._delta_rows) > COMPACT_FRACTION * len(self.chunks):
+                self.compact()
+            else:
+                index_store.append_delta(self.index_path, removed, list(new_chunks), new_rows)
+        elif deleted > COMPACT_FRACTION * len(self.chunks):
+            self.compact()
+        
+        summary = {"added": len(new_chunks), "removed": len(remove), "embedded": len(to_embed)}
+        print(f"Index updated: +{summary['added']} / -{summary['removed']} chunks "
+              f"({summary['embedded']} newly embedded)")
+        return summary
+    
+    def _apply_update(self, removed: List[int], new_chunks: List[Dict], new_rows: np.ndarray):
+        """Tombstone removed rows and append new ones, patching only those rows
         
-        response = self.client.embeddings.create(
-            input=texts,
-            model=self.embedding_model
+        The BM25 postings, metadata columns, ANN lists, quantized codes and
+        performance table are updated for the changed rows alone. Used for
+        live updates and to replay a persisted index's delta log.
+        """
+        maps = self._rows()
+        old_chunks = [self.chunks[row] for row in removed]
+        if removed:
+            if self.deleted_rows is None:
+                self.deleted_rows, self._deleted_buffer = np.zeros(len(self.chunks), dtype=bool), None
+            self.deleted_rows[removed] = True
+            for row, chunk in zip(removed, old_chunks):
+                self._unmap_row(maps, row, chunk)
+        
+        start = len(self.chunks)
+        rebuild = (self.lexical_index is None
+                   or (self.ann_settings is not None and self.ann_index is None)
+                   or (self.quantization_settings is not None and self.quantized_index is None))
+        if len(new_chunks):
+            self.chunks.extend(new_chunks)
+            self.embeddings, self._embedding_buffer = append_rows(self.embeddings, self._embedding_buffer, new_rows)
+            if self.deleted_rows is not None:
+                self.deleted_rows, self._deleted_buffer = append_rows(
+                    self.deleted_rows, self._deleted_buffer, np.zeros(len(new_chunks), dtype=bool))
+            for row, chunk in enumerate(new_chunks, start):
+                self._map_row(maps, row, chunk)
+        
+        if rebuild:
+            # Nothing was indexed before, so there is nothing to patch
+            self._index_changed()
+            self._row_maps = maps
+            return
+        
+        if removed:
+            self.lexical_index.remove(removed, [chunk["text"] for chunk in old_chunks])
+            self.metadata_index.remove(removed)
+            if self.ann_index is not None:
+                self.ann_index.remove(removed)
+            if self.quantized_index is not None:
+                self.quantized_index.remove(removed)
+        if len(new_chunks):
+            self.lexical_index.add([chunk["text"] for chunk in new_chunks])
+            self.metadata_index.add(new_chunks)
+            if self.ann_index is not None:
+                self.ann_index.add(new_rows, start)
+            if self.quantized_index is not None:
+                self.quantized_index.add(new_rows)
+        self.performance_table.update(new_chunks, old_chunks)
+        self.index_version += 1
+    
+    def compact(self):
+        """Drop tombstoned rows for good and rewrite a persisted index in full
+        
+        Runs automatically once tombstones or the delta log pass
+        COMPACT_FRACTION of the index; the derived indexes are rebuilt,
+        reusing the trained ANN centroids.
+        """
+        self._compact_rows()
+        if self.index_path:
+            self.save_index(self.index_path, dtype=self.index_dtype)
+    
+    def _compact_rows(self):
+        if self.deleted_rows is None:
+            return
+        keep = np.flatnonzero(~self.deleted_rows)
+        chunks = [self.chunks[i] for i in keep]
+        embeddings = np.ascontiguousarray(self.embeddings[keep])
+        self._reset_rows(detach=False)
+        self.chunks, self.embeddings = chunks, embeddings
+        self._index_changed(incremental=True)
+    
+    @property
+    def _embedding_key(self) -> str:
+        """Cache key for the embedding space: the model plus any shortened size"""
+        if self.embedding_dimensions:
+            return f"{self.embedding_model}@{self.embedding_dimensions}"
+        return self.embedding_model
+    
+    def _embedding_options(self) -> Dict:
+        """Extra embeddings.create arguments"""
+        return {"dimensions": self.embedding_dimensions} if self.embedding_dimensions else {}
+    
+    def embed_query(self, query: str, timeout: float = None) -> np.ndarray:
+        """Create a unit-length embedding vector for a query
+        
+        Repeated questions (after normalizing case, whitespace and trailing
+        punctuation) are served from the query cache without an API call.
+        With a timeout, the request is tried once and raises if it takes
+        longer.
+        """
+        if self.query_cache is not None:
+            cached = self.query_cache.get(self._embedding_key, query)
+            if cached is not None:
+                return cached
+        
+        client, options = self.client, self._embedding_options()
+        if timeout is not None:
+            if hasattr(client, "with_options"):
+                client = client.with_options(max_retries=0)
+            options["timeout"] = timeout
+        query_response = client.embeddings.create(
+            input=[query],
+            model=self.embedding_model,
+            **options
         )
+        query_embedding = normalize_rows([query_response.data[0].embedding])[0]
         
-        self.embeddings = [item.embedding for item in response.data]
-        print(f"Created {len(self.embeddings)} embeddings")
+        if self.query_cache is not None:
+            self.query_cache.put(self._embedding_key, query, query_embedding)
+        return query_embedding
+    
+    def _embed_for_retrieval(self, query: str):
+        """Embed a query for retrieval, or return None to use keyword search only
+        
+        In lexical mode no embedding request is made. In hybrid mode a failed
+        embedding request (API down, or slower than query_embedding_timeout)
+        falls back to the BM25 index instead of failing the query.
+        """
+        if self._lexical_only():
+            return None
+        try:
+            return self.embed_query(query, timeout=self._fallback_timeout())
+        except Exception as e:
+            self._fall_back_to_keywords(e)
+            return None
+    
+    def _lexical_only(self) -> bool:
+        return self.retrieval_mode == "lexical" and self.lexical_index is not None
+    
+    def _can_fall_back(self) -> bool:
+        return self.retrieval_mode != "vector" and self.lexical_index is not None
+    
+    def _fallback_timeout(self) -> Optional[float]:
+        """The query embedding timeout, when keyword search can answer instead"""
+        return self.query_embedding_timeout if self._can_fall_back() else None
+    
+    def _fall_back_to_keywords(self, error: Exception):
+        """Re-raise an embedding error unless keyword search can stand in"""
+        if not self._can_fall_back():
+            raise error
+        print(f"⚠️ Query embedding failed ({error or type(error).__name__}), falling back to keyword search")
+    
+    def embed_queries(self, questions: List[str]) -> np.ndarray:
+        """Embed many questions at once; returns one unit-length row per question
+        
+        Cached questions are skipped and the rest go out together in as few
+        embedding requests as the API limits allow (usually one).
+        """
+        vectors = [
+            self.query_cache.get(self._embedding_key, question) if self.query_cache is not None else None
+            for question in questions
+        ]
+        missing = list(dict.fromkeys(q for q, vector in zip(questions, vectors) if vector is None))
+        if missing:
+            options = {**self.ingestion_options, "on_progress": lambda done, total: None}
+            ingestor = EmbeddingIngestor(self.client, self.embedding_model,
+                                         dimensions=self.embedding_dimensions, **options)
+            embedded = dict(zip(missing, normalize_rows(ingestor.embed(missing))))
+            if self.query_cache is not None:
+                for question, vector in embedded.items():
+                    self.query_cache.put(self._embedding_key, question, vector)
+            vectors = [embedded[q] if vector is None else vector for q, vector in zip(questions, vectors)]
+        return normalize_rows(vectors)
     
     def cosine_similarity(self, a: List[float], b: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
@@ -178,77 +783,297 @@ Regional Contacts:
         b = np.array(b)
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
     
-    def retrieve_relevant_chunks(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Retrieve the most relevant chunks for a query"""
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 3, filters=None) -> List[Dict]:
+        """Retrieve the most relevant chunks for a query
+        
+        filters restricts retrieval to chunks whose metadata matches, e.g.
+        {"section": "performance"} or "pump_flow >= 25" (see metadata_filter).
+        """
+        if len(self.embeddings) == 0:
+            return []
+        
         # Create embedding for the query
-        query_response = self.client.embeddings.create(
-            input=[query],
-            model=self.embedding_model
-        )
-        query_embedding = query_response.data[0].embedding
-        
-        # Calculate similarities
-        similarities = []
-        for i, emb in enumerate(self.embeddings):
-            sim = self.cosine_similarity(query_embedding, emb)
-            similarities.append({
-                "chunk": self.chunks[i],
-                "similarity": sim
-            })
-        
-        # Sort by similarity and return top_k
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        return similarities[:top_k]
-    
-    def generate_response(self, query: str, relevant_chunks: List[Dict]) -> str:
-        """Generate a response using retrieved chunks and OpenAI"""
-        # Prepare context from retrieved chunks
-        context = "\n\n".join([
-            f"[Source {i+1}]:\n{chunk['chunk']['text']}"
-            for i, chunk in enumerate(relevant_chunks)
-        ])
-        
-        # Create the system prompt
-        system_prompt = """You are a technical expert assistant specializing in KEITH LeakProof Drive systems. 
-Your role is to provide accurate, helpful information based on the technical documentation provided.
-
-Guidelines:
-- Answer questions directly and concisely
-- Use specific technical details from the documentation
-- If asked about specifications, provide exact numbers and units
-- If information is not in the documentation, clearly state that
-- Be professional and helpful
-- Reference specific features or specifications when relevant"""
-
-        # Create the user prompt with context
-        user_prompt = f"""Based on the following documentation about the KEITH LeakProof Drive, please answer the user's question.
-
-DOCUMENTATION:
-{context}
-
-USER QUESTION: {query}
-
-Please provide a clear, accurate answer based on the documentation above."""
-
-        # Generate response
-        response = self.client.chat.completions.create(
-            model=self.chat_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=800
-        )
+        return self._retrieve(query, self._embed_for_retrieval(query), top_k, filters)
+    
+    def _filter_rows(self, filters):
+        """Rows matching the metadata filters, or None to search everything"""
+        if not filters or self.metadata_index is None:
+            return None
+        return self.metadata_index.rows(filters)
+    
+    def _retrieve(self, query: str, query_embedding, top_k: int, filters=None) -> List[Dict]:
+        """Retrieve with the configured retrieval_mode
         
+        query_embedding may be None, in which case only the keyword index is
+        used and no network call is needed.
+        """
+        if len(self.embeddings) == 0:
+            return []
+        rows = self._filter_rows(filters)
+        if rows is not None and len(rows) == 0:
+            return []
+        if query_embedding is None:
+            return self._retrieve_lexical(query, top_k, rows)
+        if self.retrieval_mode == "vector" or self.lexical_index is None:
+            return self._retrieve_by_embedding(query_embedding, top_k, rows)
+        vector_rows, _ = self._search(query_embedding, max(top_k, HYBRID_CANDIDATES), rows)
+        return self._fuse(query, query_embedding, vector_rows, top_k, rows)
+    
+    def _retrieve_lexical(self, query: str, top_k: int, rows: np.ndarray = None) -> List[Dict]:
+        """BM25-only retrieval; similarity is the score relative to the best match"""
+        rows, scores = self.lexical_index.search(query, top_k, rows)
+        best = float(scores[0]) if len(scores) else 1.0
+        return [
+            {"chunk": self.chunks[i], "similarity": float(score) / best}
+            for i, score in zip(rows, scores)
+        ]
+    
+    def _fuse(self, query: str, query_embedding: np.ndarray, vector_rows, top_k: int,
+              rows: np.ndarray = None) -> List[Dict]:
+        """Combine vector candidates with BM25 candidates by reciprocal rank fusion
+        
+        Results are ordered by fused score; "similarity" stays the cosine
+        similarity so it is comparable with vector-only retrieval.
+        """
+        lexical_rows, _ = self.lexical_index.search(query, max(top_k, HYBRID_CANDIDATES), rows)
+        fused = reciprocal_rank_fusion([vector_rows, lexical_rows], k=self.rrf_k)
+        best = sorted(fused, key=lambda row: -fused[row])[:top_k]
+        similarities = np.asarray(self.embeddings[best], dtype=np.float32) @ query_embedding
+        return [
+            {"chunk": self.chunks[row], "similarity": float(similarity), "score": fused[row]}
+            for row, similarity in zip(best, similarities)
+        ]
+    
+    def _retrieve_by_embedding(self, query_embedding: np.ndarray, top_k: int,
+                               rows: np.ndarray = None) -> List[Dict]:
+        """Retrieve the top_k chunks for an already embedded query"""
+        if len(self.embeddings) == 0:
+            return []
+        
+        rows, scores = self._search(query_embedding, top_k, rows)
+        return [
+            {"chunk": self.chunks[i], "similarity": float(score)}
+            for i, score in zip(rows, scores)
+        ]
+    
+    def _retrieve_batch(self, questions: List[str], query_embeddings: np.ndarray,
+                        top_k: int, filters=None) -> List[List[Dict]]:
+        """Retrieve the top_k chunks for each question and its row of a query matrix"""
+        rows = self._filter_rows(filters)
+        if len(self.embeddings) == 0 or (rows is not None and len(rows) == 0):
+            return [[] for _ in questions]
+        if (self.ann_index is not None and rows is None) or self.quantized_index is not None:
+            return [self._retrieve(q, e, top_k, filters) for q, e in zip(questions, query_embeddings)]
+        
+        hybrid = self.retrieval_mode != "vector" and self.lexical_index is not None
+        candidates = max(top_k, HYBRID_CANDIDATES) if hybrid else top_k
+        matrix = self.embeddings if rows is None else self.embeddings[rows]
+        
+        # One matrix-matrix product scores a block of questions against every
+        # candidate chunk; blocks keep the score matrix bounded for large indexes
+        results = []
+        block = max(1, MAX_BATCH_SCORES // len(matrix))
+        for start in range(0, len(query_embeddings), block):
+            scores = query_embeddings[start:start + block] @ matrix.T
+            if rows is None and self.deleted_rows is not None:
+                scores[:, self.deleted_rows] = -np.inf
+            for offset, row_scores in enumerate(scores):
+                best = top_k_indices(row_scores, candidates)
+                best = best[np.isfinite(row_scores[best])]
+                best_rows = best if rows is None else rows[best]
+                if hybrid:
+                    i = start + offset
+                    results.append(self._fuse(questions[i], query_embeddings[i], best_rows, top_k, rows))
+                else:
+                    results.append([
+                        {"chunk": self.chunks[row], "similarity": float(row_scores[j])}
+                        for row, j in zip(best_rows, best)
+                    ])
+        return results
+    
+    def _search(self, query_embedding: np.ndarray, top_k: int, rows: np.ndarray = None):
+        """Return (row indices, similarities) of the top_k chunks, best first
+        
+        With rows given (a metadata filter), only those rows of the matrix
+        are gathered and scored, so selective filters make the search cheaper.
+        """
+        if self.quantized_index is not None and (rows is not None or self.ann_index is None):
+            return self.quantized_index.search(self.embeddings, query_embedding, top_k, rows)
+        if rows is not None:
+            if len(rows) < FILTER_GATHER_FRACTION * len(self.embeddings):
+                scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query_embedding
+            else:
+                scores = (self.embeddings @ query_embedding)[rows]
+            best = top_k_indices(scores, top_k)
+            return rows[best], scores[best]
+        if self.ann_index is not None:
+            return self.ann_index.search(self.embeddings, query_embedding, top_k)
+        
+        # Rows are pre-normalized, so one matrix-vector product gives every
+        # cosine similarity at once; top_k uses a partial selection, not a sort
+        scores = self.embeddings @ query_embedding
+        if self.deleted_rows is not None:
+            scores[self.deleted_rows] = -np.inf
+        rows = top_k_indices(scores, top_k)
+        rows = rows[np.isfinite(scores[rows])]
+        return rows, scores[rows]
+    
+    def generate_response(self, query: str, relevant_chunks: List[Dict], trace: QueryTrace = None) -> str:
+        """Generate a response using retrieved chunks and OpenAI
+        
+        A metrics.QueryTrace, if given, receives the prompt and generate
+        timings and the token usage of the completion.
+        """
+        trace = trace if trace is not None else QueryTrace()
+        with trace.stage("prompt"):
+            messages = self._build_messages(query, relevant_chunks, trace)
+        with trace.stage("generate"):
+            response = self.client.chat.completions.create(
+                model=self.chat_model,
+                messages=messages,
+                **self.completion_options
+            )
+        trace.add_usage(getattr(response, "usage", None))
         return response.choices[0].message.content
     
-    def query(self, question: str, top_k: int = 3, show_sources: bool = True) -> Dict:
-        """Main query method - retrieves relevant info and generates answer"""
+    def generate_response_stream(self, query: str, relevant_chunks: List[Dict],
+                                 trace: QueryTrace = None) -> Iterator[str]:
+        """Yield the answer text piece by piece as the model generates it"""
+        trace = trace if trace is not None else QueryTrace()
+        with trace.stage("prompt"):
+            messages = self._build_messages(query, relevant_chunks, trace)
+        yield from self._stream_completion(messages, trace)
+    
+    def _stream_completion(self, messages: List[Dict], trace: QueryTrace) -> Iterator[str]:
+        with trace.stage("generate"):
+            stream = self.client.chat.completions.create(
+                model=self.chat_model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.completion_options
+            )
+            for chunk in stream:
+                # The final chunk has no choices and carries the token usage
+                trace.add_usage(getattr(chunk, "usage", None))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    trace.mark("first_token")
+                    yield chunk.choices[0].delta.content
+    
+    def _prompt_prefix(self) -> str:
+        """System message shared by every query, byte-identical until the index changes
+        
+        Providers cache long prompt prefixes (OpenAI from 1024 tokens), so
+        the system prompt, answer instructions and corpus preamble come
+        first and are only rebuilt on a new index version.
+        """
+        cached = self._prompt_prefix_cache
+        if cached is None or cached[0] != self.index_version:
+            prefix = "\n\n".join([SYSTEM_PROMPT, ANSWER_INSTRUCTIONS, corpus_preamble(self.live_chunks())])
+            cached = self._prompt_prefix_cache = (self.index_version, prefix)
+        return cached[1]
+    
+    def _build_messages(self, query: str, relevant_chunks: List[Dict],
+                        trace: QueryTrace = None, history: List[Dict] = ()) -> List[Dict]:
+        """Build the chat messages for a question and its retrieved chunks
+        
+        The static prefix is the system message; the user message holds the
+        context (packed by the context builder, in chunk ID order) and then
+        the question. Conversation history messages go in between and are
+        counted as part of the fixed prompt, so the context gets only the
+        budget they leave. The prompt tokens the builder saved against
+        including every chunk whole are added to the trace.
+        """
+        prefix = self._prompt_prefix()
+        packed = self._pack_context(query, relevant_chunks, trace, history)
+        if trace is not None:
+            trace.prompt_tokens_saved += packed["tokens_saved"]
+            trace.prompt_tokens_estimated |= packed["estimated"]
+        
+        return [
+            {"role": "system", "content": prefix},
+            *history,
+            {"role": "user", "content": USER_PROMPT_TEMPLATE.format(context=packed["context"], query=query)}
+        ]
+    
+    def _pack_context(self, query: str, relevant_chunks: List[Dict], trace: QueryTrace = None,
+                      history: List[Dict] = ()) -> Dict:
+        """Run the context builder and note on the trace which chunks the prompt holds"""
+        fixed = (self._prompt_prefix(), _USER_PROMPT_SKELETON) + tuple(message["content"] for message in history)
+        packed = self.context_builder.build(relevant_chunks, query, fixed, self.chat_model)
+        if trace is not None:
+            trace.context = {
+                "chunk_ids": [item["chunk"]["id"] for item in packed["chunks"]],
+                "duplicates": packed["duplicates"],
+                "dropped": packed["dropped"],
+            }
+        return packed
+    
+    @staticmethod
+    def _context_sources(relevant_chunks: List[Dict], trace: QueryTrace) -> List[Dict]:
+        """The retrieved sources the prompt actually held, in retrieval order"""
+        if trace.context is None:
+            return relevant_chunks
+        used = set(trace.context["chunk_ids"])
+        return [item for item in relevant_chunks if item["chunk"]["id"] in used]
+    
+    def _structured_answer(self, question: str, filters=None):
+        """Result for a numeric performance lookup answered from the table, or None
+        
+        Filtered queries always take the retrieval path, so the caller's
+        restriction is respected.
+        """
+        if not self.structured_answers or filters or not self.performance_table:
+            return None
+        hit = self.performance_table.answer(question)
+        if hit is None:
+            return None
+        return {
+            "question": question,
+            "answer": hit["answer"],
+            "sources": [{"chunk": chunk, "similarity": 1.0} for chunk in hit["chunks"]],
+            "cached": False,
+            "structured": True
+        }
+    
+    def _finish_query(self, result: Dict, trace: QueryTrace) -> Dict:
+        """Attach the timings and token usage to a result and report them
+        
+        Sources the context builder left out of the prompt move from
+        "sources" to "excluded_sources", marked "duplicate" or "over_budget".
+        """
+        if trace.context is not None and result.get("sources"):
+            reasons = dict.fromkeys(trace.context["dropped"], "over_budget")
+            reasons.update(dict.fromkeys(trace.context["duplicates"], "duplicate"))
+            result["excluded_sources"] = [dict(item, excluded=reasons[item["chunk"]["id"]])
+                                          for item in result["sources"] if item["chunk"]["id"] in reasons]
+            result["sources"] = self._context_sources(result["sources"], trace)
+        result.update(trace.finish())
+        if self.metrics is not None:
+            self.metrics.record(trace)
+        return result
+    
+    def query(self, question: str, top_k: int = 3, show_sources: bool = True, filters=None) -> Dict:
+        """Main query method - retrieves relevant info and generates answer
+        
+        The result carries per-stage "timings" (seconds), the completion's
+        token "usage" and the "prompt_tokens_saved" by context packing; all
+        also go to the metrics sink if one is set.
+        """
         print(f"\n🔍 Processing query: {question}")
+        trace = QueryTrace()
+        
+        result = self._structured_answer(question, filters)
+        if result is not None:
+            print("\n📊 Answered from the performance table")
+            trace.outcome = "structured"
+            return self._finish_query(result, trace)
         
         # Retrieve relevant chunks
-        relevant_chunks = self.retrieve_relevant_chunks(question, top_k=top_k)
+        with trace.stage("embed"):
+            query_embedding = self._embed_for_retrieval(question)
+        with trace.stage("retrieve"):
+            relevant_chunks = self._retrieve(question, query_embedding, top_k, filters)
         
         if show_sources:
             print("\n📚 Retrieved sources:")
@@ -256,34 +1081,269 @@ Please provide a clear, accurate answer based on the documentation above."""
                 print(f"  {i+1}. [{item['chunk']['metadata']['section']}] "
                       f"(similarity: {item['similarity']:.3f})")
         
-        # Generate response
-        print("\n💭 Generating response...")
-        answer = self.generate_response(question, relevant_chunks)
+        # Reuse the answer of an equivalent earlier question if possible
+        answer = self._cached_answer(query_embedding, relevant_chunks)
+        cached = answer is not None
+        if cached:
+            print("\n⚡ Answer served from cache")
+            trace.outcome = "cached"
+            # The same chunks pack the same way as when the answer was generated
+            self._pack_context(question, relevant_chunks, trace)
+        else:
+            print("\n💭 Generating response...")
+            answer = self.generate_response(question, relevant_chunks, trace=trace)
+            self._store_answer(query_embedding, relevant_chunks, answer)
         
-        return {
+        return self._finish_query({
             "question": question,
             "answer": answer,
-            "sources": relevant_chunks
-        }
+            "sources": relevant_chunks,
+            "cached": cached,
+            "structured": False
+        }, trace)
     
-    def save_index(self, filepath: str = "leakproof_index.json"):
-        """Save the chunks and embeddings to a file"""
-        data = {
-            "chunks": self.chunks,
-            "embeddings": self.embeddings
-        }
-        with open(filepath, 'w') as f:
-            json.dump(data, f)
-        print(f"Index saved to {filepath}")
-    
-    def load_index(self, filepath: str = "leakproof_index.json"):
-        """Load chunks and embeddings from a file"""
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-        self.chunks = data["chunks"]
-        self.embeddings = data["embeddings"]
-        print(f"Index loaded from {filepath}")
-
+    def query_stream(self, question: str, top_k: int = 3,
+                     filters=None) -> Iterator[Union[List[Dict], str]]:
+        """Streaming version of query
+        
+        The first item yielded is the list of retrieved sources, so they can be
+        shown before generation starts; every item after that is a piece of
+        the answer text. That tail plugs straight into st.write_stream:
+        
+            stream = rag.query_stream(question)
+            sources = next(stream)
+            answer = st.write_stream(stream)
+        
+        Timings and usage go to the metrics sink once the stream completes.
+        """
+        trace = QueryTrace()
+        result = self._structured_answer(question, filters)
+        if result is not None:
+            trace.outcome = "structured"
+            yield result["sources"]
+            yield result["answer"]
+            self._finish_query(result, trace)
+            return
+        
+        with trace.stage("embed"):
+            query_embedding = self._embed_for_retrieval(question)
+        with trace.stage("retrieve"):
+            relevant_chunks = self._retrieve(question, query_embedding, top_k, filters)
+        
+        # Sources are yielded after packing, so they match what the model sees
+        answer = self._cached_answer(query_embedding, relevant_chunks)
+        if answer is not None:
+            trace.outcome = "cached"
+            self._pack_context(question, relevant_chunks, trace)
+            yield self._context_sources(relevant_chunks, trace)
+            yield answer
+            self._finish_query({}, trace)
+            return
+        
+        with trace.stage("prompt"):
+            messages = self._build_messages(question, relevant_chunks, trace)
+        yield self._context_sources(relevant_chunks, trace)
+        pieces = []
+        for piece in self._stream_completion(messages, trace):
+            pieces.append(piece)
+            yield piece
+        # Only a fully streamed answer is cached
+        self._store_answer(query_embedding, relevant_chunks, "".join(pieces))
+        self._finish_query({}, trace)
+    
+    def query_batch(self, questions: List[str], top_k: int = 3, max_workers: int = 8,
+                    filters=None) -> List[Dict]:
+        """Answer many questions with one embedding request and concurrent generation
+        
+        Results come back in the order of questions, each shaped like the
+        result of query() plus an "error" field. A failed completion only
+        fails its own item. If the shared embedding request fails, retrieval
+        falls back to keyword search, or in vector mode every item carries
+        that error. Performance lookups answered from the table are left out
+        of the embedding request. Each item's timings include the shared
+        embed and retrieve stages of the batch.
+        """
+        print(f"\n🔍 Processing {len(questions)} queries")
+        batch = QueryTrace()
+        results = []
+        for question in questions:
+            result = self._structured_answer(question, filters)
+            if result is not None:
+                trace = QueryTrace(start=batch.start)
+                trace.outcome = "structured"
+                result = self._finish_query(dict(result, error=None), trace)
+            results.append(result)
+        remaining = [q for q, result in zip(questions, results) if result is None]
+        if remaining:
+            answered = iter(self._answer_batch(remaining, top_k, max_workers, filters, batch))
+            results = [next(answered) if result is None else result for result in results]
+        
+        failed = sum(1 for result in results if result["error"])
+        print(f"✅ Answered {len(results) - failed}/{len(results)} queries")
+        return results
+    
+    def _answer_batch(self, questions: List[str], top_k: int, max_workers: int,
+                      filters=None, batch: QueryTrace = None) -> List[Dict]:
+        """Retrieve for every question at once and generate the answers concurrently"""
+        batch = batch if batch is not None else QueryTrace()
+        query_embeddings = None
+        if not self._lexical_only():
+            try:
+                with batch.stage("embed"):
+                    query_embeddings = self.embed_queries(questions)
+            except Exception as e:
+                try:
+                    self._fall_back_to_keywords(e)
+                except Exception:
+                    results = []
+                    for q in questions:
+                        trace = QueryTrace(start=batch.start)
+                        trace.outcome = "error"
+                        results.append(self._finish_query(
+                            {"question": q, "answer": None, "sources": [], "cached": False,
+                             "structured": False, "error": str(e)}, trace))
+                    return results
+        
+        with batch.stage("retrieve"):
+            if query_embeddings is None:
+                query_embeddings = [None] * len(questions)
+                all_sources = [self._retrieve(q, None, top_k, filters) for q in questions]
+            else:
+                all_sources = self._retrieve_batch(questions, query_embeddings, top_k, filters)
+        
+        def answer(i: int) -> Dict:
+            trace = QueryTrace(start=batch.start)
+            trace.timings.update(batch.timings)
+            result = {"question": questions[i], "answer": None, "sources": all_sources[i],
+                      "cached": False, "structured": False, "error": None}
+            try:
+                cached_answer = self._cached_answer(query_embeddings[i], all_sources[i])
+                result["cached"] = cached_answer is not None
+                if cached_answer is None:
+                    result["answer"] = self.generate_response(questions[i], all_sources[i], trace=trace)
+                    self._store_answer(query_embeddings[i], all_sources[i], result["answer"])
+                else:
+                    trace.outcome = "cached"
+                    result["answer"] = cached_answer
+                    self._pack_context(questions[i], all_sources[i], trace)
+            except Exception as e:
+                trace.outcome = "error"
+                result["error"] = str(e)
+            return self._finish_query(result, trace)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(answer, range(len(questions))))
+    
+    def _answer_cache_version(self):
+        """Cached answers are only valid for the same index and chat model"""
+        return (self.index_version, self.chat_model)
+    
+    def _cached_answer(self, query_embedding: np.ndarray, relevant_chunks: List[Dict]):
+        if self.answer_cache is None or query_embedding is None:
+            return None
+        chunk_ids = [item["chunk"]["id"] for item in relevant_chunks]
+        return self.answer_cache.lookup(query_embedding, chunk_ids, self._answer_cache_version())
+    
+    def _store_answer(self, query_embedding: np.ndarray, relevant_chunks: List[Dict], answer: str):
+        if self.answer_cache is None or query_embedding is None:
+            return
+        chunk_ids = [item["chunk"]["id"] for item in relevant_chunks]
+        self.answer_cache.store(query_embedding, chunk_ids, answer, self._answer_cache_version())
+    
+    def save_index(self, path: str = "leakproof_index", dtype: str = "float32"):
+        """Save the chunks and embeddings to a binary index directory
+        
+        Use dtype="float16" to halve the size of the embedding file. Rows
+        removed by incremental updates are compacted away first.
+        """
+        self._compact_rows()
+        index_store.save_index(path, self.chunks, self.embeddings, self.embedding_model,
+                               dtype=dtype, embedding_dimensions=self.embedding_dimensions)
+        self.index_path = path
+        self.index_dtype = dtype
+        
+        ann_path = Path(path) / index_store.ANN_FILE
+        if self.ann_index is not None:
+            self.ann_index.save(ann_path)
+        elif ann_path.exists():
+            ann_path.unlink()
+        
+        quantized_path = Path(path) / index_store.QUANTIZED_FILE
+        if self.quantized_index is not None:
+            self.quantized_index.save(quantized_path)
+        elif quantized_path.exists():
+            quantized_path.unlink()
+        
+        if self.lexical_index is not None:
+            self.lexical_index.save(Path(path) / index_store.BM25_FILE)
+        self._delta_rows = 0
+        print(f"Index saved to {path}")
+    
+    def load_index(self, path: str = "leakproof_index", mmap: bool = True):
+        """Load chunks and embeddings from an index directory
+        
+        Embeddings are memory-mapped by default so loading is near-instant.
+        Legacy leakproof_index.json files are still accepted; convert them with
+        `python index_store.py convert leakproof_index.json leakproof_index`.
+        """
+        self._reset_rows()
+        if str(path).endswith(".json"):
+            chunks, embeddings = index_store.load_json_index(path)
+            self.chunks = chunks
+            self._set_embeddings(embeddings)
+            print(f"Index loaded from legacy JSON file {path}")
+            return
+        
+        header, chunks, embeddings = index_store.load_index(path, mmap=mmap)
+        if self.embedding_dimensions and header["count"] and header["dims"] != self.embedding_dimensions:
+            raise ValueError(f"Index {path} holds {header['dims']}-dimensional embeddings but "
+                             f"embedding_dimensions is {self.embedding_dimensions}")
+        self.chunks = chunks
+        # Rows were normalized before saving, so the (possibly memory-mapped)
+        # matrix is used as-is without touching every page
+        self.embeddings = embeddings
+        self.embedding_model = header["embedding_model"]
+        # Headers written before embedding_dimensions existed hold full-size vectors
+        self.embedding_dimensions = header.get("embedding_dimensions")
+        self.index_path = path
+        self.index_dtype = header["dtype"]
+        
+        # Saved ANN and quantized indexes are reused; missing or stale ones
+        # are rebuilt if enabled
+        rebuild = False
+        ann_path = Path(path) / index_store.ANN_FILE
+        if ann_path.exists():
+            self.ann_index = IVFIndex.load(ann_path)
+            self.ann_settings = {"nlist": self.ann_index.nlist, "nprobe": self.ann_index.nprobe}
+            rebuild |= self.ann_index.size != len(self.embeddings)
+        else:
+            rebuild |= self.ann_settings is not None
+        quantized_path = Path(path) / index_store.QUANTIZED_FILE
+        if quantized_path.exists():
+            self.quantized_index = QuantizedIndex.load(quantized_path)
+            self.quantization_settings = {"rerank": self.quantized_index.rerank,
+                                          "dims": self.quantized_index.dims}
+            rebuild |= self.quantized_index.size != len(self.embeddings)
+        else:
+            rebuild |= self.quantization_settings is not None
+        
+        # Saved BM25 postings spare re-tokenizing every chunk
+        bm25_path = Path(path) / index_store.BM25_FILE
+        lexical_index = BM25Index.load(bm25_path) if bm25_path.exists() else None
+        if lexical_index is not None and lexical_index.size != len(self.chunks):
+            lexical_index = None
+        
+        if rebuild:
+            self._index_changed(lexical_index=lexical_index)
+        else:
+            self.index_version += 1
+            self._build_chunk_indexes(lexical_index)
+        
+        # Incremental updates since the last full save
+        for removed, added, rows in index_store.load_deltas(path, header):
+            self._apply_update(removed, added, rows)
+            self._delta_rows += len(added)
+        print(f"Index loaded from {path}")
 
 def main():
     """Example usage of the RAG system"""
@@ -297,7 +1357,9 @@ def main():
     
     # Option 2: Use environment variable (recommended)
     try:
-        rag = LeakProofRAG()
+        cache = EmbeddingCache()
+        rag = LeakProofRAG(embedding_cache=cache, query_cache=QueryEmbeddingCache(disk_cache=cache),
+                           answer_cache=SemanticAnswerCache())
     except ValueError as e:
         print(f"\n❌ Error: {e}")
         print("\nPlease set your OpenAI API key:")
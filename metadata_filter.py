@@ -0,0 +1,200 @@
+"""
+Metadata Filtering for LeakProof RAG
+Per-field indexes over chunk metadata, so filtered retrieval only scores
+the matching rows of the embedding matrix
+
+Filters are a dict, a condition string, or a list of condition strings,
+all ANDed together:
+    {"section": "performance", "pump_flow": {">=": 25}}
+    {"type": ["performance_data", "technical_specs"]}     # in
+    "pump_flow >= 25"
+    ['section == "performance"', "pump_flow < 40"]
+"""
+
+import operator
+import re
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+from vectors import append_rows
+
+Filters = Union[Dict, str, Sequence[str]]
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+CONDITION_PATTERN = re.compile(r"^\s*(\w+)\s*(==|!=|>=|<=|>|<)\s*(.+?)\s*$")
+
+
+def _to_number(value):
+    """Metadata values like pump_flow are stored as strings; parse them if numeric"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value))
+    except ValueError:
+        return None
+
+
+def parse_condition(condition: str):
+    """Parse 'field op value' into (field, op, value); quotes mark a string value"""
+    match = CONDITION_PATTERN.match(condition)
+    if match is None:
+        raise ValueError(f"Cannot parse filter condition {condition!r}; expected e.g. 'pump_flow >= 25'")
+    field, op, raw = match.groups()
+    if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in "'\"":
+        return field, op, raw[1:-1]
+    number = _to_number(raw)
+    return field, op, raw if number is None else number
+
+
+def normalize_filters(filters: Filters) -> List[tuple]:
+    """Turn any supported filter form into a list of (field, op, value)"""
+    if not filters:
+        return []
+    if isinstance(filters, str):
+        return [parse_condition(filters)]
+    if isinstance(filters, dict):
+        conditions = []
+        for field, spec in filters.items():
+            if isinstance(spec, dict):
+                conditions.extend((field, op, value) for op, value in spec.items())
+            elif isinstance(spec, (list, tuple, set)):
+                conditions.append((field, "in", list(spec)))
+            else:
+                conditions.append((field, "==", spec))
+        return conditions
+    return [condition for item in filters for condition in normalize_filters(item)]
+
+
+def check_condition(field: str, op: str, value):
+    """Raise ValueError for an operator or value a metadata index cannot apply"""
+    if op == "in":
+        if not isinstance(value, (list, tuple, set)):
+            raise ValueError(f"'in' filter on '{field}' needs a list of values, got {value!r}")
+        return
+    if op in ("==", "!="):
+        return
+    if op not in COMPARISONS:
+        raise ValueError(f"Unsupported filter operator {op!r}; use one of: in, {', '.join(COMPARISONS)}")
+    if _to_number(value) is None:
+        raise ValueError(f"Range filter on '{field}' needs a numeric value, got {value!r}")
+
+
+def validate_filters(filters: Filters) -> List[tuple]:
+    """normalize_filters, also checking every operator and value up front"""
+    conditions = normalize_filters(filters)
+    for field, op, value in conditions:
+        check_condition(field, op, value)
+    return conditions
+
+
+class MetadataIndex:
+    """Column indexes over the metadata of a chunk list
+
+    Every field keeps, per distinct value, the sorted array of rows holding
+    that value (used for == / != / in), and a float column for fields with
+    numeric values (used for range comparisons). Building a mask costs
+    O(matching rows) for equality and one vectorized comparison for ranges.
+    Rows can be appended and removed; removed rows never match.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._rows_by_value: Dict[str, Dict[str, np.ndarray]] = {}
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._live = np.zeros(0, dtype=bool)
+        # Spare capacity behind the numeric columns and the live mask
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._live_buffer = None
+
+    def build(self, chunks: Sequence[Dict]) -> "MetadataIndex":
+        self.size = 0
+        self._rows_by_value = {}
+        self._numeric = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._buffers = {}
+        self._live_buffer = None
+        return self.add(chunks)
+
+    def add(self, chunks: Sequence[Dict]) -> "MetadataIndex":
+        """Index chunks as the next rows, touching only the values they hold"""
+        start, size = self.size, self.size + len(chunks)
+        rows_by_value: Dict[str, Dict[str, List[int]]] = {}
+        numbers: Dict[str, List[tuple]] = {}
+        for row, chunk in enumerate(chunks, start):
+            for field, value in chunk.get("metadata", {}).items():
+                rows_by_value.setdefault(field, {}).setdefault(str(value), []).append(row)
+                number = _to_number(value)
+                if number is not None:
+                    numbers.setdefault(field, []).append((row, number))
+
+        for field, values in rows_by_value.items():
+            indexed = self._rows_by_value.setdefault(field, {})
+            for value, rows in values.items():
+                rows = np.array(rows, dtype=np.int64)
+                indexed[value] = np.concatenate([indexed[value], rows]) if value in indexed else rows
+        # Numeric columns are widened with NaN for the new rows
+        for field in set(self._numeric) | set(numbers):
+            column = self._numeric.get(field, np.full(start, np.nan))
+            column, self._buffers[field] = append_rows(column, self._buffers.get(field),
+                                                       np.full(len(chunks), np.nan))
+            for row, number in numbers.get(field, ()):
+                column[row] = number
+            self._numeric[field] = column
+        self._live, self._live_buffer = append_rows(self._live, self._live_buffer,
+                                                    np.ones(len(chunks), dtype=bool))
+        self.size = size
+        return self
+
+    def remove(self, rows: Sequence[int]):
+        """Stop matching rows; their row numbers are not reused"""
+        self._live[np.asarray(rows, dtype=np.int64)] = False
+
+    def _equal_mask(self, field: str, value) -> np.ndarray:
+        number = _to_number(value) if not isinstance(value, str) else None
+        if number is not None and field in self._numeric:
+            return self._numeric[field] == number
+        mask = np.zeros(self.size, dtype=bool)
+        rows = self._rows_by_value.get(field, {}).get(str(value))
+        if rows is not None:
+            mask[rows] = True
+        return mask
+
+    def _condition_mask(self, field: str, op: str, value) -> np.ndarray:
+        if op == "in":
+            mask = np.zeros(self.size, dtype=bool)
+            for item in value:
+                mask |= self._equal_mask(field, item)
+            return mask
+        if op == "==":
+            return self._equal_mask(field, value)
+        if op == "!=":
+            return ~self._equal_mask(field, value)
+        check_condition(field, op, value)
+
+        number = _to_number(value)
+        column = self._numeric.get(field)
+        if column is None:
+            return np.zeros(self.size, dtype=bool)
+        # NaN (missing or non-numeric) compares False, so those rows drop out
+        return COMPARISONS[op](column, number)
+
+    def mask(self, filters: Filters) -> np.ndarray:
+        """Boolean mask of the rows matching every condition"""
+        mask = self._live.copy()
+        for field, op, value in normalize_filters(filters):
+            mask &= self._condition_mask(field, op, value)
+        return mask
+
+    def rows(self, filters: Filters) -> np.ndarray:
+        """Indices of the rows matching every condition"""
+        return np.flatnonzero(self.mask(filters))
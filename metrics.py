@@ -0,0 +1,231 @@
+"""
+Query Metrics for LeakProof RAG
+Per-stage timings and token usage of each query, and pluggable sinks that
+aggregate them: in-memory percentiles for dashboards and Prometheus text
+exposition for scraping
+
+Stages recorded by LeakProofRAG (seconds):
+    embed     - query embedding (zero when served from the query cache)
+    retrieve  - similarity scoring, keyword search and fusion
+    prompt    - building the chat messages
+    generate  - the chat completion (for streams, until the last token)
+    first_token - streams only: time from the start of the query to the first token
+    total     - the whole query
+
+Usage:
+    rag.metrics = InMemoryMetrics()
+    rag.query("...")
+    rag.metrics.percentiles("total")    # {"p50": ..., "p95": ...}
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+# Prometheus histogram buckets in seconds, spanning cache hits to slow completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _field(value, name: str):
+    return value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+
+
+class QueryTrace:
+    """Stage timings and token usage collected while answering one query
+
+    outcome is how the answer was produced: "generated", "cached",
+    "structured" or "error". start lets batch items share the batch's clock.
+    prompt_tokens_saved counts the context tokens the context builder left
+    out (duplicates, chunks over the token budget); prompt_tokens_estimated
+    marks it as a character-based estimate when tiktoken is unavailable.
+    context holds the chunk IDs it packed into the prompt and those it left
+    out, once packed.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.timings: Dict[str, float] = {}
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self.outcome = "generated"
+        self.prompt_tokens_saved = 0
+        self.prompt_tokens_estimated = False
+        self.context: Optional[Dict] = None
+        self.start = time.perf_counter() if start is None else start
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; repeated stages add up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def mark(self, name: str):
+        """Record the time elapsed since the query started, e.g. the first token"""
+        self.timings.setdefault(name, time.perf_counter() - self.start)
+
+    def add_usage(self, usage):
+        """Add the token counts of a chat completion's usage (object or dict)
+
+        cached_tokens, the prompt tokens served from the provider's prompt
+        cache, comes from usage.prompt_tokens_details.
+        """
+        if usage is None:
+            return
+        details = _field(usage, "prompt_tokens_details")
+        self.usage["cached_tokens"] += (_field(details, "cached_tokens") if details is not None else 0) or 0
+        for key in ("prompt_tokens", "completion_tokens"):
+            self.usage[key] += _field(usage, key) or 0
+
+    def finish(self) -> Dict:
+        """Stop the clock; returns the "timings", "usage", "prompt_tokens_saved"
+        and "prompt_tokens_estimated" fields of a result"""
+        self.timings["total"] = time.perf_counter() - self.start
+        return {"timings": dict(self.timings), "usage": dict(self.usage),
+                "prompt_tokens_saved": self.prompt_tokens_saved,
+                "prompt_tokens_estimated": self.prompt_tokens_estimated}
+
+
+class MetricsSink(ABC):
+    """Receives finished query traces; subclasses aggregate them"""
+
+    @abstractmethod
+    def record(self, trace: QueryTrace):
+        """Add one finished query"""
+
+
+class InMemoryMetrics(MetricsSink):
+    """Keeps the most recent samples per stage for percentile queries
+
+    Memory is bounded by max_samples per stage; counters are kept forever.
+    """
+
+    def __init__(self, max_samples: int = 10_000):
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, trace: QueryTrace):
+        with self._lock:
+            for stage, seconds in trace.timings.items():
+                self._samples.setdefault(stage, deque(maxlen=self.max_samples)).append(seconds)
+            self._increment("queries")
+            self._increment(f"queries_{trace.outcome}")
+            for key, value in trace.usage.items():
+                self._increment(key, value)
+            self._increment("prompt_tokens_saved", trace.prompt_tokens_saved)
+            if trace.prompt_tokens_estimated:
+                self._increment("prompt_tokens_saved_estimated", trace.prompt_tokens_saved)
+
+    def _increment(self, name: str, value: int = 1):
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def percentiles(self, stage: str = "total", quantiles: Sequence[float] = (50, 95)) -> Dict[str, float]:
+        """{"p50": seconds, "p95": seconds} over the recent samples of a stage (empty if none)"""
+        with self._lock:
+            samples = np.array(self._samples.get(stage, ()), dtype=np.float64)
+        if not len(samples):
+            return {}
+        values = np.percentile(samples, quantiles)
+        return {f"p{q:g}": float(value) for q, value in zip(quantiles, values)}
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, mean, p50, p95 and p99 of every stage"""
+        with self._lock:
+            stages = {stage: np.array(samples) for stage, samples in self._samples.items()}
+        return {
+            stage: {"count": len(samples), "mean": float(samples.mean()),
+                    **{f"p{q}": float(np.percentile(samples, q)) for q in (50, 95, 99)}}
+            for stage, samples in stages.items() if len(samples)
+        }
+
+
+class PrometheusMetrics(MetricsSink):
+    """Cumulative histograms and counters rendered in Prometheus text format
+
+    Exposes rag_stage_seconds{stage=...} histograms, rag_queries_total
+    {outcome=...}, rag_tokens_total{kind=...} and
+    rag_prompt_tokens_saved_total counters, the last split into
+    {counting="tiktoken"} and {counting="estimate"} (character estimate,
+    without tiktoken). Serve exposition() from a /metrics endpoint.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, namespace: str = "rag"):
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._histograms: Dict[str, Dict] = {}
+        self._queries: Dict[str, int] = {}
+        self._tokens: Dict[str, int] = {}
+        self._tokens_saved = {"tiktoken": 0, "estimate": 0}
+        self._lock = threading.Lock()
+
+    def record(self, trace: QueryTrace):
+        with self._lock:
+            for stage, seconds in trace.timings.items():
+                histogram = self._histograms.setdefault(
+                    stage, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                )
+                for i, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        histogram["counts"][i] += 1
+                histogram["sum"] += seconds
+                histogram["count"] += 1
+            self._queries[trace.outcome] = self._queries.get(trace.outcome, 0) + 1
+            for key, value in trace.usage.items():
+                kind = key.replace("_tokens", "")
+                self._tokens[kind] = self._tokens.get(kind, 0) + value
+            counting = "estimate" if trace.prompt_tokens_estimated else "tiktoken"
+            self._tokens_saved[counting] += trace.prompt_tokens_saved
+
+    def exposition(self) -> str:
+        """Current values in the Prometheus text exposition format (version 0.0.4)"""
+        ns = self.namespace
+        lines = [f"# HELP {ns}_stage_seconds Latency of each query stage",
+                 f"# TYPE {ns}_stage_seconds histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram["counts"]):
+                    lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {count}')
+                lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'{ns}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+                lines.append(f'{ns}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+            lines += [f"# HELP {ns}_queries_total Queries answered, by how the answer was produced",
+                      f"# TYPE {ns}_queries_total counter"]
+            lines += [f'{ns}_queries_total{{outcome="{outcome}"}} {count}'
+                      for outcome, count in sorted(self._queries.items())]
+            lines += [f"# HELP {ns}_tokens_total Chat completion tokens used; cached prompt tokens are also counted as prompt",
+                      f"# TYPE {ns}_tokens_total counter"]
+            lines += [f'{ns}_tokens_total{{kind="{kind}"}} {count}'
+                      for kind, count in sorted(self._tokens.items())]
+            lines += [f"# HELP {ns}_prompt_tokens_saved_total Context tokens left out by the context builder, "
+                      f"by how they were counted",
+                      f"# TYPE {ns}_prompt_tokens_saved_total counter"]
+            lines += [f'{ns}_prompt_tokens_saved_total{{counting="{counting}"}} {count}'
+                      for counting, count in sorted(self._tokens_saved.items())]
+        return "\n".join(lines) + "\n"
+
+
+class MultiSink(MetricsSink):
+    """Forward every trace to several sinks"""
+
+    def __init__(self, *sinks: MetricsSink):
+        self.sinks = sinks
+
+    def record(self, trace: QueryTrace):
+        for sink in self.sinks:
+            sink.record(trace)
+
+    def find(self, sink_type: type) -> Optional[MetricsSink]:
+        """The first sink of a type, e.g. to serve PrometheusMetrics.exposition()"""
+        return next((sink for sink in self.sinks if isinstance(sink, sink_type)), None)
@@ -0,0 +1,171 @@
+"""
+PDF Ingestion for LeakProof RAG
+Streams PDF pages into section-aware chunks shaped like the curated chunks
+in LeakProofRAG._create_chunks:
+
+    {"id": "leakproof_drive_p2_0",
+     "text": "Hydraulic Drive Unit Specifications:\\n- Cylinder Bore Size: ...",
+     "metadata": {"section": "hydraulic_drive_unit_specifications",
+                  "type": "document_text", "page": 2,
+                  "source": "leakproof_drive.pdf"}}
+
+Files found in a directory are named by their path relative to it
+("manuals/2019/manual.pdf" -> source "2019/manual.pdf"), so files with the
+same name in different folders stay distinct documents.
+"""
+
+import hashlib
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # Optional dependency, only needed for real PDFs
+    PdfReader = None
+
+DEFAULT_MAX_CHUNK_CHARS = 1500
+PUMP_FLOW_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:gallons?|gal)\s*(?:/|per\s+)\s*min", re.IGNORECASE)
+
+
+def _slugify(text: str, max_words: Optional[int] = 6) -> str:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return "_".join(words[:max_words]) or "document"
+
+
+def document_name(pdf_path, root=None) -> str:
+    """A document's source name: its path relative to root, or its file name"""
+    path = Path(pdf_path)
+    if root is None:
+        return path.name
+    return path.resolve().relative_to(Path(root).resolve()).as_posix()
+
+
+def document_id(name: str) -> str:
+    """Chunk id prefix of a document, unique per source name
+
+    A name that is already a plain slug ("manual.pdf" -> "manual") is used
+    as is; any other name ("2019/manual.pdf", "Manual-v2.pdf") gets a short
+    hash of the full name, so names that slugify the same stay apart.
+    """
+    stem = name[:-len(Path(name).suffix)] if Path(name).suffix else name
+    slug = _slugify(stem, max_words=None)
+    if slug == stem:
+        return slug
+    return f"{slug}_{hashlib.sha1(name.encode('utf-8')).hexdigest()[:6]}"
+
+
+def _is_heading(line: str) -> bool:
+    """Short lines ending in a colon or written in capitals start a new section"""
+    if not line or len(line) > 80 or line.startswith(("-", "•", "*")):
+        return False
+    letters = [c for c in line if c.isalpha()]
+    return line.endswith(":") or (len(letters) >= 3 and all(c.isupper() for c in letters))
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) one page at a time"""
+    if PdfReader is None:
+        raise ImportError("pypdf is required to read PDF files. Run: pip install pypdf")
+    reader = PdfReader(str(pdf_path))
+    for number, page in enumerate(reader.pages, 1):
+        yield number, page.extract_text() or ""
+
+
+def _make_chunk(name: str, page: int, index: int, heading: str, lines: List[str]) -> Dict:
+    text = "\n".join(lines)
+    metadata = {"section": _slugify(heading), "type": "document_text",
+                "page": page, "source": name}
+
+    flow = PUMP_FLOW_PATTERN.search(heading)
+    if flow and heading.lower().startswith("performance"):
+        metadata.update(section="performance", type="performance_data", pump_flow=flow.group(1))
+
+    return {"id": f"{document_id(name)}_p{page}_{index}", "text": text, "metadata": metadata}
+
+
+def iter_document_chunks(pdf_path: str, max_chunk_chars: int = DEFAULT_MAX_CHUNK_CHARS,
+                         root: Optional[str] = None) -> Iterator[Dict]:
+    """Stream chunks from a PDF without holding more than one page in memory
+
+    A chunk starts at each heading and is split when it grows past
+    max_chunk_chars. Chunks never span pages, so each has a single page
+    number, but the current section carries over to the next page. With
+    root, the source name is the path relative to root.
+    """
+    source = Path(pdf_path)
+    name = document_name(source, root)
+    heading = None
+    for page, page_text in iter_pdf_pages(source):
+        lines: List[str] = []
+        size = 0
+        index = 0
+        has_body = False
+        for raw_line in page_text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+            if _is_heading(line) and lines and not has_body:
+                # Consecutive headings ("IDEAL FOR" / "HIGH-MOISTURE LOADS") stay together
+                heading = line.rstrip(":")
+                lines.append(line)
+                size += len(line)
+                continue
+            if _is_heading(line) or (lines and size + len(line) > max_chunk_chars):
+                if lines:
+                    yield _make_chunk(name, page, index, heading or source.stem, lines)
+                    index += 1
+                    lines, size, has_body = [], 0, False
+                if _is_heading(line):
+                    heading = line.rstrip(":")
+                    lines, size = [line], len(line)
+                    continue
+            if not lines and heading:
+                # A section continuing from an earlier chunk repeats its heading
+                lines = [f"{heading} (continued):"]
+            lines.append(line)
+            size += len(line)
+            has_body = True
+        if lines:
+            yield _make_chunk(name, page, index, heading or source.stem, lines)
+
+
+def _chunk_file(pdf_path, max_chunk_chars: int, root: str) -> List[Dict]:
+    return list(iter_document_chunks(pdf_path, max_chunk_chars, root))
+
+
+def iter_directory_chunks(directory: str, max_workers: int = None, pattern: str = "*.pdf",
+                          max_chunk_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> Iterator[Dict]:
+    """Parse every PDF in a directory across a process pool
+
+    Subdirectories are searched too. Chunks are yielded file by file in
+    sorted path order as soon as each file is done, so callers can start
+    embedding before parsing finishes. At most two files per worker are
+    parsed ahead of the consumer, so memory stays bounded however many
+    files there are.
+    """
+    files = sorted(Path(directory).rglob(pattern))
+    if not files:
+        return
+    max_workers = min(max_workers or os.cpu_count() or 1, len(files))
+    if max_workers == 1:
+        for pdf_path in files:
+            yield from iter_document_chunks(pdf_path, max_chunk_chars, directory)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        remaining = iter(files)
+        for pdf_path in remaining:
+            pending.append(pool.submit(_chunk_file, pdf_path, max_chunk_chars, directory))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            chunks = pending.popleft().result()
+            pdf_path = next(remaining, None)
+            if pdf_path is not None:
+                pending.append(pool.submit(_chunk_file, pdf_path, max_chunk_chars, directory))
+            yield from chunks
@@ -0,0 +1,241 @@
+"""
+Performance Table for LeakProof RAG
+Structured pump-flow performance data extracted from the performance_data
+chunks at index time, so numeric lookups ("floor speed at 30 GPM") are
+answered from the table without an embedding call or a chat completion
+
+Flows between two listed rows are interpolated; flows outside the listed
+range are never extrapolated and fall through to the normal RAG path, as
+do questions about a trailer length the table does not list.
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+LITERS_PER_GALLON = 3.78541
+METERS_PER_FOOT = 0.3048
+# The document's l/min column is rounded, so a liter flow this close to a
+# listed value is that row rather than a converted, interpolated flow
+LPM_TOLERANCE = 1.0
+
+NUMBER = r"(\d+(?:\.\d+)?)"
+FLOW_LINE = re.compile(NUMBER + r"\s*gallons?\s*/\s*minute\s*\(\s*" + NUMBER + r"\s*l\s*/\s*min", re.I)
+SPEED_LINE = re.compile(r"floor speed:\s*" + NUMBER + r"\s*ft\s*/\s*minute\s*\(\s*" + NUMBER + r"\s*m\s*/", re.I)
+UNLOAD_LINE = re.compile(r"unloading time for\s*" + NUMBER + r"\s*ft trailer:\s*" + NUMBER + r"\s*minutes?([^\n]*)", re.I)
+
+# Flow mentioned in a question, in US gallons or liters per minute
+GALLON_FLOW = re.compile(NUMBER + r"\s*(?:gpm\b|gal(?:lons?)?\s*(?:/|per)\s*min)", re.I)
+LITER_FLOW = re.compile(NUMBER + r"\s*(?:lpm\b|l\s*/\s*min|lit(?:er|re)s?\s*(?:/|per)\s*min)", re.I)
+SPEED_WORDS = re.compile(r"\b(?:floor speed|speed|how fast|ft\s*/\s*min|feet per minute)\b", re.I)
+UNLOAD_WORDS = re.compile(r"\b(?:unload\w*|load time)\b", re.I)
+# "how long" only asks for unloading time when it is about the load or trailer
+HOW_LONG_UNLOAD = re.compile(r"\bhow long\b.*\b(?:trailer|load|empty)\b", re.I)
+TRAILER_LENGTH = re.compile(NUMBER + r"\s*-?\s*(?:ft\b\.?|foot\b|feet\b|')\s*(?:long\s+)?trailer", re.I)
+PERFORMANCE_WORDS = re.compile(r"\bperformance\b", re.I)
+
+
+def parse_performance_chunk(chunk: Dict) -> Optional[Dict]:
+    """Extract one table row from a performance_data chunk, or None if it does not parse"""
+    text = chunk["text"]
+    flow, speed, unload = FLOW_LINE.search(text), SPEED_LINE.search(text), UNLOAD_LINE.search(text)
+    if flow is None or speed is None or unload is None:
+        return None
+    return {
+        "pump_flow_gpm": float(flow.group(1)),
+        "pump_flow_lpm": float(flow.group(2)),
+        "floor_speed_ft_min": float(speed.group(1)),
+        "floor_speed_m_min": float(speed.group(2)),
+        "trailer_length_ft": float(unload.group(1)),
+        "unload_minutes": float(unload.group(2)),
+        "note": unload.group(3).strip(" ()") or None,
+        "chunk_id": chunk["id"],
+    }
+
+
+def parse_question(question: str) -> Optional[Dict]:
+    """Classify a question as a performance lookup
+
+    Returns {"pump_flow_gpm", "pump_flow_lpm", "trailer_length_ft", "fields"}
+    when the question names exactly one pump flow and asks for floor speed,
+    unloading time or performance in general; None for anything else.
+    pump_flow_lpm is set when the flow was given in liters, and
+    trailer_length_ft when the question names a trailer length.
+    """
+    gallons = [float(value) for value in GALLON_FLOW.findall(question)]
+    liters = [float(value) for value in LITER_FLOW.findall(question)]
+    if len(gallons) + len(liters) != 1:
+        return None
+    lengths = [float(value) for value in TRAILER_LENGTH.findall(question)]
+    if len(lengths) > 1:
+        return None
+
+    fields = []
+    if SPEED_WORDS.search(question):
+        fields.append("floor_speed")
+    if UNLOAD_WORDS.search(question) or HOW_LONG_UNLOAD.search(question):
+        fields.append("unload_time")
+    if not fields and PERFORMANCE_WORDS.search(question):
+        fields = ["floor_speed", "unload_time"]
+    if not fields:
+        return None
+    return {
+        "pump_flow_gpm": gallons[0] if gallons else liters[0] / LITERS_PER_GALLON,
+        "pump_flow_lpm": liters[0] if liters else None,
+        "trailer_length_ft": lengths[0] if lengths else None,
+        "fields": fields,
+    }
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+class PerformanceTable:
+    """Pump flow -> floor speed / unloading time table
+
+    Rows are sorted by flow. Floor speed is interpolated linearly in flow;
+    unloading time is interpolated through its reciprocal (the unloading
+    rate), since time is inversely proportional to floor speed.
+    """
+
+    def __init__(self):
+        self.rows: List[Dict] = []
+        self.chunks: Dict[str, Dict] = {}
+        # Parsed row of every performance chunk, by chunk id
+        self._parsed: Dict[str, Dict] = {}
+        self._flows = np.zeros(0)
+        self._speeds = np.zeros(0)
+        self._unload_rates = np.zeros(0)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def build(self, chunks: Sequence[Dict]) -> "PerformanceTable":
+        self.chunks = {}
+        self._parsed = {}
+        return self.update(chunks)
+
+    def update(self, added: Sequence[Dict] = (), removed: Sequence[Dict] = ()) -> "PerformanceTable":
+        """Drop removed chunks and parse added ones; other chunks are not re-read"""
+        for chunk in removed:
+            self.chunks.pop(chunk["id"], None)
+            self._parsed.pop(chunk["id"], None)
+        for chunk in added:
+            metadata = chunk.get("metadata", {})
+            if metadata.get("type") != "performance_data" or "pump_flow" not in metadata:
+                continue
+            row = parse_performance_chunk(chunk)
+            if row is not None:
+                self._parsed[chunk["id"]] = row
+                self.chunks[chunk["id"]] = chunk
+
+        # The latest chunk for a flow wins
+        by_flow = {row["pump_flow_gpm"]: row for row in self._parsed.values()}
+        self.rows = [by_flow[flow] for flow in sorted(by_flow)]
+        self._flows = np.array([row["pump_flow_gpm"] for row in self.rows])
+        self._speeds = np.array([row["floor_speed_ft_min"] for row in self.rows])
+        self._unload_rates = np.array([1.0 / row["unload_minutes"] for row in self.rows])
+        return self
+
+    def lookup(self, pump_flow_gpm: float) -> Optional[Dict]:
+        """Table row for a flow, interpolated between listed flows
+
+        Listed flows return the document's own values (including its metric
+        figures); interpolated rows convert units here. Returns None outside
+        the listed range.
+        """
+        if not self.rows or not self._flows[0] - 1e-6 <= pump_flow_gpm <= self._flows[-1] + 1e-6:
+            return None
+        exact = np.flatnonzero(np.abs(self._flows - pump_flow_gpm) < 0.05)
+        if len(exact):
+            return dict(self.rows[exact[0]], interpolated=False)
+
+        speed = float(np.interp(pump_flow_gpm, self._flows, self._speeds))
+        unload = 1.0 / float(np.interp(pump_flow_gpm, self._flows, self._unload_rates))
+        right = int(np.searchsorted(self._flows, pump_flow_gpm))
+        low, high = self.rows[right - 1], self.rows[right]
+        return {
+            "pump_flow_gpm": pump_flow_gpm,
+            "pump_flow_lpm": round(pump_flow_gpm * LITERS_PER_GALLON),
+            "floor_speed_ft_min": round(speed, 2),
+            "floor_speed_m_min": round(speed * METERS_PER_FOOT, 2),
+            # Unloading times are only comparable when both rows use the same trailer
+            "trailer_length_ft": high["trailer_length_ft"]
+            if low["trailer_length_ft"] == high["trailer_length_ft"] else None,
+            "unload_minutes": round(unload, 1),
+            "note": None,
+            "chunk_id": None,
+            "interpolated": True,
+            "between": [low, high],
+        }
+
+    def lookup_lpm(self, pump_flow_lpm: float) -> Optional[Dict]:
+        """Table row for a flow in liters per minute
+
+        Matches the listed l/min column within LPM_TOLERANCE first, since
+        those figures are rounded and would not convert back exactly; other
+        flows are converted and looked up as gallons.
+        """
+        for row in self.rows:
+            if abs(row["pump_flow_lpm"] - pump_flow_lpm) <= LPM_TOLERANCE:
+                return dict(row, interpolated=False)
+        return self.lookup(pump_flow_lpm / LITERS_PER_GALLON)
+
+    def answer(self, question: str) -> Optional[Dict]:
+        """Answer a performance lookup from the table
+
+        Returns {"answer", "row", "chunks"} (the chunks the values come
+        from), or None when the question is not a lookup this table can
+        answer.
+        """
+        request = parse_question(question)
+        if request is None:
+            return None
+        if request["pump_flow_lpm"] is not None:
+            row = self.lookup_lpm(request["pump_flow_lpm"])
+        else:
+            row = self.lookup(request["pump_flow_gpm"])
+        if row is None:
+            return None
+        # The table only holds times for its own trailer length
+        if "unload_time" in request["fields"] and row["trailer_length_ft"] is None:
+            return None
+        wanted = request["trailer_length_ft"]
+        if wanted is not None and abs(wanted - (row["trailer_length_ft"] or 0)) > 0.5:
+            return None
+
+        flow = f"{_format_number(row['pump_flow_gpm'])} gallons/minute ({_format_number(row['pump_flow_lpm'])} l/minute)"
+        lines = []
+        if "floor_speed" in request["fields"]:
+            lines.append(f"- Floor Speed: {_format_number(row['floor_speed_ft_min'])} ft/minute "
+                         f"({_format_number(row['floor_speed_m_min'])} m/minute)")
+        if "unload_time" in request["fields"]:
+            note = f" ({row['note']})" if row["note"] else ""
+            lines.append(f"- Unloading Time for {_format_number(row['trailer_length_ft'])} ft Trailer: "
+                         f"{_format_number(row['unload_minutes'])} minutes{note}")
+
+        if row["interpolated"]:
+            low, high = row["between"]
+            header = (f"Estimated performance at {flow}, interpolated between the listed "
+                      f"{_format_number(low['pump_flow_gpm'])} and {_format_number(high['pump_flow_gpm'])} "
+                      f"gallons/minute rates:")
+            chunk_ids = [low["chunk_id"], high["chunk_id"]]
+        else:
+            header = f"Performance at {flow}:"
+            chunk_ids = [row["chunk_id"]]
+        return {"answer": "\n".join([header] + lines), "row": row,
+                "chunks": [self.chunks[chunk_id] for chunk_id in chunk_ids]}
+
+    def summary(self) -> str:
+        """All rows as a plain-text table"""
+        lines = ["Pump Flow | Floor Speed | Unloading Time"]
+        for row in self.rows:
+            note = f" ({row['note']})" if row["note"] else ""
+            lines.append(
+                f"{_format_number(row['pump_flow_gpm'])} gpm ({_format_number(row['pump_flow_lpm'])} l/min) | "
+                f"{_format_number(row['floor_speed_ft_min'])} ft/min ({_format_number(row['floor_speed_m_min'])} m/min) | "
+                f"{_format_number(row['unload_minutes'])} min for {_format_number(row['trailer_length_ft'])} ft{note}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,164 @@
+"""
+Quantized Embedding Search for LeakProof RAG
+Scalar int8 codes of the embedding matrix, one scale per vector, used to
+generate candidates; the best candidates are re-ranked against the stored
+float32/float16 vectors
+
+Only the int8 codes need to stay in memory: with a memory-mapped index the
+float matrix is read just for the few re-ranked rows, so resident memory
+per chunk drops 4x against float32.
+
+With dims set, only the leading dimensions of each vector are quantized
+(Matryoshka truncation: text-embedding-3 vectors are trained so their
+prefixes are embeddings too), making the first stage smaller and faster
+again; re-ranking still uses the full vectors.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from vectors import append_rows, top_k_indices
+
+# Codes are widened to float32 in blocks of this many bytes, small enough to
+# stay in cache, so scoring streams 1 byte per dimension from memory
+_BLOCK_BYTES = 512 * 1024
+
+
+class QuantizedIndex:
+    """int8 codes with a per-row scale; row i is approximately codes[i] * scales[i]
+
+    Tuning knobs:
+        rerank  - candidates per requested result that are re-scored with
+                  the float vectors; higher means better recall and more
+                  float rows read per query
+        dims    - leading dimensions scored in the first stage (renormalized
+                  per row); None scores the whole vector
+    """
+
+    def __init__(self, rerank: int = 4, dims: Optional[int] = None):
+        self.rerank = rerank
+        self.dims = dims
+        self.codes = np.zeros((0, 0), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+        # Rows removed since the last build, never returned by search
+        self.deleted = None
+        self._codes_buffer = None
+        self._scales_buffer = None
+        self._deleted_buffer = None
+
+    @property
+    def size(self) -> int:
+        """Number of quantized rows"""
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the codes and scales"""
+        return self.codes.nbytes + self.scales.nbytes
+
+    def _quantize(self, embeddings: np.ndarray, dims: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(embeddings)
+        truncated = n and dims < embeddings.shape[1]
+        codes = np.empty((n, dims), dtype=np.int8)
+        scales = np.empty(n, dtype=np.float32)
+        block_rows = max(1, _BLOCK_BYTES // max(1, dims * 4))
+        for start in range(0, n, block_rows):
+            block = np.asarray(embeddings[start:start + block_rows, :dims], dtype=np.float32)
+            if truncated:
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                block = block / norms
+            block_scales = np.abs(block).max(axis=1) / 127.0
+            block_scales[block_scales == 0] = 1.0
+            codes[start:start + len(block)] = np.rint(block / block_scales[:, None])
+            scales[start:start + len(block)] = block_scales
+        return codes, scales
+
+    def build(self, embeddings: np.ndarray) -> "QuantizedIndex":
+        """Quantize every row (or its leading dims) symmetrically to [-127, 127]"""
+        dims = min(self.dims or embeddings.shape[1], embeddings.shape[1]) if len(embeddings) else 0
+        self.codes, self.scales = self._quantize(embeddings, dims)
+        self.deleted = None
+        self._codes_buffer = self._scales_buffer = self._deleted_buffer = None
+        return self
+
+    def add(self, embeddings: np.ndarray):
+        """Quantize new rows and append them, leaving the existing codes as they are"""
+        if not self.size:
+            self.build(embeddings)
+            return
+        codes, scales = self._quantize(embeddings, self.codes.shape[1])
+        self.codes, self._codes_buffer = append_rows(self.codes, self._codes_buffer, codes)
+        self.scales, self._scales_buffer = append_rows(self.scales, self._scales_buffer, scales)
+        if self.deleted is not None:
+            self.deleted, self._deleted_buffer = append_rows(self.deleted, self._deleted_buffer,
+                                                             np.zeros(len(codes), dtype=bool))
+
+    def remove(self, rows: Sequence[int]):
+        """Exclude rows from search; their codes stay until the next build"""
+        if self.deleted is None:
+            self.deleted, self._deleted_buffer = np.zeros(self.size, dtype=bool), None
+        self.deleted[np.asarray(rows, dtype=np.int64)] = True
+
+    def scores(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Approximate similarity of every row (or of the given rows) to a query"""
+        codes = self.codes if rows is None else self.codes[rows]
+        scales = self.scales if rows is None else self.scales[rows]
+        query = np.ascontiguousarray(query[:codes.shape[1]])
+        scores = np.empty(len(codes), dtype=np.float32)
+        block_rows = max(1, _BLOCK_BYTES // max(1, codes.shape[1] * 4))
+        buffer = np.empty((min(block_rows, len(codes)), codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), block_rows):
+            block = buffer[:len(codes[start:start + block_rows])]
+            block[...] = codes[start:start + block_rows]
+            np.matmul(block, query, out=scores[start:start + len(block)])
+        scores *= scales
+        return scores
+
+    def search(self, embeddings: np.ndarray, query: np.ndarray, top_k: int,
+               rows: np.ndarray = None, rerank: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, exact scores) of the top_k rows for a query
+
+        The top_k * rerank rows by int8 score are re-scored with the float
+        vectors. If rows is given, only those rows are candidates.
+        """
+        approx = self.scores(query, rows)
+        if rows is None and self.deleted is not None:
+            approx[self.deleted] = -np.inf
+        candidates = top_k_indices(approx, top_k * (rerank or self.rerank))
+        candidates = candidates[np.isfinite(approx[candidates])]
+        if rows is not None:
+            candidates = rows[candidates]
+        candidates.sort()  # Sequential access keeps memory-mapped reads local
+        exact = np.asarray(embeddings[candidates], dtype=np.float32) @ query
+        best = top_k_indices(exact, top_k)
+        return candidates[best], exact[best]
+
+    def save(self, path: str):
+        np.savez(path, codes=self.codes, scales=self.scales, rerank=self.rerank, dims=self.dims or 0)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        with np.load(path) as data:
+            dims = int(data["dims"]) if "dims" in data else 0
+            index = cls(rerank=int(data["rerank"]), dims=dims or None)
+            index.codes = data["codes"]
+            index.scales = data["scales"]
+        return index
+
+
+def recall_at_k(embeddings: np.ndarray, index: QuantizedIndex, queries: Sequence[np.ndarray],
+                k: int = 10, rerank: Optional[int] = None) -> float:
+    """Fraction of the exact top-k rows that the quantized search also returns
+
+    rerank=1 measures the int8 scores alone, without re-ranking.
+    """
+    found = 0
+    total = 0
+    for query in queries:
+        exact = set(top_k_indices(np.asarray(embeddings @ query, dtype=np.float32), k).tolist())
+        approx = set(index.search(embeddings, query, k, rerank=rerank)[0].tolist())
+        found += len(exact & approx)
+        total += len(exact)
+    return found / total if total else 1.0
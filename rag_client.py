@@ -0,0 +1,107 @@
+"""
+LeakProof RAG Service Client
+Thin client for rag_service.py with the same query methods as LeakProofRAG,
+so the UIs can switch between an embedded engine and the service
+"""
+
+import http.client
+import json
+import threading
+from typing import Dict, Iterator, List, Union
+from urllib.parse import urlsplit
+
+
+class RAGServiceError(Exception):
+    """Error response from the query service"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"RAG service error {status}: {message}")
+        self.status = status
+
+
+class RAGServiceClient:
+    """Client for a running rag_service
+
+    Each thread keeps one persistent HTTP/1.1 connection, so repeated
+    queries from a UI worker reuse it instead of reconnecting.
+    """
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8000", timeout: float = 120.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = conn_class(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, payload: Dict = None) -> http.client.HTTPResponse:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                break
+            except (ConnectionError, http.client.RemoteDisconnected, http.client.CannotSendRequest):
+                # The server closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+        if response.status != 200:
+            data = response.read()
+            try:
+                message = json.loads(data)["error"]
+            except (ValueError, KeyError, TypeError):
+                message = data.decode("utf-8", "replace")
+            raise RAGServiceError(response.status, message)
+        return response
+
+    def _json(self, method: str, path: str, payload: Dict = None) -> Dict:
+        return json.loads(self._request(method, path, payload).read())
+
+    def health(self) -> Dict:
+        return self._json("GET", "/health")
+
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 3, filters=None) -> List[Dict]:
+        payload = {"question": query, "top_k": top_k, "filters": filters}
+        return self._json("POST", "/retrieve", payload)["sources"]
+
+    def query(self, question: str, top_k: int = 3, show_sources: bool = True, filters=None) -> Dict:
+        return self._json("POST", "/query", {"question": question, "top_k": top_k, "filters": filters})
+
+    def query_stream(self, question: str, top_k: int = 3,
+                     filters=None) -> Iterator[Union[List[Dict], str]]:
+        """Same contract as LeakProofRAG.query_stream: sources first, then answer pieces"""
+        payload = {"question": question, "top_k": top_k, "filters": filters}
+        response = self._request("POST", "/stream", payload)
+        for line in response:
+            if not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[len(b"data: "):])
+            if event["type"] == "sources":
+                yield event["sources"]
+            elif event["type"] == "token":
+                yield event["text"]
+            elif event["type"] == "error":
+                raise RAGServiceError(502, event["error"])
+            elif event["type"] == "done":
+                response.read()  # Drain so the connection can be reused
+                return
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,264 @@
+"""
+LeakProof RAG Query Service
+A small ASGI app serving one loaded index over HTTP, so the UIs can stay
+thin clients and scale independently of the index
+
+Endpoints:
+    GET  /health    - readiness and index size
+    POST /retrieve  - {"question", "top_k", "filters"} -> {"sources": [...]}
+    POST /query     - {"question", "top_k", "filters"} -> query() result
+    POST /stream    - same body; server-sent events: sources, tokens, done
+    GET  /metrics   - per-stage latency histograms and token counters in
+                      Prometheus text format (per worker process)
+
+Usage:
+    python rag_service.py --index leakproof_index --workers 4
+
+The index is built once (if missing) before the workers start; every worker
+then memory-maps the same embedding file, so the OS page cache holds a
+single copy. Each worker keeps one pooled AsyncOpenAI client. Set
+OPENAI_BASE_URL to point the service at `python fake_openai.py serve` for
+load tests.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict
+
+import index_store
+from async_rag import AsyncLeakProofRAG
+from engine import build_engine
+from metadata_filter import validate_filters
+from metrics import MultiSink, PrometheusMetrics
+
+DEFAULT_INDEX_PATH = "leakproof_index"
+
+
+class HTTPError(Exception):
+    """Error turned into a JSON response with the given status code"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RAGService:
+    """ASGI application serving queries from a shared AsyncLeakProofRAG
+
+    The engine is built by `engine_factory` during lifespan startup (or on
+    the first request when the server does not send lifespan events). The
+    Prometheus sink exists from the start, so /metrics can be scraped
+    before the engine has loaded.
+    """
+
+    def __init__(self, engine_factory: Callable[[], AsyncLeakProofRAG] = None):
+        self.engine_factory = engine_factory or self._default_engine
+        self.prometheus = PrometheusMetrics()
+        self.rag = None
+        self._loading = None
+
+    @staticmethod
+    def _default_engine() -> AsyncLeakProofRAG:
+        index_path = os.getenv("LEAKPROOF_INDEX", DEFAULT_INDEX_PATH)
+        return build_engine(index_path=index_path, engine_class=AsyncLeakProofRAG)
+
+    async def _engine(self) -> AsyncLeakProofRAG:
+        if self.rag is None:
+            if self._loading is None:
+                # Loading touches disk (and maybe the API), keep it off the loop
+                self._loading = asyncio.ensure_future(asyncio.to_thread(self.engine_factory))
+            rag = await self._loading
+            if self.rag is None:
+                self._attach_metrics(rag)
+                self.rag = rag
+        return self.rag
+
+    def _attach_metrics(self, rag: AsyncLeakProofRAG):
+        """Report the engine's queries to the service's Prometheus sink"""
+        sink = rag.metrics
+        if isinstance(sink, MultiSink):
+            sink = sink.find(PrometheusMetrics)
+        if isinstance(sink, PrometheusMetrics):
+            # The engine brought its own; nothing was recorded before it loaded
+            self.prometheus = sink
+        elif rag.metrics is None:
+            rag.metrics = self.prometheus
+        else:
+            rag.metrics = MultiSink(rag.metrics, self.prometheus)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self._engine()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.rag is not None:
+                    await self.rag.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        routes = {
+            ("GET", "/health"): self.health,
+            ("POST", "/retrieve"): self.retrieve,
+            ("POST", "/query"): self.query,
+            ("POST", "/stream"): self.stream,
+            ("GET", "/metrics"): self.metrics,
+        }
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            started |= message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            handler = routes.get((scope["method"], scope["path"]))
+            if handler is None:
+                known_path = any(path == scope["path"] for _, path in routes)
+                raise HTTPError(405 if known_path else 404, f"{scope['method']} {scope['path']} not supported")
+            await handler(await self._read_body(receive), tracked_send)
+        except Exception as e:
+            if started:
+                # Headers are already out; a second response start is invalid
+                await send({"type": "http.response.body", "body": b""})
+                return
+            status = e.status if isinstance(e, HTTPError) else 500
+            await self._send_json(send, {"error": str(e)}, status=status)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    def _parse_query(body: bytes):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON")
+        question = request.get("question") if isinstance(request, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise HTTPError(400, "'question' must be a non-empty string")
+        top_k = request.get("top_k", 3)
+        if not isinstance(top_k, int) or not 0 < top_k <= 50:
+            raise HTTPError(400, "'top_k' must be an integer between 1 and 50")
+        filters = request.get("filters")
+        try:
+            validate_filters(filters)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise HTTPError(400, f"Invalid 'filters': {e}")
+        return question, top_k, filters
+
+    @staticmethod
+    async def _send_json(send, payload: Dict, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(data)).encode())],
+        })
+        await send({"type": "http.response.body", "body": data})
+
+    async def health(self, body: bytes, send):
+        if self.rag is None:
+            await self._send_json(send, {"status": "loading", "error": "Index is still loading"}, status=503)
+            return
+        await self._send_json(send, {
+            "status": "ok",
+            "chunks": len(self.rag.live_chunks()),
+            "index_version": self.rag.index_version,
+            "embedding_model": self.rag.embedding_model,
+        })
+
+    async def metrics(self, body: bytes, send):
+        data = self.prometheus.exposition().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                        (b"content-length", str(len(data)).encode())],
+        })
+        await send({"type": "http.response.body", "body": data})
+
+    async def retrieve(self, body: bytes, send):
+        question, top_k, filters = self._parse_query(body)
+        rag = await self._engine()
+        sources = await rag.aretrieve_relevant_chunks(question, top_k=top_k, filters=filters)
+        await self._send_json(send, {"question": question, "sources": sources})
+
+    async def query(self, body: bytes, send):
+        question, top_k, filters = self._parse_query(body)
+        rag = await self._engine()
+        await self._send_json(send, await rag.aquery(question, top_k=top_k, filters=filters))
+
+    async def stream(self, body: bytes, send):
+        question, top_k, filters = self._parse_query(body)
+        rag = await self._engine()
+        events = rag.aquery_stream(question, top_k=top_k, filters=filters)
+        # Retrieve before committing to a 200 so failures still get a JSON error
+        sources = await events.__anext__()
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+
+        async def event(payload: Dict):
+            data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+
+        # From here on errors can only be reported inside the event stream
+        try:
+            await event({"type": "sources", "sources": sources})
+            async for piece in events:
+                await event({"type": "token", "text": piece})
+            await event({"type": "done"})
+        except Exception as e:
+            await event({"type": "error", "error": str(e)})
+        await send({"type": "http.response.body", "body": b""})
+
+
+app = RAGService()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LeakProof RAG query service")
+    parser.add_argument("--index", default=os.getenv("LEAKPROOF_INDEX", DEFAULT_INDEX_PATH),
+                        help="Binary index directory (built from the document if missing)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    # Build the index once here so the workers only ever memory-map it
+    if not (Path(args.index) / index_store.HEADER_FILE).exists():
+        build_engine(index_path=args.index).save_index(args.index)
+    os.environ["LEAKPROOF_INDEX"] = args.index
+
+    import uvicorn
+    uvicorn.run("rag_service:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,13 @@ Test Script for LeakProof RAG System
 Verify that everything is working correctly
 """
 
+import json
 import os
+import shutil
 import sys
+import tempfile
+
+import numpy as np
 
 def test_imports():
     """Test that all required packages are installed"""
@@ -98,13 +103,13 @@ def test_save_load_index(rag):
     print("\nTesting index save/load...")
     try:
         # Save
-        rag.save_index("test_index.json")
+        rag.save_index("test_index")
         print("✅ Index saved")
         
         # Create new instance and load
         from leakproof_rag import LeakProofRAG
         rag2 = LeakProofRAG()
-        rag2.load_index("test_index.json")
+        rag2.load_index("test_index")
         print("✅ Index loaded")
         
         # Verify
@@ -119,17 +124,1346 @@ def test_save_load_index(rag):
         return False
     finally:
         # Cleanup
+        shutil.rmtree("test_index", ignore_errors=True)
+
+def test_offline_retrieval():
+    """Test matrix-backed retrieval against a brute-force scan (no API key needed)"""
+    print("\nTesting offline retrieval...")
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    assert rag.embeddings.dtype == np.float32
+    assert np.allclose(np.linalg.norm(rag.embeddings, axis=1), 1.0, atol=1e-5)
+    
+    question = "What is the maximum working pressure?"
+    results = rag.retrieve_relevant_chunks(question, top_k=3)
+    
+    query_embedding = rag.embed_query(question)
+    expected = sorted(
+        (rag.cosine_similarity(query_embedding, emb) for emb in rag.embeddings),
+        reverse=True
+    )[:3]
+    assert np.allclose([r["similarity"] for r in results], expected, atol=1e-5)
+    assert results[0]["chunk"]["id"] == "hydraulic_specs"
+    print("✅ Retrieval matches brute-force cosine ranking")
+
+def test_offline_index_roundtrip():
+    """Test binary index save/load and legacy JSON conversion"""
+    print("\nTesting offline index save/load...")
+    import json
+    from fake_openai import FakeOpenAI
+    from index_store import convert_json_index
+    from leakproof_rag import LeakProofRAG
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = os.path.join(tmp, "index")
+        rag.save_index(index_dir)
+        
+        loaded = LeakProofRAG(client=FakeOpenAI())
+        loaded.load_index(index_dir)
+        assert isinstance(loaded.embeddings, np.memmap)
+        assert loaded.chunks == rag.chunks
+        assert np.array_equal(loaded.embeddings, rag.embeddings)
+        
+        question = "How do I contact KEITH Manufacturing in Europe?"
+        expected = [r["chunk"]["id"] for r in rag.retrieve_relevant_chunks(question)]
+        assert [r["chunk"]["id"] for r in loaded.retrieve_relevant_chunks(question)] == expected
+        
+        # BM25 postings are loaded rather than rebuilt, and score the same
+        import bm25
+        real_build, bm25.BM25Index.build = bm25.BM25Index.build, None
+        try:
+            loaded.load_index(index_dir)
+        finally:
+            bm25.BM25Index.build = real_build
+        for query in ("80 mm cylinder", "3,000 PSI", question):
+            assert np.allclose(loaded.lexical_index.scores(query), rag.lexical_index.scores(query))
+        
+        # Legacy JSON index converts to the binary format
+        json_path = os.path.join(tmp, "leakproof_index.json")
+        with open(json_path, "w") as f:
+            json.dump({"chunks": rag.chunks, "embeddings": rag.embeddings.tolist()}, f)
+        header = convert_json_index(json_path, os.path.join(tmp, "converted"), dtype="float16")
+        assert header["count"] == len(rag.chunks) and header["dtype"] == "float16"
+        
+        converted = LeakProofRAG(client=FakeOpenAI())
+        converted.load_index(os.path.join(tmp, "converted"))
+        assert converted.embeddings.dtype == np.float16
+        assert np.allclose(converted.embeddings, rag.embeddings, atol=1e-3)
+    print("✅ Binary index round-trips and legacy JSON converts")
+
+def test_offline_embedding_cache():
+    """Test that a warm restart makes zero embedding calls"""
+    print("\nTesting offline embedding cache...")
+    from caching import EmbeddingCache
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "embeddings.sqlite3")
+        
+        cold = LeakProofRAG(client=FakeOpenAI(), embedding_cache=EmbeddingCache(cache_path))
+        cold.load_document("leakproof_drive.pdf")
+        cold.create_embeddings()
+        assert sum(len(c) for c in cold.client.embeddings.calls) == len(cold.chunks)
+        
+        warm = LeakProofRAG(client=FakeOpenAI(), embedding_cache=EmbeddingCache(cache_path))
+        warm.load_document("leakproof_drive.pdf")
+        warm.chunks[0] = dict(warm.chunks[0], text=warm.chunks[0]["text"] + " Updated.")
+        warm.create_embeddings()
+        assert warm.client.embeddings.calls == [[warm.chunks[0]["text"]]]
+        assert np.allclose(warm.embeddings[1:], cold.embeddings[1:])
+        
+        # Size-based LRU eviction keeps the most recently used entries
+        small = EmbeddingCache(os.path.join(tmp, "small.sqlite3"), max_bytes=2 * 16)
+        small.put_many("m", ["a", "b"], [[1, 0, 0, 0], [0, 1, 0, 0]])
+        small.get_many("m", ["a"])
+        small.put_many("m", ["c"], [[0, 0, 1, 0]])
+        assert [v is not None for v in small.get_many("m", ["a", "b", "c"])] == [True, False, True]
+    print("✅ Warm restart re-embeds only changed chunks")
+
+def test_offline_batched_ingestion():
+    """Test batching limits, 429 retries and checkpoint resume"""
+    print("\nTesting offline batched ingestion...")
+    from fake_openai import FakeOpenAI, fake_embedding
+    from ingestion import EmbeddingIngestor
+    from tokenizer import truncate_to_tokens
+    
+    texts = [f"chunk {i} about pump flow and floor speed" for i in range(50)]
+    
+    # Batches respect both the input count and the token budget
+    client = FakeOpenAI(dimensions=8, rate_limit_errors=2)
+    client.embeddings.max_inputs_per_request = 8
+    ingestor = EmbeddingIngestor(client, "fake-model", batch_size=8, max_batch_tokens=40,
+                                 max_concurrency=3, initial_backoff=0.001,
+                                 on_progress=lambda done, total: None)
+    vectors = ingestor.embed(texts)
+    assert len(client.embeddings.calls) == len(ingestor.make_batches(texts))
+    assert max(len(call) for call in client.embeddings.calls) <= 4
+    assert np.allclose(vectors, [fake_embedding(t, 8) for t in texts])
+    
+    # An input over the per-input limit is truncated instead of failing the whole run
+    long_text = " ".join(f"word{i}" for i in range(200))
+    client = FakeOpenAI(dimensions=8)
+    client.embeddings.max_tokens_per_input = 20
+    ingestor = EmbeddingIngestor(client, "fake-model", max_input_tokens=20,
+                                 on_progress=lambda done, total: None)
+    vectors = ingestor.embed(texts[:3] + [long_text])
+    assert len(vectors) == 4
+    assert np.allclose(vectors[:3], [fake_embedding(t, 8) for t in texts[:3]])
+    assert np.allclose(vectors[3], fake_embedding(truncate_to_tokens(long_text, 20, "fake-model"), 8))
+    assert client.embeddings.calls[-1][:3] == texts[:3]
+    
+    # A crash part-way through resumes from the checkpoint
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_dir = os.path.join(tmp, "checkpoint")
+        crashing = FakeOpenAI(dimensions=8)
+        real_create = crashing.embeddings.create
+        def create_then_crash(**kwargs):
+            if len(crashing.embeddings.calls) >= 3:
+                raise RuntimeError("simulated crash")
+            return real_create(**kwargs)
+        crashing.embeddings.create = create_then_crash
+        
+        options = dict(batch_size=5, max_concurrency=1, on_progress=lambda done, total: None)
+        try:
+            EmbeddingIngestor(crashing, "fake-model", **options).embed(texts, checkpoint_dir=checkpoint_dir)
+            raise AssertionError("expected the simulated crash")
+        except RuntimeError:
+            pass
+        
+        resumed = FakeOpenAI(dimensions=8)
+        vectors = EmbeddingIngestor(resumed, "fake-model", **options).embed(texts, checkpoint_dir=checkpoint_dir)
+        assert len(resumed.embeddings.calls) == 10 - 3
+        assert np.allclose(vectors, [fake_embedding(t, 8) for t in texts])
+        assert not os.path.exists(checkpoint_dir)
+    print("✅ Batches stay within limits, retry on 429 and resume after a crash")
+
+def _write_test_pdf(path, pages):
+    """Write a minimal text-only PDF with one list of lines per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for lines in pages:
+        body = "BT /F1 12 Tf 72 720 Td 14 TL " + " ".join(
+            "(%s) Tj T*" % line.replace("(", "\\(").replace(")", "\\)") for line in lines
+        ) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(pages)} >>"
+    
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+def test_offline_pdf_ingestion():
+    """Test streaming PDF parsing into chunks with derived ids and metadata"""
+    print("\nTesting offline PDF ingestion...")
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    from pdf_loader import iter_directory_chunks
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_test_pdf(os.path.join(tmp, "manual.pdf"), [
+            ["Hydraulic Drive Unit Specifications:", "- Maximum Working Pressure: 3000 PSI (210 bar)"],
+            ["Performance at 25 gallons/minute (95 l/minute):", "- Floor Speed: 6.25 ft/minute",
+             "- Unloading Time for 45 ft Trailer: 7.2 minutes"],
+        ])
+        _write_test_pdf(os.path.join(tmp, "contact.pdf"), [
+            ["WORLD HEADQUARTERS", "Madras, OR USA"],
+        ])
+        
+        rag = LeakProofRAG(client=FakeOpenAI())
+        rag.load_document(os.path.join(tmp, "manual.pdf"))
+        assert [c["id"] for c in rag.chunks] == ["manual_p1_0", "manual_p2_0"]
+        assert rag.chunks[0]["metadata"] == {
+            "section": "hydraulic_drive_unit_specifications", "type": "document_text",
+            "page": 1, "source": "manual.pdf"
+        }
+        assert rag.chunks[1]["metadata"]["pump_flow"] == "25"
+        assert "3000 PSI" in rag.chunks[0]["text"]
+        
+        # A directory is parsed across a process pool and embedded as it streams
+        rag.index_documents(tmp, buffer_size=2)
+        assert [c["metadata"]["source"] for c in rag.chunks] == ["contact.pdf", "manual.pdf", "manual.pdf"]
+        assert rag.embeddings.shape == (3, 1536)
+        top = rag.retrieve_relevant_chunks("maximum working pressure", top_k=1)[0]
+        assert top["chunk"]["id"] == "manual_p1_0"
+        
+        # Same file name in a subfolder, and a name slugifying like it, stay separate documents
+        os.makedirs(os.path.join(tmp, "old"))
+        _write_test_pdf(os.path.join(tmp, "old", "manual.pdf"), [["WORLD HEADQUARTERS", "Madras"]])
+        _write_test_pdf(os.path.join(tmp, "Manual.pdf"), [["WORLD HEADQUARTERS", "Madras"]])
+        chunks = list(iter_directory_chunks(tmp, max_workers=2))
+        assert [c["metadata"]["source"] for c in chunks] == [
+            "Manual.pdf", "contact.pdf", "manual.pdf", "manual.pdf", "old/manual.pdf"]
+        ids = [c["id"] for c in chunks]
+        assert len(set(ids)) == len(ids) and "manual_p1_0" in ids
+        rag.index_documents(tmp)
+        rag.update_document(os.path.join(tmp, "old", "manual.pdf"), root=tmp)
+        assert [c["metadata"]["source"] for c in rag.live_chunks()].count("old/manual.pdf") == 1
+        assert len(rag.live_chunks()) == 5
+    print("✅ PDFs stream into chunks with section, page and source metadata")
+
+def test_offline_incremental_reindexing():
+    """Test add/update/remove embedding only the changed chunks"""
+    print("\nTesting offline incremental re-indexing...")
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    def embedded_count(rag):
+        return sum(len(call) for call in rag.client.embeddings.calls)
+    
+    manual = [
+        {"id": "manual_p1_0", "text": "Maximum Working Pressure: 3000 PSI",
+         "metadata": {"section": "specs", "type": "document_text", "page": 1, "source": "manual.pdf"}},
+        {"id": "manual_p2_0", "text": "Floor Speed: 6.25 ft/minute at 25 gallons/minute",
+         "metadata": {"section": "performance", "type": "document_text", "page": 2, "source": "manual.pdf"}},
+    ]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rag = LeakProofRAG(client=FakeOpenAI())
+        rag.load_document("leakproof_drive.pdf")
+        rag.create_embeddings()
+        rag.save_index(os.path.join(tmp, "index"))
+        base_count = len(rag.chunks)
+        
+        before = embedded_count(rag)
+        rag.add_documents(manual)
+        assert embedded_count(rag) - before == 2
+        
+        # Only the edited page is re-embedded
+        before = embedded_count(rag)
+        edited = [manual[0], dict(manual[1], text="Floor Speed: 7.5 ft/minute at 30 gallons/minute")]
+        summary = rag.update_document("manual.pdf", edited)
+        assert summary == {"added": 2, "removed": 2, "embedded": 1}
+        assert embedded_count(rag) - before == 1
+        
+        rag.remove_document("contact_info")
+        assert len(rag.live_chunks()) == base_count + 1
+        # Removed rows are tombstoned, not copied out of the matrix
+        assert len(rag.chunks) == len(rag.embeddings) == base_count + 4
+        assert int(rag.deleted_rows.sum()) == 3
+        
+        # Tombstoned rows never match, and the patched indexes agree with a rebuild
+        fresh = LeakProofRAG(client=FakeOpenAI())
+        fresh.chunks = rag.live_chunks()
+        fresh.create_embeddings()
+        for question in ("How do I contact KEITH?", "floor speed at 30 gallons/minute"):
+            for mode in ("vector", "lexical", "hybrid"):
+                rag.retrieval_mode = fresh.retrieval_mode = mode
+                got = [r["chunk"]["id"] for r in rag.retrieve_relevant_chunks(question, top_k=20)]
+                assert got == [r["chunk"]["id"] for r in fresh.retrieve_relevant_chunks(question, top_k=20)]
+        assert len(rag.metadata_index.rows({"section": "contact"})) == 0
+        assert rag.performance_table.rows == fresh.performance_table.rows
+        
+        # Only a delta was written; the full save is untouched
+        index_dir = os.path.join(tmp, "index")
+        with open(os.path.join(index_dir, "delta.jsonl")) as f:
+            assert len(f.readlines()) == 3
+        
+        # Reloading replays the delta log
+        reloaded = LeakProofRAG(client=FakeOpenAI())
+        reloaded.load_index(index_dir)
+        assert [c["id"] for c in reloaded.live_chunks()] == [c["id"] for c in rag.live_chunks()]
+        assert np.allclose(reloaded.embeddings, rag.embeddings)
+        top = reloaded.retrieve_relevant_chunks("floor speed at 30 gallons/minute", top_k=1)[0]
+        assert top["chunk"]["text"] == edited[1]["text"]
+        
+        # Enough tombstones trigger a compaction and a full save
+        rag.remove_document("manual.pdf")
+        assert rag.deleted_rows is None and len(rag.chunks) == len(rag.embeddings) == base_count - 1
+        assert not os.path.exists(os.path.join(index_dir, "delta.jsonl"))
+        rag.remove_document("intro")
+        reloaded.load_index(index_dir)
+        assert reloaded.live_chunks() == rag.live_chunks()
+        assert [c["id"] for c in reloaded.chunks] == [c["id"] for c in rag.chunks]
+        
+        # A rebuilt corpus no longer writes its row numbers into the old index's delta log
+        saved_ids = [c["id"] for c in reloaded.live_chunks()]
+        with open(os.path.join(index_dir, "delta.jsonl")) as f:
+            saved_delta = f.read()
+        reloaded.chunks = reloaded.live_chunks()[::-1]
+        reloaded.create_embeddings()
+        assert reloaded.index_path is None
+        reloaded.remove_document("applications")
+        with open(os.path.join(index_dir, "delta.jsonl")) as f:
+            assert f.read() == saved_delta
+        reloaded.load_index(index_dir)
+        assert [c["id"] for c in reloaded.live_chunks()] == saved_ids
+        json_path = os.path.join(tmp, "leakproof_index.json")
+        with open(json_path, "w") as f:
+            json.dump({"chunks": rag.live_chunks(), "embeddings": rag.embeddings.tolist()}, f)
+        for rebuild in (lambda r: r.load_document("leakproof_drive.pdf"),
+                        lambda r: r.index_documents("leakproof_drive.pdf"),
+                        lambda r: r.load_index(json_path)):
+            reloaded.load_index(index_dir)
+            rebuild(reloaded)
+            assert reloaded.index_path is None
+    print("✅ Incremental updates embed only deltas and persist in place")
+
+def test_offline_ann_index():
+    """Test IVF recall against exact search, persistence and updates"""
+    print("\nTesting offline ANN index...")
+    from ann_index import IVFIndex, recall_at_k, sample_queries
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    from vectors import normalize_rows
+    
+    # Clustered synthetic corpus, like topic-grouped documentation
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(40, 64))
+    vectors = normalize_rows(centers[rng.integers(0, 40, 4000)] + rng.normal(scale=0.3, size=(4000, 64)))
+    queries = sample_queries(vectors, count=50)
+    
+    index = IVFIndex(nlist=64, nprobe=8).build(vectors)
+    assert index.size == len(vectors)
+    assert recall_at_k(vectors, index, queries, k=10) >= 0.9
+    assert recall_at_k(vectors, index, queries, k=10, nprobe=64) == 1.0
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    question = "How do I contact KEITH Manufacturing in Europe?"
+    exact = rag.retrieve_relevant_chunks(question, top_k=1)
+    rag.build_ann_index(nlist=4, nprobe=4)
+    assert rag.ann_recall(top_k=3) == 1.0
+    assert rag.retrieve_relevant_chunks(question, top_k=1)[0]["chunk"]["id"] == exact[0]["chunk"]["id"]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rag.save_index(os.path.join(tmp, "index"))
+        rag.remove_document("intro")
+        assert rag.ann_index.size == len(rag.live_chunks())
+        
+        loaded = LeakProofRAG(client=FakeOpenAI())
+        loaded.load_index(os.path.join(tmp, "index"))
+        assert loaded.ann_index is not None and loaded.ann_index.size == len(rag.live_chunks())
+        assert np.array_equal(loaded.ann_index.centroids, rag.ann_index.centroids)
+    print("✅ IVF index reaches target recall and persists with the index")
+
+def test_offline_query_cache():
+    """Test that repeated questions skip the query embedding call"""
+    print("\nTesting offline query embedding cache...")
+    import time
+    from caching import EmbeddingCache, QueryEmbeddingCache
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    calls = len(rag.client.embeddings.calls)
+    
+    first = rag.retrieve_relevant_chunks("What is the unloading time at 25 GPM?")
+    again = rag.retrieve_relevant_chunks("  what is the UNLOADING time at 25 gpm ")
+    assert len(rag.client.embeddings.calls) == calls + 1
+    assert [r["chunk"]["id"] for r in again] == [r["chunk"]["id"] for r in first]
+    assert rag.query_cache.stats["hits"] == 1 and rag.query_cache.stats["misses"] == 1
+    
+    # Max-size and TTL eviction
+    cache = QueryEmbeddingCache(max_size=2, ttl=0.05)
+    for question in ("a", "b", "c"):
+        cache.put("m", question, [1.0, 0.0])
+    assert cache.get("m", "a") is None and cache.get("m", "c") is not None
+    time.sleep(0.1)
+    assert cache.get("m", "c") is None
+    
+    # Disk backing survives a restart
+    with tempfile.TemporaryDirectory() as tmp:
+        disk = EmbeddingCache(os.path.join(tmp, "cache.sqlite3"))
+        QueryEmbeddingCache(disk_cache=disk).put("m", "Max pressure?", [0.6, 0.8])
+        restarted = QueryEmbeddingCache(disk_cache=EmbeddingCache(os.path.join(tmp, "cache.sqlite3")))
+        assert np.allclose(restarted.get("m", "max pressure"), [0.6, 0.8])
+    print("✅ Repeated questions are served from the query cache")
+
+def test_offline_answer_cache():
+    """Test semantic answer reuse, chunk-id guard and invalidation"""
+    print("\nTesting offline semantic answer cache...")
+    from caching import SemanticAnswerCache
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    rag = LeakProofRAG(client=FakeOpenAI(), answer_cache=SemanticAnswerCache(threshold=0.9))
+    rag.structured_answers = False  # Performance lookups would skip the LLM
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    chat_calls = rag.client.chat.completions.calls
+    
+    assert not rag.query("Unloading time at 25 GPM?", show_sources=False)["cached"]
+    assert rag.query("What is the unloading time at 25 GPM", show_sources=False)["cached"]
+    assert len(chat_calls) == 1
+    
+    # Same wording but different retrieved chunks is not a hit
+    assert not rag.query("Unloading time at 25 GPM?", top_k=2, show_sources=False)["cached"]
+    assert len(chat_calls) == 2
+    
+    # Any index change invalidates the cache
+    rag.remove_document("contact_info")
+    assert not rag.query("Unloading time at 25 GPM?", show_sources=False)["cached"]
+    assert len(chat_calls) == 3
+    
+    # LRU size bound
+    cache = SemanticAnswerCache(max_size=2, threshold=0.99)
+    for i, vector in enumerate(np.eye(3, dtype=np.float32)):
+        cache.store(vector, [f"chunk{i}"], f"answer{i}", index_version=1)
+    assert len(cache) == 2
+    assert cache.lookup(np.eye(3, dtype=np.float32)[0], ["chunk0"], index_version=1) is None
+    assert cache.lookup(np.eye(3, dtype=np.float32)[2], ["chunk2"], index_version=1) == "answer2"
+    print("✅ Near-identical questions reuse answers until the index changes")
+
+def test_offline_async_queries():
+    """Test concurrent aquery results and the in-flight request limit"""
+    print("\nTesting offline async queries...")
+    import asyncio
+    import time
+    from async_rag import AsyncLeakProofRAG
+    from fake_openai import AsyncFakeOpenAI, FakeOpenAI
+    
+    latency = 0.05
+    rag = AsyncLeakProofRAG(client=FakeOpenAI(), async_client=AsyncFakeOpenAI(latency=latency),
+                            max_concurrency=4)
+    rag.structured_answers = False  # Performance lookups would skip the LLM
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    questions = [f"Unloading time at {gpm} GPM?" for gpm in range(10, 30)]
+    expected = [[s["chunk"]["id"] for s in rag.retrieve_relevant_chunks(q)] for q in questions]
+    rag.query_cache.memory.clear()
+    
+    async def run():
+        async with rag:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(rag.aquery(q) for q in questions))
+            return results, time.perf_counter() - start
+    
+    results, elapsed = asyncio.run(run())
+    assert [[s["chunk"]["id"] for s in r["sources"]] for r in results] == expected
+    assert all(r["answer"] and not r["cached"] for r in results)
+    
+    # 40 upstream calls, 4 at a time: ~10 latency rounds instead of 40
+    rounds = 2 * len(questions) / rag.max_concurrency
+    assert rounds * latency * 0.9 <= elapsed < 2 * len(questions) * latency / 2, elapsed
+    print(f"✅ {len(questions)} concurrent queries in {elapsed:.2f}s with 4 requests in flight")
+
+def test_offline_streaming():
+    """Test that query_stream yields sources first, then the answer text"""
+    print("\nTesting offline streaming...")
+    import asyncio
+    from async_rag import AsyncLeakProofRAG
+    from caching import SemanticAnswerCache
+    from fake_openai import AsyncFakeOpenAI, FakeOpenAI
+    
+    answer = "The unloading time at 25 GPM is 5 minutes."
+    rag = AsyncLeakProofRAG(client=FakeOpenAI(answer=answer), async_client=AsyncFakeOpenAI(answer=answer),
+                            answer_cache=SemanticAnswerCache())
+    rag.structured_answers = False  # Performance lookups would skip the LLM
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    question = "Unloading time at 25 GPM?"
+    expected_ids = [s["chunk"]["id"] for s in rag.retrieve_relevant_chunks(question)]
+    
+    stream = rag.query_stream(question)
+    sources = next(stream)
+    assert [s["chunk"]["id"] for s in sources] == expected_ids
+    pieces = list(stream)
+    assert len(pieces) > 1 and "".join(pieces) == answer
+    
+    # The fully streamed answer went into the answer cache
+    assert list(rag.query_stream(question))[1:] == [answer]
+    assert len(rag.client.chat.completions.calls) == 1
+    
+    async def collect():
+        return [item async for item in rag.aquery_stream("What is the maximum working pressure?")]
+    
+    items = asyncio.run(collect())
+    assert isinstance(items[0], list) and "".join(items[1:]) == answer
+    print("✅ Sources stream first, answer tokens follow")
+
+def test_offline_query_batch():
+    """Test one embedding request per batch, ordering and per-item errors"""
+    print("\nTesting offline batch queries...")
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    rag = LeakProofRAG(client=FakeOpenAI(latency=0.01))
+    rag.structured_answers = False  # Performance lookups would skip the LLM
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    questions = [
+        "Unloading time at 25 GPM?",
+        "What is the maximum working pressure?",
+        "How do I contact KEITH in Europe?",
+        "What materials can it handle?",
+    ]
+    embedding_calls = rag.client.embeddings.calls
+    calls_before = len(embedding_calls)
+    
+    # One question's completion fails without sinking the rest
+    generate_response = rag.generate_response
+    def flaky_generate(query, relevant_chunks, **kwargs):
+        if "contact" in query:
+            raise RuntimeError("upstream timeout")
+        return generate_response(query, relevant_chunks, **kwargs)
+    rag.generate_response = flaky_generate
+    
+    results = rag.query_batch(questions, top_k=3, max_workers=4)
+    assert len(embedding_calls) == calls_before + 1
+    assert embedding_calls[-1] == questions
+    assert [r["question"] for r in results] == questions
+    assert results[2]["error"] == "upstream timeout" and results[2]["answer"] is None
+    assert all(r["error"] is None and r["answer"] for i, r in enumerate(results) if i != 2)
+    
+    # Matrix-matrix scoring agrees with one-at-a-time retrieval
+    for question, result in zip(questions, results):
+        single = rag.retrieve_relevant_chunks(question)
+        assert np.allclose([s["similarity"] for s in result["sources"]],
+                           [s["similarity"] for s in single], atol=1e-6)
+    
+    # The batch filled the query cache, so a rerun sends no embedding request
+    rag.query_batch(questions)
+    assert len(embedding_calls) == calls_before + 1
+    print("✅ Batch of 4 questions answered with a single embedding request")
+
+def test_offline_shared_engine():
+    """Test that concurrent sessions share one engine built exactly once"""
+    print("\nTesting offline shared engine...")
+    import threading
+    import time
+    import engine
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    builds = []
+    def slow_build():
+        builds.append(1)
+        time.sleep(0.05)  # Long enough for every session to arrive mid-build
+        rag = LeakProofRAG(client=FakeOpenAI())
+        rag.load_document("leakproof_drive.pdf")
+        return rag
+    
+    original_build, original_engine = engine.build_engine, engine._engine
+    engine.build_engine, engine._engine = slow_build, None
+    try:
+        engines = []
+        sessions = [threading.Thread(target=lambda: engines.append(engine.get_engine())) for _ in range(8)]
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+    finally:
+        engine.build_engine, engine._engine = original_build, original_engine
+    
+    assert len(builds) == 1
+    assert len(engines) == 8 and all(e is engines[0] for e in engines)
+    print("✅ 8 concurrent sessions share a single engine")
+
+def _call_asgi(app, method, path, payload=None):
+    """Run one request through an ASGI app; returns (status, body bytes)"""
+    import asyncio
+    body = json.dumps(payload).encode() if payload is not None else b""
+    messages = []
+    
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    
+    async def send(message):
+        messages.append(message)
+    
+    asyncio.run(app({"type": "http", "method": method, "path": path}, receive, send))
+    return messages[0]["status"], b"".join(m.get("body", b"") for m in messages[1:])
+
+def test_offline_query_service():
+    """Test the ASGI query service endpoints against fake OpenAI clients"""
+    print("\nTesting offline query service...")
+    import asyncio
+    from async_rag import AsyncLeakProofRAG
+    from fake_openai import AsyncFakeOpenAI, FakeOpenAI
+    from rag_service import RAGService
+    
+    def engine_factory():
+        rag = AsyncLeakProofRAG(client=FakeOpenAI(), async_client=AsyncFakeOpenAI())
+        rag.structured_answers = False  # Performance lookups would skip the LLM
+        rag.load_document("leakproof_drive.pdf")
+        rag.create_embeddings()
+        return rag
+    
+    service = RAGService(engine_factory)
+    assert _call_asgi(service, "GET", "/health")[0] == 503
+    
+    question = {"question": "Unloading time at 25 GPM?", "top_k": 2}
+    status, body = _call_asgi(service, "POST", "/retrieve", question)
+    assert status == 200
+    assert [s["chunk"]["id"] for s in json.loads(body)["sources"]] == \
+        [s["chunk"]["id"] for s in service.rag.retrieve_relevant_chunks(question["question"], top_k=2)]
+    
+    status, body = _call_asgi(service, "POST", "/query", question)
+    assert status == 200 and json.loads(body)["answer"] == "This is a fake answer generated offline."
+    
+    status, body = _call_asgi(service, "POST", "/stream", question)
+    events = [json.loads(line[len("data: "):]) for line in body.decode().split("\n\n") if line]
+    assert [e["type"] for e in events][0] == "sources" and events[-1]["type"] == "done"
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "This is a fake answer generated offline."
+    
+    health = json.loads(_call_asgi(service, "GET", "/health")[1])
+    assert health["status"] == "ok" and health["chunks"] == len(service.rag.chunks)
+    assert _call_asgi(service, "POST", "/query", {"question": ""})[0] == 400
+    assert _call_asgi(service, "GET", "/query")[0] == 405
+    assert _call_asgi(service, "GET", "/missing")[0] == 404
+    # Bad operators inside a field's conditions are rejected before retrieval
+    for filters in ({"pump_flow": {"~=": 25}}, {"pump_flow": {">=": "fast"}}, "pump_flow >= fast"):
+        assert _call_asgi(service, "POST", "/retrieve", dict(question, filters=filters))[0] == 400
+    
+    # A failure mid-stream ends the event stream instead of starting a second response
+    async def failing_stream(question, top_k=3, filters=None):
+        yield [{"chunk": object()}]  # Fails to serialize after the headers went out
+        yield "partial"
+    service.rag.aquery_stream = failing_stream
+    messages = []
+    async def send(message):
+        messages.append(message)
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(question).encode(), "more_body": False}
+    asyncio.run(service({"type": "http", "method": "POST", "path": "/stream"}, receive, send))
+    assert [m["type"] for m in messages].count("http.response.start") == 1
+    events = [json.loads(line[len("data: "):])
+              for line in b"".join(m.get("body", b"") for m in messages[1:]).decode().split("\n\n") if line]
+    assert events[-1]["type"] == "error" and "serializable" in events[-1]["error"]
+    print("✅ /health, /retrieve, /query and /stream all respond")
+
+def test_offline_hybrid_retrieval():
+    """Test BM25 keyword matching, rank fusion and the no-network fallback"""
+    print("\nTesting offline hybrid retrieval...")
+    import asyncio
+    import time
+    from async_rag import AsyncLeakProofRAG
+    from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+    from fake_openai import AsyncFakeOpenAI, FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    
+    assert tokenize("Bore: 80mm, 3,000 PSI") == tokenize("bore 80 mm 3000 psi") == ["bore", "80", "mm", "3000", "psi"]
+    index = BM25Index().build(["pump flow 40 gpm", "working pressure 3000 psi", "pump pressure"])
+    rows, scores = index.search("pressure 3000 PSI", top_k=3)
+    assert list(rows) == [1, 2] and scores[0] > scores[1] > 0
+    assert len(index.search("no such words", top_k=3)[0]) == 0
+    fused = reciprocal_rank_fusion([[0, 1], [1, 2]], k=60)
+    assert max(fused, key=fused.get) == 1
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    for question, expected in [("3000 PSI", "hydraulic_specs"),
+                               ("eurosales@keithwalkingfloor.com", "contact_info")]:
+        assert rag.retrieve_relevant_chunks(question)[0]["chunk"]["id"] == expected
+    
+    # Lexical mode retrieves without any embedding request
+    embedding_calls = rag.client.embeddings.calls
+    calls_before = len(embedding_calls)
+    rag.retrieval_mode = "lexical"
+    assert rag.query("Maximum working pressure?", show_sources=False)["sources"][0]["chunk"]["id"] == "hydraulic_specs"
+    assert len(embedding_calls) == calls_before
+    
+    # Hybrid mode falls back to keywords when the embedding API is down
+    rag.retrieval_mode = "hybrid"
+    rag.client.embeddings.rate_limit_errors = 10**6
+    result = rag.query("Europe sales contact?", show_sources=False)
+    assert result["sources"][0]["chunk"]["id"] == "contact_info" and result["answer"]
+    
+    # A slow embedding API falls back too, after query_embedding_timeout rather than the client's
+    rag.client.embeddings.rate_limit_errors = 0
+    rag.client.embeddings.latency = 30.0
+    rag.query_embedding_timeout = 0.05
+    start = time.perf_counter()
+    top = rag.retrieve_relevant_chunks("Europe sales contact?")[0]
+    assert time.perf_counter() - start < 5.0 and top["chunk"]["id"] == "contact_info"
+    
+    arag = AsyncLeakProofRAG(client=FakeOpenAI(), async_client=AsyncFakeOpenAI(latency=30.0))
+    arag.chunks, arag.embeddings = rag.chunks, rag.embeddings
+    arag._index_changed()
+    arag.query_embedding_timeout = 0.05
+    start = time.perf_counter()
+    top = asyncio.run(arag.aretrieve_relevant_chunks("Europe sales contact?"))[0]
+    assert time.perf_counter() - start < 5.0 and top["chunk"]["id"] == "contact_info"
+    rag.client.embeddings.latency = 0.0
+    rag.client.embeddings.rate_limit_errors = 10**6
+    
+    rag.retrieval_mode = "vector"
+    try:
+        rag.retrieve_relevant_chunks("Europe sales contact?")
+        raise AssertionError("vector mode should not fall back")
+    except Exception as e:
+        assert getattr(e, "status_code", None) == 429
+    print("✅ Keyword lookups and API-down fallback work")
+
+def test_offline_metadata_filters():
+    """Test equality, range and membership filters on chunk metadata"""
+    print("\nTesting offline metadata filters...")
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    from metadata_filter import MetadataIndex, normalize_filters
+    
+    assert normalize_filters('section == "performance"') == [("section", "==", "performance")]
+    assert normalize_filters(["pump_flow >= 25", "pump_flow < 40"]) == \
+        normalize_filters({"pump_flow": {">=": 25, "<": 40}})
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    
+    def ids(filters, top_k=13):
+        return {s["chunk"]["id"] for s in rag.retrieve_relevant_chunks("Floor speed?", top_k=top_k, filters=filters)}
+    
+    assert ids("pump_flow >= 25") == {"performance_25gpm", "performance_30gpm", "performance_40gpm"}
+    assert ids({"pump_flow": {">": 15, "<=": 25}}) == {"performance_20gpm", "performance_25gpm"}
+    assert ids({"pump_flow": "30"}) == ids("pump_flow == 30") == {"performance_30gpm"}
+    assert ids({"section": ["contact", "specifications"]}) == {"contact_info", "hydraulic_specs"}
+    assert len(ids('section != "performance"')) == 8
+    assert ids({"section": "no_such_section"}) == set()
+    
+    for mode in ("vector", "lexical", "hybrid"):
+        rag.retrieval_mode = mode
+        result = rag.query("Unloading time?", show_sources=False, filters='section == "performance"')
+        assert result["sources"] and all(s["chunk"]["metadata"]["section"] == "performance" for s in result["sources"])
+    
+    batch = rag.query_batch(["Floor speed?", "Unloading time?"], filters="pump_flow < 20")
+    assert all([s["chunk"]["id"] for s in r["sources"]] == ["performance_15gpm"] for r in batch)
+    
+    try:
+        MetadataIndex().build(rag.chunks).mask('section >= "a"')
+        raise AssertionError("range filter on text should be rejected")
+    except ValueError:
+        pass
+    print("✅ Filters restrict retrieval to matching chunks")
+
+def test_offline_performance_table():
+    """Test numeric performance lookups answered from the table without the API"""
+    print("\nTesting offline performance table...")
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    from performance_table import parse_question
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    table = rag.performance_table
+    assert [row["pump_flow_gpm"] for row in table.rows] == [15, 20, 25, 30, 40]
+    assert table.lookup(40)["note"] == "80mm cylinder only"
+    
+    calls_before = len(rag.client.embeddings.calls), len(rag.client.chat.completions.calls)
+    result = rag.query("What is the floor speed at 30 GPM?", show_sources=False)
+    assert result["structured"] and "7.5 ft/minute (2.3 m/minute)" in result["answer"]
+    assert "Unloading" not in result["answer"]
+    assert [s["chunk"]["id"] for s in result["sources"]] == ["performance_30gpm"]
+    
+    # Liters per minute are converted; 114 l/min is the listed 30 GPM row
+    assert "6 minutes" in rag.query("Unloading time at 114 l/min?", show_sources=False)["answer"]
+    # A listed l/min figure is that row, not an interpolated conversion
+    answer = rag.query("What is the floor speed at 95 l/min?", show_sources=False)["answer"]
+    assert answer.startswith("Performance at 25 gallons/minute") and "6.25 ft/minute" in answer
+    
+    # Between listed flows: speed linear in flow, time through the unloading rate
+    row = table.lookup(35)
+    assert row["interpolated"] and row["floor_speed_ft_min"] == 8.62
+    assert row["unload_minutes"] == 5.1
+    stream = list(rag.query_stream("Performance at 35 gpm"))
+    assert [s["chunk"]["id"] for s in stream[0]] == ["performance_30gpm", "performance_40gpm"]
+    assert "Estimated" in stream[1]
+    assert (len(rag.client.embeddings.calls), len(rag.client.chat.completions.calls)) == calls_before
+    
+    # Outside the listed range, non-lookups and filtered queries use retrieval
+    assert table.lookup(50) is None
+    assert parse_question("What is the maximum pump flow?") is None
+    assert parse_question("Compare 20 GPM and 30 GPM floor speed") is None
+    assert parse_question("How long will the pump last at 25 gpm?") is None
+    assert parse_question("How long to empty a trailer at 25 gpm?")["fields"] == ["unload_time"]
+    # Only the table's 45 ft trailer is answered from it
+    assert table.answer("Unloading time for a 45 ft trailer at 25 gpm?")["row"]["unload_minutes"] == 7.2
+    assert not rag.query("What is the unloading time for a 53-foot trailer at 25 gallons per minute?",
+                         show_sources=False)["structured"]
+    assert not rag.query("Floor speed at 50 GPM?", show_sources=False)["structured"]
+    assert not rag.query("Floor speed at 30 GPM?", show_sources=False,
+                         filters={"section": "performance"})["structured"]
+    
+    results = rag.query_batch(["Floor speed at 20 GPM?", "What materials can it handle?"])
+    assert [r["structured"] for r in results] == [True, False]
+    assert rag.client.embeddings.calls[-1] == ["What materials can it handle?"]
+    print("✅ Performance lookups answered from the table, interpolated between rows")
+
+def test_offline_quantization():
+    """Test int8 candidate scoring with float re-ranking, recall and persistence"""
+    print("\nTesting offline quantized embeddings...")
+    from ann_index import sample_queries
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    from quantization import QuantizedIndex, recall_at_k
+    from vectors import normalize_rows
+    
+    rng = np.random.default_rng(2)
+    centers = rng.normal(size=(40, 256))
+    vectors = normalize_rows(centers[rng.integers(0, 40, 4000)] + rng.normal(scale=0.3, size=(4000, 256)))
+    queries = sample_queries(vectors, count=50)
+    
+    index = QuantizedIndex(rerank=4).build(vectors)
+    assert index.codes.dtype == np.int8 and vectors.nbytes / index.nbytes > 3.9
+    assert np.abs(index.codes * index.scales[:, None] - vectors).max() < 0.01
+    assert recall_at_k(vectors, index, queries, k=10, rerank=1) >= 0.9
+    assert recall_at_k(vectors, index, queries, k=10) == 1.0
+    rows, scores = index.search(vectors, queries[0], 5)
+    assert np.allclose(scores, vectors[rows] @ queries[0])
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.retrieval_mode = "vector"
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    question = "How do I contact KEITH Manufacturing in Europe?"
+    exact = [s["chunk"]["id"] for s in rag.retrieve_relevant_chunks(question)]
+    report = rag.quantize_embeddings(rerank=2, top_k=3)
+    assert report["recall"] == 1.0 and report["compression"] > 3.5
+    assert [s["chunk"]["id"] for s in rag.retrieve_relevant_chunks(question)] == exact
+    assert [s["chunk"]["id"] for s in rag.query_batch([question])[0]["sources"]] == exact
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rag.save_index(os.path.join(tmp, "index"), dtype="float16")
+        rag.remove_document("intro")
+        assert rag.quantized_index.size == len(rag.chunks)
+        
+        loaded = LeakProofRAG(client=FakeOpenAI())
+        loaded.load_index(os.path.join(tmp, "index"))
+        assert loaded.quantized_index.size == len(rag.chunks) and loaded.quantized_index.rerank == 2
+        assert np.array_equal(loaded.quantized_index.codes, rag.quantized_index.codes)
+    print(f"✅ int8 codes use {report['compression']:.1f}x less memory at recall@3 {report['recall']:.2f}")
+
+def test_offline_embedding_dimensions():
+    """Test shortened embeddings, the header check and two-stage prefix search"""
+    print("\nTesting offline embedding dimensions...")
+    from fake_openai import FakeOpenAI, fake_embedding
+    from index_store import read_header
+    from leakproof_rag import LeakProofRAG
+    
+    rag = LeakProofRAG(client=FakeOpenAI())
+    rag.retrieval_mode = "vector"
+    rag.embedding_dimensions = 256
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    assert rag.embeddings.shape == (len(rag.chunks), 256)
+    prefix = np.asarray(fake_embedding(rag.chunks[0]["text"])[:256])
+    assert np.allclose(rag.embeddings[0], prefix / np.linalg.norm(prefix), atol=1e-6)
+    assert rag.embed_query("floor speed").shape == (256,)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        rag.save_index(path)
+        assert read_header(path)["embedding_dimensions"] == 256
+        
+        loaded = LeakProofRAG(client=FakeOpenAI())
+        loaded.load_index(path)
+        assert loaded.embedding_dimensions == 256
+        assert loaded.retrieve_relevant_chunks("How do I contact KEITH in Europe?")[0]["chunk"]["id"] == \
+            rag.retrieve_relevant_chunks("How do I contact KEITH in Europe?")[0]["chunk"]["id"]
+        
+        mismatched = LeakProofRAG(client=FakeOpenAI())
+        mismatched.embedding_dimensions = 512
         try:
-            os.remove("test_index.json")
-        except:
+            mismatched.load_index(path)
+            assert False, "Loading a 256-dim index with embedding_dimensions=512 should fail"
+        except ValueError as e:
+            assert "256" in str(e)
+    
+    # Two-stage: score the leading 64 dims, re-rank on the full vectors
+    full = LeakProofRAG(client=FakeOpenAI())
+    full.retrieval_mode = "vector"
+    full.load_document("leakproof_drive.pdf")
+    full.create_embeddings()
+    question = "What is the maximum working pressure?"
+    exact = [s["chunk"]["id"] for s in full.retrieve_relevant_chunks(question)]
+    report = full.quantize_embeddings(dims=64, rerank=4, top_k=3)
+    assert full.quantized_index.codes.shape == (len(full.chunks), 64)
+    assert report["compression"] > 20 and report["recall"] >= 0.9
+    assert [s["chunk"]["id"] for s in full.retrieve_relevant_chunks(question)] == exact
+    print(f"✅ 256-dim index round-trips; 64-dim first stage is {report['compression']:.0f}x smaller")
+
+def test_offline_metrics():
+    """Test per-stage timings, token usage and the metrics sinks"""
+    print("\nTesting offline query metrics...")
+    from async_rag import AsyncLeakProofRAG
+    from fake_openai import AsyncFakeOpenAI, FakeOpenAI
+    from metrics import InMemoryMetrics, MetricsSink, MultiSink, PrometheusMetrics
+    from rag_service import RAGService
+    
+    memory, prometheus = InMemoryMetrics(), PrometheusMetrics()
+    rag = AsyncLeakProofRAG(client=FakeOpenAI(), async_client=AsyncFakeOpenAI())
+    rag.metrics = MultiSink(memory, prometheus)
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    
+    result = rag.query("What materials can it handle?", show_sources=False)
+    assert set(result["timings"]) == {"embed", "retrieve", "prompt", "generate", "total"}
+    assert result["timings"]["total"] >= sum(v for k, v in result["timings"].items() if k != "total")
+    answer_tokens = len("This is a fake answer generated offline.".split())
+    assert result["usage"]["completion_tokens"] == answer_tokens and result["usage"]["prompt_tokens"] > 100
+    
+    # Streams ask for usage in the final chunk and record the first token
+    list(rag.query_stream("What is the maximum working pressure?"))
+    assert memory.percentiles("first_token") and memory.counters()["completion_tokens"] == 2 * answer_tokens
+    assert rag.query("Floor speed at 20 GPM?", show_sources=False)["usage"]["prompt_tokens"] == 0
+    
+    latency = memory.percentiles("total")
+    assert 0 < latency["p50"] <= latency["p95"]
+    assert memory.counters()["queries"] == 3 and memory.counters()["queries_structured"] == 1
+    text = prometheus.exposition()
+    assert 'rag_stage_seconds_count{stage="total"} 3' in text
+    assert 'rag_stage_seconds_bucket{stage="total",le="+Inf"} 3' in text
+    assert 'rag_queries_total{outcome="generated"} 2' in text
+    assert f'rag_tokens_total{{kind="completion"}} {2 * answer_tokens}' in text
+    assert 'rag_prompt_tokens_saved_total{counting="estimate"}' in text
+    
+    service = RAGService(lambda: rag)
+    assert _call_asgi(service, "POST", "/query", {"question": "How do I contact KEITH?"})[0] == 200
+    status, body = _call_asgi(service, "GET", "/metrics")
+    assert status == 200 and 'rag_stage_seconds_count{stage="total"} 4' in body.decode()
+    
+    # Scrapes succeed before the first query loads the engine, which then reports to the same sink
+    try:
+        MetricsSink()
+        raise AssertionError("expected MetricsSink to be abstract")
+    except TypeError:
+        pass
+    plain = AsyncLeakProofRAG(client=FakeOpenAI(), async_client=AsyncFakeOpenAI())
+    plain.load_document("leakproof_drive.pdf")
+    plain.create_embeddings()
+    service = RAGService(lambda: plain)
+    status, body = _call_asgi(service, "GET", "/metrics")
+    assert status == 200 and "# TYPE rag_queries_total counter" in body.decode() and service.rag is None
+    assert _call_asgi(service, "POST", "/query", {"question": "How do I contact KEITH?"})[0] == 200
+    status, body = _call_asgi(service, "GET", "/metrics")
+    assert plain.metrics is service.prometheus and 'rag_stage_seconds_count{stage="total"} 1' in body.decode()
+    print(f"✅ Stage timings recorded; p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms")
+
+def test_offline_benchmark_suite():
+    """Synthetic corpus benchmark runs end to end and its results compare"""
+    from benchmark import benchmark_suite, compare_results, parse_size, synthetic_chunks
+    from fake_openai import FakeAPIError, FakeOpenAI
+    
+    chunks = list(synthetic_chunks(50, seed=3))
+    assert chunks == list(synthetic_chunks(50, seed=3))
+    assert len({chunk["id"] for chunk in chunks}) == 50 and chunks[0]["metadata"]["type"] == "synthetic"
+    assert parse_size("10k") == 10_000 and parse_size("1m") == 1_000_000 and parse_size("500") == 500
+    
+    # Injected errors are reproducible for a seed
+    def failures(seed):
+        client = FakeOpenAI(dimensions=8, error_rate=0.3, seed=seed)
+        outcomes = []
+        for _ in range(40):
+            try:
+                client.embeddings.create(input="pump flow", model="text-embedding-3-small")
+                outcomes.append(None)
+            except FakeAPIError as e:
+                outcomes.append(e.status_code)
+        return outcomes
+    assert failures(1) == failures(1)
+    assert 0 < sum(status is not None for status in failures(1)) < 40
+    assert set(failures(1)) <= {None, 429, 503}
+    
+    result = benchmark_suite([300, 200], dimensions=32, queries=10, error_rate=0.05, seed=1)
+    assert [run["chunks"] for run in result["runs"]] == [200, 300]
+    run = result["runs"][-1]
+    assert run["build"]["seconds"] > 0 and run["save"]["bytes"] > 0 and run["load"]["seconds"] >= 0
+    assert 0 < run["retrieval_ms"]["p50"] <= run["retrieval_ms"]["p99"]
+    assert run["query"]["stages_ms"]["total"]["count"] + run["query"]["errors"] == 10
+    assert result["settings"]["error_rate"] == 0.05 and "python" in result["environment"]
+    json.dumps(result)
+    
+    changes = compare_results(result, result)
+    assert changes and all(row["change_pct"] in (0.0, None) for row in changes)
+    assert {"chunks": 300, "metric": "retrieval_ms.p50", "baseline": run["retrieval_ms"]["p50"],
+            "candidate": run["retrieval_ms"]["p50"], "change_pct": 0.0} in changes
+    print(f"✅ Benchmark suite: 300 chunks built in {run['build']['seconds']}s, "
+          f"retrieval p50 {run['retrieval_ms']['p50']} ms")
+
+def test_offline_golden_eval():
+    """Golden set runs offline from cached embeddings and flags regressions"""
+    import copy
+    from caching import EmbeddingCache
+    from fake_openai import FakeOpenAI
+    from golden_eval import (BACKENDS, CacheOnlyClient, evaluate, find_regressions, load_golden_chunks,
+                             load_golden_set, record_embeddings, score_retrieval)
+    from leakproof_rag import LeakProofRAG
+    
+    assert score_retrieval(["a", "b", "c"], ["b"]) == {"recall": 1.0, "reciprocal_rank": 0.5}
+    assert score_retrieval(["a", "b", "c"], ["c", "d"]) == {"recall": 0.5, "reciprocal_rank": 1 / 3}
+    assert score_retrieval(["a"], ["d"]) == {"recall": 0.0, "reciprocal_rank": 0.0}
+    
+    golden = load_golden_set()
+    assert len(golden["questions"]) >= 20
+    sources = {item["source"] for item in golden["questions"]}
+    assert {"leakproof_rag.py", "app.py", "app_gradio.py", "demo_conversation.json"} <= sources
+    
+    tmp_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        # The labels use the built-in chunk IDs, even once the real brochure PDF is present
+        _write_test_pdf(os.path.join(tmp_dir, "leakproof_drive.pdf"), [["Maximum Working Pressure: 3000 PSI"]])
+        os.chdir(tmp_dir)
+        rag = LeakProofRAG(client=FakeOpenAI())
+        load_golden_chunks(rag, golden)
+        os.chdir(cwd)
+        assert [chunk["id"] for chunk in rag.chunks] == [chunk["id"] for chunk in rag._create_chunks()]
+        
+        cache = EmbeddingCache(os.path.join(tmp_dir, "golden.sqlite3"))
+        # Nothing recorded yet: the offline client refuses to embed
+        try:
+            evaluate(CacheOnlyClient(), golden, cache, backends=["brute_force"])
+            raise AssertionError("evaluation should fail without cached embeddings")
+        except LookupError:
             pass
+        
+        record_embeddings(FakeOpenAI(), golden, cache)
+        result = evaluate(CacheOnlyClient(), golden, cache, top_k=3, repeat=2)
+        assert set(result["backends"]) == set(BACKENDS)
+        exact = result["backends"]["brute_force"]
+        assert 0.5 <= exact["recall@3"] <= 1.0 and 0 < exact["mrr"] <= 1.0
+        assert exact["p50_ms"] <= exact["p95_ms"]
+        # Exact re-ranking over 13 chunks finds the brute-force results
+        assert result["backends"]["quantized"]["recall@3"] == exact["recall@3"]
+        
+        assert find_regressions(result, result) == []
+        better = copy.deepcopy(result)
+        better["backends"]["hybrid"]["recall@3"] += 0.1
+        better["backends"]["ann"]["p95_ms"] = result["backends"]["ann"]["p95_ms"] / 10 - 1
+        problems = find_regressions(result, better)
+        assert len(problems) == 2 and problems[0].startswith("ann: p95") and problems[1].startswith("hybrid: recall@3")
+        cache.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"✅ Golden set: brute force recall@3 {exact['recall@3']:.2f}, MRR {exact['mrr']:.2f}")
+
+def test_offline_context_builder():
+    """Prompt context is packed by score under a token budget without near-duplicates"""
+    from context_builder import ContextBuilder, similarity
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import LeakProofRAG
+    from tokenizer import count_tokens, truncate_to_tokens
+    
+    long_text = " ".join(f"word{i}" for i in range(400))
+    assert count_tokens(truncate_to_tokens(long_text, 50)) <= 50
+    assert truncate_to_tokens("short text", 50) == "short text"
+    
+    def result(chunk_id, text, similarity_score):
+        return {"chunk": {"id": chunk_id, "text": text, "metadata": {}}, "similarity": similarity_score}
+    
+    base = "Maximum working pressure is 3000 PSI and maximum pump flow is 40 gallons per minute."
+    retrieved = [
+        result("a_low", "Contact KEITH Manufacturing for regional sales in Europe and Australia.", 0.2),
+        result("z_best", base, 0.9),
+        result("copy", base + " See the specifications.", 0.8),
+        result("long", long_text, 0.5),
+    ]
+    assert similarity(base, retrieved[2]["chunk"]["text"]) >= 0.8
+    
+    packed = ContextBuilder(max_prompt_tokens=10_000).build(retrieved, "What is the pressure?")
+    assert [item["chunk"]["id"] for item in packed["chunks"]] == ["z_best", "long", "a_low"]
+    assert packed["duplicates"] == ["copy"] and packed["tokens_saved"] > 0
+    # Packed by score, laid out in chunk ID order
+    context = packed["context"]
+    assert context.startswith("[Source: a_low]\n") and context.endswith("[Source: z_best]\n" + base)
+    assert context.index("[Source: long]") < context.index("[Source: z_best]")
+    
+    tight = ContextBuilder(max_prompt_tokens=150, min_truncated_tokens=20).build(retrieved, "pressure?")
+    assert tight["truncated"] == ["long"] and "a_low" in tight["dropped"]
+    assert tight["context_tokens"] <= 150 and count_tokens(tight["context"]) <= 150
+    assert tight["tokens_saved"] > packed["tokens_saved"]
+    
+    client = FakeOpenAI()
+    rag = LeakProofRAG(client=client)
+    rag.structured_answers = False
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    question = "What is the maximum working pressure?"
+    full = rag.query(question, top_k=5, show_sources=False)
+    full_prompt = client.chat.completions.calls[-1][1]["content"]
+    assert full["prompt_tokens_saved"] == 0 and full_prompt.count("[Source: ") == 5
+    
+    system_prompt = client.chat.completions.calls[-1][0]["content"]
+    rag.context_builder.max_prompt_tokens = count_tokens(system_prompt) + count_tokens(full_prompt) - 100
+    trimmed = rag.query(question + " (trimmed)", top_k=5, show_sources=False)
+    trimmed_prompt = client.chat.completions.calls[-1][1]["content"]
+    assert trimmed["prompt_tokens_saved"] > 0 and len(trimmed_prompt) < len(full_prompt)
+    # Counts made without tiktoken are flagged as estimates
+    from tokenizer import is_estimated
+    assert trimmed["prompt_tokens_estimated"] == is_estimated(rag.chat_model)
+    assert "[Source: " in trimmed_prompt
+    # Only the chunks the model received are cited; the rest are marked as left out
+    assert full["excluded_sources"] == [] and len(full["sources"]) == 5
+    assert len(trimmed["sources"]) == trimmed_prompt.count("[Source: ")
+    assert len(trimmed["sources"]) + len(trimmed["excluded_sources"]) == 5
+    assert all(item["excluded"] in ("duplicate", "over_budget") for item in trimmed["excluded_sources"])
+    sources = next(rag.query_stream(question + " (streamed)", top_k=5))
+    assert len(sources) == client.chat.completions.calls[-1][1]["content"].count("[Source: ")
+    print(f"✅ Context packed under budget; {trimmed['prompt_tokens_saved']} prompt tokens saved")
+
+def test_offline_prompt_prefix():
+    """The system message is a byte-stable prefix and cached prompt tokens are reported"""
+    from fake_openai import FakeOpenAI
+    from leakproof_rag import SYSTEM_PROMPT, LeakProofRAG
+    from metrics import InMemoryMetrics
+    
+    client = FakeOpenAI()
+    rag = LeakProofRAG(client=client)
+    rag.structured_answers = False
+    rag.metrics = InMemoryMetrics()
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    
+    prefix = rag._prompt_prefix()
+    assert prefix.startswith(SYSTEM_PROMPT) and "sections: " in prefix
+    assert rag._prompt_prefix() is prefix  # Built once per index version
+    
+    chunks = rag.retrieve_relevant_chunks("What is the maximum working pressure?", top_k=3)
+    forward = rag._build_messages("Pressure?", chunks)
+    backward = rag._build_messages("Pressure?", list(reversed(chunks)))
+    other = rag._build_messages("How do I contact KEITH?", chunks[:2])
+    assert forward == backward
+    assert forward[0]["content"] == other[0]["content"] == prefix
+    user = forward[1]["content"]
+    assert user.startswith("DOCUMENTATION:\n[Source: ") and user.endswith("USER QUESTION: Pressure?")
+    ids = sorted(item["chunk"]["id"] for item in chunks)
+    assert [user.index(f"[Source: {chunk_id}]") for chunk_id in ids] == sorted(
+        user.index(f"[Source: {chunk_id}]") for chunk_id in ids)
+    
+    # Real providers cache from 1024 tokens; the demo prompt is shorter
+    client.chat.completions.prompt_cache.min_tokens = 64
+    client.chat.completions.prompt_cache.increment = 16
+    first = rag.query("What is the maximum working pressure?", show_sources=False)
+    second = rag.query("How do I contact KEITH Manufacturing in Europe?", show_sources=False)
+    assert first["usage"]["cached_tokens"] == 0
+    prefix_words = len(prefix.split())
+    assert prefix_words - 16 < second["usage"]["cached_tokens"] <= second["usage"]["prompt_tokens"]
+    assert rag.metrics.counters()["cached_tokens"] == second["usage"]["cached_tokens"]
+    
+    for _ in rag.query_stream("What makes the cylinder design special?"):
+        pass
+    assert rag.metrics.counters()["cached_tokens"] > second["usage"]["cached_tokens"]
+    print(f"✅ Stable {prefix_words}-word prompt prefix; {second['usage']['cached_tokens']} cached tokens on reuse")
+
+def test_offline_conversation_memory():
+    """Conversation memory stays within its token budgets over a long session"""
+    import time
+    from advanced_example import AdvancedLeakProofRAG
+    from conversation_memory import ConversationMemory
+    from fake_openai import FakeOpenAI
+    from tokenizer import count_tokens
+    
+    summarized = []
+    def summarize(summary, turns):
+        time.sleep(0.001)
+        summarized.extend(turn["question"] for turn in turns if not turn.get("merged"))
+        return "\n".join([summary] * bool(summary) + [turn["question"] for turn in turns])
+    
+    memory = ConversationMemory(summarize, max_history_tokens=200, max_summary_tokens=60)
+    for i in range(300):
+        memory.add(f"Question {i} about the floor speed?", "The answer is long. " * 40, [f"chunk_{i}"])
+        assert memory.history_tokens <= 200 and len(memory._pending) <= memory.max_pending_turns
+    memory.wait()
+    assert memory.turns[-1]["question"] == "Question 299 about the floor speed?"
+    assert memory.turns[-1]["chunk_ids"] == ["chunk_299"]
+    assert count_tokens(memory.summary) <= 60 and "Question" in memory.summary
+    # Every evicted turn is summarized at most once, newest history not at all
+    assert len(summarized) == len(set(summarized)) and "Question 299 about the floor speed?" not in summarized
+    messages = memory.messages()
+    assert messages[0]["role"] == "system" and messages[-1]["role"] == "assistant"
+    memory.close()
+    
+    # A failing summarizer falls back to an extractive summary
+    def broken(summary, turns):
+        raise RuntimeError("API down")
+    fallback = ConversationMemory(broken, max_history_tokens=50, background=False)
+    for i in range(5):
+        fallback.add(f"Q{i}?", "Answer " * 20)
+    assert "Asked: Q0?" in fallback.summary
+    
+    # Turns being summarized stay in the prompt until their summary is stored
+    import threading
+    release = threading.Event()
+    def blocking(summary, turns):
+        release.wait(5)
+        return "summarized"
+    slow = ConversationMemory(blocking, max_history_tokens=50)
+    for i in range(4):
+        slow.add(f"Q{i}?", "Answer " * 20)
+    replayed = "\n".join(m["content"] for m in slow.messages())
+    assert all(f"Q{i}?" in replayed for i in range(4))
+    release.set()
+    slow.wait()
+    assert slow.messages()[0]["content"].endswith("summarized")
+    slow.close()
+    
+    client = FakeOpenAI()
+    rag = AdvancedLeakProofRAG(client=client)
+    rag.memory = ConversationMemory(rag._summarize_turns, max_history_tokens=120, max_summary_tokens=50)
+    rag.context_builder.max_prompt_tokens = 400
+    rag.load_document("leakproof_drive.pdf")
+    rag.create_embeddings()
+    prompt_sizes = []
+    for i in range(12):
+        calls = len(client.chat.completions.calls)
+        result = rag.query_with_history(f"What is the maximum working pressure? (follow-up {i})")
+        rag.memory.wait()
+        # Later calls are the background summaries
+        messages = client.chat.completions.calls[calls]
+        # History only: the system prefix and the documentation + question message vary by retrieval
+        prompt_sizes.append(sum(count_tokens(m["content"]) for m in messages[1:-1]))
+        # The history is charged to the prompt budget, not added on top of it
+        assert sum(count_tokens(m["content"]) for m in messages) <= 400
+    assert "timings" in result and (result["sources"] or result["excluded_sources"])
+    # A turn records only the chunks that fit in its prompt
+    assert len(rag.query_history[-1]["chunk_ids"]) == len(result["sources"])
+    assert rag.memory.summary and max(prompt_sizes) <= 120 + 50 + 20
+    history_messages = messages[1:-1]
+    assert history_messages[0]["content"].startswith("Summary of the earlier conversation")
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "conversation.json")
+        rag.export_conversation(path)
+        with open(path) as f:
+            exported = json.load(f)
+        assert exported["summary"] == rag.memory.summary and "chunk" not in exported["turns"][0]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    rag.memory.close()
+    print(f"✅ Conversation memory bounded: history at most {max(prompt_sizes)} prompt tokens over 12 turns")
+
+def run_offline_test(test_func):
+    """Run an assertion-based offline test and report whether it passed"""
+    try:
+        test_func()
+        return True
+    except Exception as e:
+        print(f"❌ {test_func.__name__} failed: {e!r}")
+        return False
+
+def print_summary(title, results):
+    """Print a pass/fail table; returns True if every test passed"""
+    print("\n" + "="*60)
+    print(title)
+    print("="*60)
+    
+    for test_name, passed in results:
+        status = "✅ PASS" if passed else "❌ FAIL"
+        print(f"{test_name:.<40} {status}")
+    
+    total = len(results)
+    passed = sum(1 for _, p in results if p)
+    
+    print("-"*60)
+    print(f"Results: {passed}/{total} tests passed")
+    print("="*60)
+    return passed == total
 
 def run_all_tests():
-    """Run all tests"""
+    """Run all tests; returns True if everything that ran passed
+    
+    The offline suite always runs and is summarized on its own, so runs
+    without OPENAI_API_KEY still report it. The API tests run after it when
+    a key is set.
+    """
     print("="*60)
     print("LeakProof RAG System - Test Suite")
     print("="*60)
     
+    offline_results = []
+    
+    # Offline tests (fake OpenAI client, no API key required)
+    offline_tests = [
+        ("Offline Retrieval", test_offline_retrieval),
+        ("Offline Index Save/Load", test_offline_index_roundtrip),
+        ("Offline Embedding Cache", test_offline_embedding_cache),
+        ("Offline Batched Ingestion", test_offline_batched_ingestion),
+        ("Offline PDF Ingestion", test_offline_pdf_ingestion),
+        ("Offline Incremental Re-indexing", test_offline_incremental_reindexing),
+        ("Offline ANN Index", test_offline_ann_index),
+        ("Offline Query Cache", test_offline_query_cache),
+        ("Offline Answer Cache", test_offline_answer_cache),
+        ("Offline Async Queries", test_offline_async_queries),
+        ("Offline Streaming", test_offline_streaming),
+        ("Offline Batch Queries", test_offline_query_batch),
+        ("Offline Shared Engine", test_offline_shared_engine),
+        ("Offline Query Service", test_offline_query_service),
+        ("Offline Hybrid Retrieval", test_offline_hybrid_retrieval),
+        ("Offline Metadata Filters", test_offline_metadata_filters),
+        ("Offline Performance Table", test_offline_performance_table),
+        ("Offline Quantization", test_offline_quantization),
+        ("Offline Embedding Dimensions", test_offline_embedding_dimensions),
+        ("Offline Metrics", test_offline_metrics),
+        ("Offline Benchmark Suite", test_offline_benchmark_suite),
+        ("Offline Golden Set", test_offline_golden_eval),
+        ("Offline Context Builder", test_offline_context_builder),
+        ("Offline Prompt Prefix", test_offline_prompt_prefix),
+        ("Offline Conversation Memory", test_offline_conversation_memory),
+    ]
+    for test_name, test_func in offline_tests:
+        offline_results.append((test_name, run_offline_test(test_func)))
+    
+    if not print_summary("OFFLINE TEST SUMMARY", offline_results):
+        print("\n⚠️  Some offline tests failed. Please review the errors above.")
+        return False
+    
     results = []
     
     # Test 1: Imports
@@ -138,12 +1472,10 @@ def run_all_tests():
     # Test 2: API Key
     results.append(("API Key", test_api_key()))
     
-    # If basic tests fail, stop here
+    # Without them the API tests cannot run; the offline result stands
     if not all([r[1] for r in results]):
-        print("\n" + "="*60)
-        print("❌ Basic tests failed. Please fix the issues above.")
-        print("="*60)
-        return
+        print("\n⏭️  Skipping the API tests. Offline tests passed.")
+        return True
     
     # Test 3: Initialization
     rag = test_rag_initialization()
@@ -153,7 +1485,7 @@ def run_all_tests():
         print("\n" + "="*60)
         print("❌ Cannot continue without successful initialization")
         print("="*60)
-        return
+        return False
     
     # Test 4: Document Loading
     results.append(("Document Loading", test_document_loading(rag)))
@@ -168,28 +1500,14 @@ def run_all_tests():
     results.append(("Save/Load", test_save_load_index(rag)))
     
     # Summary
-    print("\n" + "="*60)
-    print("TEST SUMMARY")
-    print("="*60)
-    
-    for test_name, passed in results:
-        status = "✅ PASS" if passed else "❌ FAIL"
-        print(f"{test_name:.<40} {status}")
-    
-    total = len(results)
-    passed = sum(1 for _, p in results if p)
-    
-    print("-"*60)
-    print(f"Results: {passed}/{total} tests passed")
-    print("="*60)
-    
-    if passed == total:
+    if print_summary("API TEST SUMMARY", results):
         print("\n🎉 All tests passed! Your RAG system is ready to use.")
         print("\nNext steps:")
         print("  - Run: python simple_example.py")
         print("  - Or: python leakproof_rag.py")
-    else:
-        print("\n⚠️  Some tests failed. Please review the errors above.")
+        return True
+    print("\n⚠️  Some tests failed. Please review the errors above.")
+    return False
 
 if __name__ == "__main__":
-    run_all_tests()
+    sys.exit(0 if run_all_tests() else 1)
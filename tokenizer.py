@@ -0,0 +1,73 @@
+"""
+Token Counting for LeakProof RAG
+Uses tiktoken (in requirements.txt). Without it, or without its BPE files,
+counts fall back to a character-based estimate: a warning is printed once
+and is_estimated() reports it, so budgets and savings can be flagged.
+"""
+
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency
+    tiktoken = None
+
+# OpenAI's rule of thumb for English text
+CHARS_PER_TOKEN = 4
+
+_warned = False
+
+
+def _warn_estimate(reason: str):
+    global _warned
+    if not _warned:
+        _warned = True
+        print(f"⚠️ {reason}; token counts are estimated at {CHARS_PER_TOKEN} characters per token")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Return the tiktoken encoding for a model, or None if unavailable"""
+    if tiktoken is None:
+        _warn_estimate("tiktoken is not installed")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The BPE files could not be loaded (e.g. no network on first use)
+        _warn_estimate("tiktoken could not load its encoding")
+        return None
+
+
+def is_estimated(model: str = "gpt-4o-mini") -> bool:
+    """True when counts for a model come from the character estimate, not tiktoken"""
+    return get_encoding(model) is None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Count the tokens in a text for the given model"""
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        return max(1, -(-len(text) // CHARS_PER_TOKEN))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=16384)
+def count_tokens_cached(text: str, model: str = "gpt-4o-mini") -> int:
+    """count_tokens memoized, for texts counted on every query (system prompt, chunks)"""
+    return count_tokens(text, model)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """The longest prefix of a text that fits in max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
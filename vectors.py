@@ -0,0 +1,47 @@
+"""
+Vector Helpers for LeakProof RAG
+Normalization and top-k selection shared by the index and search modules
+"""
+
+import numpy as np
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Return vectors as a contiguous float32 matrix with unit-length rows"""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    if matrix.size == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Return the indices of the top_k highest scores, best first"""
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def append_rows(array: np.ndarray, buffer, rows) -> tuple:
+    """Append rows to array without copying it on every call
+
+    array must be a prefix view of buffer (or buffer None). Spare capacity
+    in buffer is filled first; when it runs out, a buffer twice the size is
+    allocated, so appends cost O(len(rows)) amortized. Returns the new
+    (array, buffer); the old array view stays valid and unchanged.
+    """
+    rows = np.asarray(rows, dtype=array.dtype)
+    n, k = len(array), len(rows)
+    if buffer is None or len(buffer) < n + k or buffer.shape[1:] != rows.shape[1:]:
+        buffer = np.empty((max(n + k, 2 * n, 16),) + rows.shape[1:], dtype=array.dtype)
+        if n:
+            buffer[:n] = array
+    buffer[n:n + k] = rows
+    return buffer[:n + k], buffer